@@ -0,0 +1,97 @@
+"""
+Cold import benchmark of the bytecode backend.
+
+Generated modules are written by the source backend and by the bytecode
+backend, then imported by a fresh interpreter. Source modules are
+compiled by every import (the interpreter runs with -B, as from a
+read-only deployment), bytecode ones are loaded from __pycache__.
+
+    python benchmarks/bytecode.py --modules 200 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, root_path)
+
+from core.transformer import transform
+from core.generator import bytecode, source
+
+module = """\
+nodict class Point{n}:
+    x: float
+    y: float
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    inline def dot(self, other):
+        return self.x * other.x + self.y * other.y
+
+def run{n}(points):
+    total = 0.0
+    for p in points:
+        if p.x > p.y:
+            total += p.dot(p)
+        else:
+            total -= p.dot(p)
+    return total
+""" + "".join(f"\ndef helper_{{n}}_{i}(a, b):\n    return [a * b + {i} for _ in range(a)]\n" for i in range(20))
+
+importer = """\
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+for i in range(int(sys.argv[2])):
+    __import__(f"unit{i}")
+print(time.perf_counter() - start)
+"""
+
+
+def generate(directory: str, count: int, backend: str) -> None:
+    for n in range(count):
+        unit = transform(module.format(n=n), f"unit{n}.ppy")
+        filename = os.path.join(directory, f"unit{n}.py")
+        if backend == "bytecode":
+            bytecode.write(unit, filename)
+        else:
+            source.write(unit, filename)
+
+
+def cold_import(directory: str, count: int) -> float:
+    """ seconds importing all modules by a new interpreter which doesn't write bytecode """
+    result = subprocess.run([sys.executable, "-B", "-c", importer, directory, str(count)],
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="bytecode backend cold import benchmark")
+    parser.add_argument('--modules', help="generated modules", default=200, type=int)
+    parser.add_argument('--repeat', help="measured imports, the median is taken", default=5, type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        times = {}
+        for backend in ("source", "bytecode"):
+            directory = os.path.join(tmp, backend)
+            os.mkdir(directory)
+            generate(directory, args.modules, backend)
+            times[backend] = statistics.median(
+                cold_import(directory, args.modules) for _ in range(args.repeat))
+
+    print(f"{'backend':<12}{'import ms':>12}")
+    for backend, seconds in times.items():
+        print(f"{backend:<12}{seconds * 1e3:>12.1f}")
+    print(f"speedup {times['source'] / times['bytecode']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,96 @@
+"""
+Microbenchmarks of the const pass.
+
+Every case is a tight loop reading const names or build variables. It
+is compiled by the transformer twice, with names kept ('--disable
+const', build variables are then defined as globals) and replaced by
+literals, and the best time of a loop iteration is compared.
+
+    python benchmarks/const.py --iterations 200000 --repeat 5
+    python benchmarks/const.py --only globals
+"""
+import argparse
+import os
+import sys
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, root_path)
+
+from core.build_vars import BuildVarsTable
+from core.transformer import transform
+from core.generator.source import emit
+from inline import Config, best
+
+cases = {
+    # module consts read as globals in a loop
+    "globals": """\
+const SCALE = 3
+const OFFSET = SCALE * 7
+
+def run(n):
+    total = 0
+    for i in range(n):
+        total += i * SCALE + OFFSET
+    return total
+""",
+    # const argument of an inline function, folded in the caller
+    "inlined": """\
+const FACTOR = 4
+
+inline def scaled(x, k):
+    return k * 2 + x
+
+def run(n):
+    total = 0
+    for i in range(n):
+        total += scaled(i, FACTOR)
+    return total
+""",
+    # branch on a build variable, dead one removed
+    "branch": """\
+def run(n):
+    total = 0
+    for i in range(n):
+        if __VERSION__ == "0.1":
+            total -= i
+        else:
+            total += i
+    return total
+""",
+}
+
+
+def compile_case(source: str, disable: list[str]):
+    variables = BuildVarsTable()
+    namespace = {"__VERSION__": variables.value("__VERSION__")}     # names of build variables kept
+    exec(emit(transform(source, "<benchmark>", Config(disable), variables)), namespace)
+    return namespace["run"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="const pass microbenchmarks")
+    parser.add_argument('--only', help="comma separated cases", type=str)
+    parser.add_argument('--iterations', help="loop iterations of one run", default=200_000, type=int)
+    parser.add_argument('--repeat', help="timed runs, the best one is taken", default=5, type=int)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(cases)
+    unknown = [n for n in names if n not in cases]
+    if unknown:
+        parser.error(f"unknown cases: {unknown}")
+
+    print(f"{'case':<12}{'names ns':>10}{'const ns':>12}{'speedup':>10}")
+    for name in names:
+        kept = compile_case(cases[name], ["const"])
+        folded = compile_case(cases[name], [])
+        if kept(1000) != folded(1000):
+            print(f"{name}: folded code computes another result", file=sys.stderr)
+            return 1
+        kept_time, folded_time = best([kept, folded], args.iterations, args.repeat)
+        print(f"{name:<12}{kept_time:>10.1f}{folded_time:>12.1f}{kept_time / folded_time:>9.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,123 @@
+"""
+Synthetic Python+ workloads for preprocessor benchmarks.
+
+Every generator writes its files into given directory and returns
+a Workload. Output is deterministic for the same parameters, so
+results of different runs are comparable.
+"""
+import os
+import random
+
+
+class Workload:
+
+    def __init__(self, name: str, directory: str, main: str, defines: list[str] | None = None):
+        self.name = name
+        self.directory = directory
+        self.main = main                    # translation unit, relative to directory
+        self.defines = defines or []        # macros given to preprocessor
+
+    def __repr__(self):
+        return f"Workload(name={self.name!r}, main={self.main!r})"
+
+
+def _code_line(rng: random.Random, i: int) -> str:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return f"value_{i} = {rng.randrange(1000)} + {rng.randrange(1000)}\n"
+    if kind == 1:
+        return f"def function_{i}(a, b):\n    return a * b + {i}\n"
+    if kind == 2:
+        return f"    result.append(item_{i % 17})  # comment {i}\n"
+    return f"print(\"line {i} of generated code\")\n"
+
+
+def _write(directory: str, filename: str, lines: list[str]) -> None:
+    with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+def plain_code(directory: str, lines: int = 200_000, seed: int = 1) -> Workload:
+    """ large file without directives """
+    rng = random.Random(seed)
+    _write(directory, "plain.ppy", [_code_line(rng, i) for i in range(lines)])
+    return Workload("plain_code", directory, "plain.ppy")
+
+
+def deep_includes(directory: str, depth: int = 60, lines: int = 200, seed: int = 2) -> Workload:
+    """ chain of headers, every one includes the next """
+    rng = random.Random(seed)
+    for level in range(depth):
+        body = [_code_line(rng, i) for i in range(lines)]
+        if level + 1 < depth:
+            body.insert(lines // 2, f"@include \"deep_{level + 1}.ppy\"\n")
+        _write(directory, f"deep_{level}.ppy", body)
+    _write(directory, "deep_main.ppy", ["@include \"deep_0.ppy\"\n", "main = True\n"])
+    return Workload("deep_includes", directory, "deep_main.ppy")
+
+
+def wide_includes(directory: str, headers: int = 300, lines: int = 50, seed: int = 3) -> Workload:
+    """ many headers including one common header """
+    rng = random.Random(seed)
+    _write(directory, "wide_common.ppy", [_code_line(rng, i) for i in range(lines * 4)])
+    main = []
+    for header in range(headers):
+        body = ["@include \"wide_common.ppy\"\n"] + [_code_line(rng, i) for i in range(lines)]
+        _write(directory, f"wide_{header}.ppy", body)
+        main.append(f"@include \"wide_{header}.ppy\"\n")
+        main.append(_code_line(rng, header))
+    _write(directory, "wide_main.ppy", main)
+    return Workload("wide_includes", directory, "wide_main.ppy")
+
+
+def many_repeats(directory: str, blocks: int = 5_000, body: int = 4, seed: int = 4) -> Workload:
+    """ plain code interleaved with small @repeat blocks """
+    rng = random.Random(seed)
+    lines = []
+    for block in range(blocks):
+        lines.extend(_code_line(rng, i) for i in range(10))
+        lines.append("@repeat 5\n")
+        lines.extend(f"    unrolled_{block}_{i}()\n" for i in range(body))
+        lines.append("@end\n")
+    _write(directory, "repeats.ppy", lines)
+    return Workload("many_repeats", directory, "repeats.ppy")
+
+
+def heavy_macros(directory: str, lines: int = 100_000, macros: int = 200, seed: int = 5) -> Workload:
+    """ code using object-like macros on most lines """
+    rng = random.Random(seed)
+    names = [f"MACRO_{i}" for i in range(macros)]
+    body = []
+    for i in range(lines):
+        if rng.random() < 0.7:
+            body.append(f"x_{i} = {rng.choice(names)} + {rng.choice(names)}\n")
+        else:
+            body.append(_code_line(rng, i))
+    _write(directory, "macros.ppy", body)
+    defines = [f"{name}={i}" for i, name in enumerate(names)]
+    return Workload("heavy_macros", directory, "macros.ppy", defines)
+
+
+generators = {
+    "plain_code": plain_code,
+    "deep_includes": deep_includes,
+    "wide_includes": wide_includes,
+    "many_repeats": many_repeats,
+    "heavy_macros": heavy_macros,
+}
+
+
+def generate(directory: str, names: list[str] | None = None, scale: float = 1.0) -> list[Workload]:
+    """
+    :param names: generators to run, all if None
+    :param scale: multiplier of workload sizes
+    """
+    workloads = []
+    for name in names or generators:
+        subdirectory = os.path.join(directory, name)
+        os.makedirs(subdirectory, exist_ok=True)
+        generator = generators[name]
+        defaults = generator.__defaults__[:-1]     # sizes, without seed
+        sizes = [max(1, int(size * scale)) for size in defaults]
+        workloads.append(generator(subdirectory, *sizes))
+    return workloads
@@ -0,0 +1,135 @@
+"""
+Microbenchmarks of the inline pass.
+
+Every case is a tight loop calling an inline function or method. It is
+compiled by the transformer twice, with calls kept ('--disable inline')
+and inlined, and the best time of a loop iteration is compared.
+
+    python benchmarks/inline.py --iterations 200000 --repeat 5
+    python benchmarks/inline.py --only function,method
+"""
+import argparse
+import os
+import sys
+import time
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, root_path)
+
+from core.transformer import transform
+from core.generator.source import emit
+
+vector = """\
+nodict class Vector:
+    x: float
+    y: float
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    inline def dot(self, other):
+        return self.x * other.x + self.y * other.y
+
+    def sum_dots(self, n):
+        total = 0.0
+        for i in range(n):
+            total += self.dot(self)
+        return total
+"""
+
+cases = {
+    # module function with one return, substituted as expression
+    "function": """\
+inline def square(x):
+    return x * x
+
+def run(n):
+    total = 0
+    for i in range(n):
+        total += square(i)
+    return total
+""",
+    # method by receiver of known class
+    "method": vector + """
+def run(n):
+    v = Vector(1.0, 2.0)
+    total = 0.0
+    for i in range(n):
+        total += v.dot(v)
+    return total
+""",
+    # method by self inside another method
+    "self": vector + """
+def run(n):
+    return Vector(1.0, 2.0).sum_dots(n)
+""",
+    # body of several statements, put before the statement
+    "statements": """\
+inline def clamp(v, lo, hi):
+    if v < lo:
+        v = lo
+    elif v > hi:
+        v = hi
+    return v
+
+def run(n):
+    total = 0
+    for i in range(n):
+        total += clamp(i, 10, 1000)
+    return total
+""",
+}
+
+
+class Config:
+    """ compiler arguments read by passes """
+
+    def __init__(self, disable: list[str]):
+        self.disable = disable
+
+
+def compile_case(source: str, disable: list[str]):
+    namespace = {}
+    exec(emit(transform(source, "<benchmark>", Config(disable))), namespace)
+    return namespace["run"]
+
+
+def best(runs: list, iterations: int, repeat: int) -> list[float]:
+    """ best nanoseconds per loop iteration of every run, runs are alternated against drift of machine """
+    times = [[] for _ in runs]
+    for _ in range(repeat):
+        for run, measured in zip(runs, times):
+            start = time.perf_counter()
+            run(iterations)
+            measured.append(time.perf_counter() - start)
+    return [min(measured) / iterations * 1e9 for measured in times]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="inline pass microbenchmarks")
+    parser.add_argument('--only', help="comma separated cases", type=str)
+    parser.add_argument('--iterations', help="loop iterations of one run", default=200_000, type=int)
+    parser.add_argument('--repeat', help="timed runs, the best one is taken", default=5, type=int)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(cases)
+    unknown = [n for n in names if n not in cases]
+    if unknown:
+        parser.error(f"unknown cases: {unknown}")
+
+    print(f"{'case':<12}{'call ns':>10}{'inline ns':>12}{'speedup':>10}")
+    for name in names:
+        called = compile_case(cases[name], ["inline"])
+        inlined = compile_case(cases[name], [])
+        if called(1000) != inlined(1000):
+            print(f"{name}: inlined code computes another result", file=sys.stderr)
+            return 1
+        call_time, inline_time = best([called, inlined], args.iterations, args.repeat)
+        print(f"{name:<12}{call_time:>10.1f}{inline_time:>12.1f}{call_time / inline_time:>9.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
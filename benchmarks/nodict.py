@@ -0,0 +1,91 @@
+"""
+Benchmark of nodict classes.
+
+Compiles one value class with the transformer as 'nodict class' and as
+a plain class, and compares memory of an instance (peak of tracemalloc
+while many instances are alive, divided by their number) and time of
+creation, attribute reads and attribute writes.
+
+    python benchmarks/nodict.py --instances 100000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, root_path)
+
+from core.transformer import transform
+from core.generator.source import emit
+
+source = """\
+{qualifier}class Vector:
+    x: float
+    y: float
+    z: float
+
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+"""
+
+
+def compile_class(qualifier: str) -> type:
+    namespace = {}
+    exec(emit(transform(source.format(qualifier=qualifier))), namespace)
+    return namespace["Vector"]
+
+
+def instance_size(cls: type, count: int) -> float:
+    """ bytes allocated per instance, float fields are shared """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [cls(1.0, 2.0, 3.0) for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    size -= sys.getsizeof(instances)
+    return size / count
+
+
+def timings(cls: type, repeat: int, number: int) -> dict[str, float]:
+    """ best nanoseconds per operation """
+    v = cls(1.0, 2.0, 3.0)
+    statements = {
+        "create": ("cls(1.0, 2.0, 3.0)", {"cls": cls}),
+        "read": ("v.x; v.y; v.z", {"v": v}),
+        "write": ("v.x = 1.0; v.y = 2.0; v.z = 3.0", {"v": v}),
+    }
+    results = {}
+    for name, (statement, namespace) in statements.items():
+        operations = 3 if name != "create" else 1
+        best = min(timeit.repeat(statement, globals=namespace, repeat=repeat, number=number))
+        results[name] = best / number / operations * 1e9
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="nodict class benchmark")
+    parser.add_argument('--instances', help="instances alive while memory is measured", default=100_000, type=int)
+    parser.add_argument('--repeat', help="timed runs, the best one is taken", default=5, type=int)
+    parser.add_argument('--number', help="operations per timed run", default=200_000, type=int)
+    args = parser.parse_args()
+
+    results = {}
+    for name, qualifier in (("dict", ""), ("nodict", "nodict ")):
+        cls = compile_class(qualifier)
+        results[name] = {"bytes": instance_size(cls, args.instances), **timings(cls, args.repeat, args.number)}
+
+    columns = ["bytes", "create", "read", "write"]
+    print(f"{'class':<8}" + "".join(f"{c + (' ns' if c != 'bytes' else ''):>12}" for c in columns))
+    for name, row in results.items():
+        print(f"{name:<8}" + "".join(f"{row[c]:>12.1f}" for c in columns))
+    print(f"{'ratio':<8}" + "".join(f"{results['nodict'][c] / results['dict'][c]:>12.2f}" for c in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,168 @@
+"""
+Benchmarks of the Python+ preprocessor pipeline.
+
+Generates synthetic workloads and measures throughput (output lines
+per second), peak memory and time of every phase of processor:
+reading, directive loop and writing. Results can be saved as JSON
+baseline and compared with a previous baseline, which works offline.
+
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, os.path.join(root_path, 'core'))
+sys.path.insert(0, root_path)
+
+import processor
+from context import Context
+
+from generators import generate, generators
+
+
+def unit_args(workload, output: str) -> argparse.Namespace:
+    return argparse.Namespace(
+        input=workload.main, inputs=[workload.main], output=output,
+        E=True, verbose=False, stream=False, cache_dir=None,
+        define=workload.defines
+    )
+
+
+def run_phases(workload, output: str) -> dict[str, float]:
+    """ runs processor phases one by one, returns their times """
+    args = unit_args(workload, output)
+    timer = time.perf_counter
+
+    start = timer()
+    context = Context(args, args.define, args.input)
+    source = processor.read_source(args.input)
+    read = timer()
+    processor.run_directives(source, context)
+    directives = timer()
+    processor.write_output(source, processor.preprocessed_filename(args))
+    write = timer()
+
+    if context.code:
+        raise RuntimeError(f"{workload.name}: {context.diagnostics}")
+    return {
+        "read": read - start,
+        "directives": directives - read,
+        "write": write - directives,
+        "total": write - start,
+        "lines": len(source)
+    }
+
+
+def measure(workload, repeat: int) -> dict:
+    cwd = os.getcwd()
+    os.chdir(workload.directory)    # includes are resolved from working directory
+    try:
+        output = os.path.join(workload.directory, "bench_out")
+        runs = [run_phases(workload, output) for _ in range(repeat)]
+
+        tracemalloc.start()
+        run_phases(workload, output)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+
+    best = min(runs, key=lambda r: r["total"])
+    return {
+        "lines": best["lines"],
+        "lines_per_sec": best["lines"] / best["total"],
+        "peak_kib": peak // 1024,
+        "phases": {phase: best[phase] for phase in ("read", "directives", "write")},
+        "total": best["total"],
+        "total_median": statistics.median(r["total"] for r in runs)
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ returns descriptions of regressions bigger than tolerance """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        speed = result["lines_per_sec"] / base["lines_per_sec"]
+        if speed < 1 - tolerance:
+            regressions.append(f"{name}: throughput {speed:.0%} of baseline")
+        memory = result["peak_kib"] / max(base["peak_kib"], 1)
+        if memory > 1 + tolerance:
+            regressions.append(f"{name}: peak memory {memory:.0%} of baseline")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict | None) -> None:
+    print(f"{'workload':<16}{'lines':>10}{'lines/s':>12}{'peak KiB':>10}"
+          f"{'read':>9}{'loop':>9}{'write':>9}{'vs base':>9}")
+    for name, r in results.items():
+        phases = r["phases"]
+        versus = ""
+        if baseline and name in baseline.get("results", {}):
+            versus = f"{r['lines_per_sec'] / baseline['results'][name]['lines_per_sec']:.0%}"
+        print(f"{name:<16}{r['lines']:>10}{r['lines_per_sec']:>12.0f}{r['peak_kib']:>10}"
+              f"{phases['read']:>9.3f}{phases['directives']:>9.3f}{phases['write']:>9.3f}{versus:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Python+ preprocessor benchmarks")
+    parser.add_argument('--only', help="comma separated workloads", type=str)
+    parser.add_argument('--scale', help="multiplier of workload sizes", default=1.0, type=float)
+    parser.add_argument('--repeat', help="timed runs per workload", default=3, type=int)
+    parser.add_argument('--workdir', help="directory for generated workloads", type=str)
+    parser.add_argument('--save', help="write results as JSON baseline", type=str)
+    parser.add_argument('--compare', help="compare with JSON baseline", type=str)
+    parser.add_argument('--tolerance', help="allowed relative regression", default=0.15, type=float)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(generators)
+    unknown = [n for n in names if n not in generators]
+    if unknown:
+        parser.error(f"unknown workloads: {unknown}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workloads = generate(args.workdir or tmp, names, args.scale)
+        results = {w.name: measure(w, args.repeat) for w in workloads}
+
+    print_table(results, baseline)
+
+    if args.save:
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "scale": args.scale
+            },
+            "results": results
+        }
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,99 @@
+"""
+Startup budget of the Python+ compiler.
+
+Runs the compiler on a small source without directives under
+'python -X importtime' and sums import time of top-level modules.
+Fails if the median is over budget, or if a module which should be
+imported lazily (plugins, worker pool, caches, build vars helpers)
+was imported.
+
+    python benchmarks/startup.py --budget 60
+"""
+import argparse
+import compileall
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules imported only when a feature is used
+lazy_modules = [
+    "concurrent.futures",   # -j
+    "asyncio",              # --include-workers
+    "disk_cache",           # --cache-dir
+    "profiler",             # --profile
+    "include",              # @include
+    "ply",                  # quoted directive arguments
+    "conditional",          # @if, @define
+    "ast",                  # directive expressions
+    "core.plugins.jump",    # @jump
+    "hashlib",              # content digests
+    "json",
+    "platform",             # __PLATFORM__
+    "uuid",                 # __UUID__
+]
+
+_entry = re.compile(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> tuple[int, set[str]]:
+    """ :return: cumulative microseconds of top-level imports, all imported modules """
+    total = 0
+    modules = set()
+    for line in stderr.splitlines():
+        match = _entry.match(line)
+        if match is None:
+            continue
+        modules.add(match.group(4))
+        if len(match.group(3)) == 1:    # top-level import, nested ones are in its cumulative time
+            total += int(match.group(2))
+    return total, modules
+
+
+def measure(source: str, output: str) -> tuple[int, set[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(root_path, "core", "main.py"),
+         "-i", source, "-E", "-o", output],
+        env=dict(os.environ, PYTHONPATH=root_path), capture_output=True, text=True
+    )
+    if result.returncode:
+        raise RuntimeError(f"compiler failed: {result.stderr[-500:]}")
+    return parse_importtime(result.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Python+ compiler startup budget")
+    parser.add_argument('--budget', help="allowed median import time, ms", default=60.0, type=float)
+    parser.add_argument('--repeat', help="measured runs", default=7, type=int)
+    args = parser.parse_args()
+
+    # bytecode may not be written by runs themselves (PYTHONDONTWRITEBYTECODE)
+    compileall.compile_dir(os.path.join(root_path, "core"), quiet=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "startup.ppy")
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write("x = 1\n")
+        runs = [measure(source, os.path.join(tmp, "out")) for _ in range(args.repeat)]
+
+    median = statistics.median(total for total, _ in runs) / 1000
+    imported = set().union(*(modules for _, modules in runs))
+    eager = [m for m in lazy_modules if m in imported]
+
+    print(f"import time: median {median:.1f} ms, budget {args.budget:.1f} ms")
+    failed = False
+    if median > args.budget:
+        print(f"OVER BUDGET by {median - args.budget:.1f} ms", file=sys.stderr)
+        failed = True
+    for module in eager:
+        print(f"EAGER IMPORT {module}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
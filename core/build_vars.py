@@ -1,37 +1,102 @@
 import time
-import platform
 import sys
-import uuid
 import os
 import warnings
 
 from errors import RedefinitionWarning
 
 
+class LazyVars(dict):
+    """ dict of build variables, predefined ones are computed on first lookup """
+
+    def __init__(self, providers: dict):
+        super().__init__()
+        self.providers = providers
+
+    def __missing__(self, identifier: str):
+        provider = self.providers.get(identifier)
+        if provider is None:
+            raise KeyError(identifier)
+        value = self[identifier] = provider()
+        return value
+
+    def get(self, identifier: str, default=None):
+        if identifier in self:
+            return self[identifier]
+        return default
+
+    def __contains__(self, identifier) -> bool:
+        return dict.__contains__(self, identifier) or identifier in self.providers
+
+
+def _platform() -> str:
+    import platform
+    return platform.system()
+
+
+def _uuid() -> str:
+    import uuid
+    return str(uuid.uuid4())
+
+
 class BuildVarsTable:
 
     def __init__(self):
-        self.vars = dict()
+        started = time.time()   # all time variables describe the same moment
+        self.vars = LazyVars({
+            "__DATE__": lambda: time.strftime("%Y-%m-%d", time.localtime(started)),
+            "__TIME__": lambda: time.strftime("%H:%M:%S", time.localtime(started)),
+            "__DATETIME__": lambda: f"{self.vars['__DATE__']} {self.vars['__TIME__']}",
+            "__EPOCH_TIME__": lambda: int(started),
+            "__PLATFORM__": _platform,
+            "__PYTHON_VERSION__": lambda: sys.version.split()[0],
+            "__PWD__": os.getcwd,
+            "__UUID__": _uuid,
+        })
 
         self.vars["__FILE__"] = ""
-        self.vars["__DATE__"] = time.strftime("%Y-%m-%d")
-        self.vars["__TIME__"] = time.strftime("%H:%M:%S")
-        self.vars["__DATETIME__"] = f"{self.vars['__DATE__']} {self.vars['__TIME__']}"
-        self.vars["__EPOCH_TIME__"] = int(time.time())
         self.vars["__VERSION__"] = "1.0.0"
-        self.vars["__PLATFORM__"] = platform.system()
-        self.vars["__PYTHON_VERSION__"] = sys.version.split()[0]
         self.vars["__COUNTER__"] = 0
-        self.vars["__PWD__"] = os.getcwd()
-        self.vars["__UUID__"] = str(uuid.uuid4())
         self.vars["__MAGIC_CODE__"] = 0xABCDEF
 
+        # identifiers looked up before the unit assigned them, their values come from outside and are
+        # part of cache keys; values of assigned ones follow from the unit itself
+        self.accessed = set()
+        self.assigned = set()
+        # identifier -> number of assignments, results of expressions are reused while it stays
+        self.versions: dict[str, int] = {}
+
+    def get(self, identifier: str, default=None):
+        if identifier not in self.assigned:
+            self.accessed.add(identifier)
+        return self.vars.get(identifier, default)
+
+    def value(self, identifier: str):
+        """ value of variable, without qualifiers of user defined ones """
+        var = self.get(identifier)
+        if isinstance(var, dict) and "value" in var:
+            return var["value"]
+        return var
+
+    def version(self, identifier: str) -> int:
+        return self.versions.get(identifier, 0)
+
     def add(self, var, identifier: str, qualifiers: list[str]) -> None:
         if identifier in self.vars:
-            warnings.warn("", RedefinitionWarning(f"variable '{identifier}' already defined"))
+            warnings.warn(f"variable '{identifier}' already defined", RedefinitionWarning)
 
         table_line = {
             "value": var,
             "qualifiers": qualifiers
         }
-        self.vars[identifier] = table_line
\ No newline at end of file
+        self.vars[identifier] = table_line
+        self.assigned.add(identifier)
+        self.versions[identifier] = self.version(identifier) + 1
+
+    def set(self, identifier: str, var) -> None:
+        """ assigns variable, qualifiers of existing one are kept """
+        current = self.vars.get(identifier)
+        qualifiers = current["qualifiers"] if isinstance(current, dict) and "qualifiers" in current else []
+        self.vars[identifier] = {"value": var, "qualifiers": qualifiers}
+        self.assigned.add(identifier)
+        self.versions[identifier] = self.version(identifier) + 1
\ No newline at end of file
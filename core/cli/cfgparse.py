@@ -5,18 +5,62 @@ from argparse import ArgumentParser
 def init_parser(parser: ArgumentParser) -> None:
     parser.add_argument(
         '-i', '--input',
-        help="path to source code Python+ file",
+        help="paths to source code Python+ files, directories or glob patterns",
+        dest='inputs',
+        nargs='+',
         required=True,
         type=str
     )
 
     parser.add_argument(
         '-o', '--output',
-        help="name of compiled file",
+        help="name of compiled file, outputs of several inputs are placed next to them",
         default='out.py',
         type=str
     )
 
+    parser.add_argument(
+        '-D', '--define',
+        help="defines macro as NAME, NAME=text or NAME(a,b)=text",
+        action='append',
+        default=[],
+        type=str
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        help="number of worker processes for several inputs",
+        default=1,
+        type=int
+    )
+
+    parser.add_argument(
+        '--include-hash',
+        help="validates cached includes by content hash too, detects edits keeping mtime and size",
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--include-workers',
+        help="threads reading included files concurrently, pays off on slow filesystems",
+        default=1,
+        type=int
+    )
+
+    parser.add_argument(
+        '--repeat-limit',
+        help="maximal number of lines produced by one @repeat",
+        default=1_000_000,
+        type=int
+    )
+
+    parser.add_argument(
+        '--suffix',
+        help="suffix of source files searched in input directories",
+        default='.ppy',
+        type=str
+    )
+
     parser.add_argument(
         '--stdout',
         help="enable step's output",
@@ -41,6 +85,29 @@ def init_parser(parser: ArgumentParser) -> None:
         type=str
     )
 
+    parser.add_argument(
+        '--inline-budget',
+        help="maximal size of inlined function body, in nodes of its syntax tree",
+        default=40,
+        type=int
+    )
+
+    parser.add_argument(
+        '--backend',
+        help="generator of compiled output: Python source, or source with its cached bytecode "
+             "in __pycache__ so imports skip compilation",
+        choices=['source', 'bytecode'],
+        default='source'
+    )
+
+    parser.add_argument(
+        '--invalidation',
+        help="how the bytecode backend's .pyc is checked against its source on import, "
+             "unchecked-hash trusts the .pyc until it is rebuilt",
+        choices=['checked-hash', 'unchecked-hash'],
+        default='checked-hash'
+    )
+
     parser.add_argument(
         '--verbose',
         help="enable all output mode",
@@ -60,14 +127,103 @@ def init_parser(parser: ArgumentParser) -> None:
         action='store_true'
     )
 
-def parse_args() -> argparse.Namespace:
+    parser.add_argument(
+        '--stream',
+        help="preprocess line by line without loading whole input",
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--profile',
+        help="profile preprocessor directives and phases, prints table or dumps JSON/Chrome trace",
+        nargs='?',
+        const='table',
+        choices=['table', 'json', 'trace'],
+        default=None
+    )
+
+    parser.add_argument(
+        '--profile-output',
+        help="file for '--profile' results instead of stdout",
+        default=None,
+        type=str
+    )
+
+    parser.add_argument(
+        '-M',
+        help="writes make rule of output depending on input and included files instead of output",
+        dest='deps_only',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '-MD',
+        help="writes make dependency file next to output, see '-MF'",
+        dest='deps',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '-MF',
+        help="file of '-M' and '-MD' rules, '<output>.d' for '-MD' and stdout for '-M' by default",
+        dest='deps_file',
+        default=None,
+        type=str
+    )
+
+    parser.add_argument(
+        '--include-graph',
+        help="dumps include graph of input as JSON, to '<output>.deps.json' if no file given",
+        nargs='?',
+        const='',
+        default=None,
+        type=str
+    )
+
+    parser.add_argument(
+        '--source-map',
+        help="writes original file, line and include stack of output lines with -E, "
+             "to '<output>.i.map' if no file given",
+        nargs='?',
+        const='',
+        default=None,
+        type=str
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        help="directory of persistent preprocessing cache, used with -E",
+        default=None,
+        type=str
+    )
+
+def parse_args(argv: list[str] | None = None, prog: str | None = None) -> argparse.Namespace:
+    """
+    :param argv: arguments without program name, sys.argv[1:] if None
+    :param prog: program name in usage, sys.argv[0] if None
+    """
     parser = argparse.ArgumentParser(
+        prog=prog,
         description="meta Python compiler for extending language syntax and possibilities"
     )
     init_parser(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("argument -j/--jobs: must be positive")
+    if args.repeat_limit < 0:
+        parser.error("argument --repeat-limit: must be non-negative")
+    if args.inline_budget < 0:
+        parser.error("argument --inline-budget: must be non-negative")
+    if args.include_workers < 1:
+        parser.error("argument --include-workers: must be positive")
+    if args.source_map is not None and args.stream:
+        parser.error("argument --source-map: not allowed with --stream")
+    if args.backend == 'bytecode' and args.E:
+        parser.error("argument --backend: bytecode isn't generated with -E")
 
+    args.input = args.inputs[0]     # single translation unit mode
     args.enable = [e.strip() for e in args.enable.split(',')] if args.enable else []
     args.disable = [e.strip() for e in args.disable.split(',')] if args.disable else []
 
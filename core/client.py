@@ -0,0 +1,62 @@
+"""
+Thin client of the Python+ compile server, stands in for main.py:
+
+    python core/client.py -i main.ppy -E -o main
+
+Arguments are passed to the server as they are, its output and
+diagnostics are printed and its exit code is returned. When no server
+listens on the socket, the compiler runs in this process instead.
+The socket is taken from PYTHONPLUS_SOCKET, see default_socket_path.
+"""
+import json
+import os
+import socket
+import sys
+
+
+def default_socket_path() -> str:
+    path = os.environ.get("PYTHONPLUS_SOCKET")
+    if path:
+        return path
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"pythonplus-{os.getuid()}.sock")
+
+
+def request(message: dict, socket_path: str | None = None) -> dict:
+    """
+    sends one request to server and returns its response
+    :raise OSError: server isn't running
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or default_socket_path())
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        connection.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := connection.recv(1 << 16):
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
+
+
+def compile_remote(argv: list[str], socket_path: str | None = None) -> int:
+    response = request({"command": "compile", "argv": argv, "cwd": os.getcwd()}, socket_path)
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["code"]
+
+
+def compile_local(argv: list[str]) -> int:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import cli.cfgparse
+    import driver
+    return driver.compile_all(cli.cfgparse.parse_args(argv))
+
+
+def main() -> int:
+    argv = sys.argv[1:]
+    try:
+        return compile_remote(argv)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return compile_local(argv)
+
+
+if __name__ == "__main__":
+    exit(main())
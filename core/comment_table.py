@@ -1,19 +1,80 @@
+"""
+In this file, the table of comments removed from source is defined.
+
+Comments are stored column-wise: line and column numbers in parallel
+int arrays, texts in one buffer sliced by offsets, so a comment costs a
+few array items instead of an object with a dict and a tuple. Comment
+objects are created on access only, as views into the table.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterator
+
+
 class CommentTable:
+    __slots__ = ("lines", "columns", "offsets", "_text", "_pending", "_order", "_sorted_lines")
 
     class Comment:
-        def __init__(self, pos: tuple[int, int]=(0,0), raw: str = r""):
-            self.pos = pos      # tuple (line, column)
-            self.raw = raw      # comment's text
+        """ view of one comment of table """
+        __slots__ = ("table", "index")
+
+        def __init__(self, table: "CommentTable", index: int):
+            self.table = table
+            self.index = index
+
+        @property
+        def line(self) -> int:
+            return self.table.lines[self.index]
+
+        @property
+        def column(self) -> int:
+            return self.table.columns[self.index]
+
+        @property
+        def pos(self) -> tuple[int, int]:
+            return self.line, self.column
+
+        @property
+        def raw(self) -> str:
+            return self.table.text(self.index)
+
+        def __eq__(self, other):
+            if not isinstance(other, CommentTable.Comment):
+                return NotImplemented
+            return self.pos == other.pos and self.raw == other.raw
 
         def __repr__(self):
             return f"Comment(pos={self.pos}, raw={self.raw})"
 
     def __init__(self):
-        self.comments = []
+        self.lines = array('i')
+        self.columns = array('i')
+        self.offsets = array('i', [0])     # comment i is text[offsets[i]:offsets[i+1]]
+        self._text = ""
+        self._pending: list[str] = []       # texts added since last join
+        # comment indexes ordered by position, None while added in order
+        self._order: array | None = None
+        self._sorted_lines: array | None = None
+
+    def add(self, pos: tuple[int, int], raw: str) -> None:
+        line, column = pos
+        if self._order is not None or (self.lines and pos < (self.lines[-1], self.columns[-1])):
+            self._order = array('i')    # added out of order, index is rebuilt on lookup
+        self.lines.append(line)
+        self.columns.append(column)
+        self.offsets.append(self.offsets[-1] + len(raw))
+        self._pending.append(raw)
 
-    def add(self, pos: tuple[int, int], raw: str):
-        comment = self.Comment(pos, raw)
-        self.comments.append(comment)
+    @property
+    def buffer(self) -> str:
+        """ texts of all comments joined """
+        if self._pending:
+            self._text += ''.join(self._pending)
+            self._pending.clear()
+        return self._text
+
+    def text(self, index: int) -> str:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
 
     @staticmethod
     def set_place_holder(source: list[str],
@@ -31,7 +92,113 @@ class CommentTable:
         source[line] += f" #{holder}"
 
     def __len__(self):
-        return len(self.comments)
+        return len(self.lines)
+
+    def __getitem__(self, index: int) -> Comment:
+        if index < 0:
+            index += len(self.lines)
+        if not 0 <= index < len(self.lines):
+            raise IndexError("comment index out of range")
+        return self.Comment(self, index)
+
+    def __iter__(self) -> Iterator[Comment]:
+        return (self.Comment(self, i) for i in range(len(self.lines)))
+
+    # lookup by line
+
+    def _index(self) -> tuple[array, array | None]:
+        """ :return: lines in ascending order and comment indexes in that order, None if identity """
+        if self._order is None:
+            return self.lines, None
+        if len(self._order) != len(self.lines):
+            order = sorted(range(len(self.lines)), key=lambda i: (self.lines[i], self.columns[i]))
+            self._order = array('i', order)
+            self._sorted_lines = array('i', (self.lines[i] for i in order))
+        return self._sorted_lines, self._order
+
+    def on_lines(self, first: int, last: int) -> list[Comment]:
+        """ comments of lines first..last inclusive, ordered by position """
+        lines, order = self._index()
+        begin, end = bisect_left(lines, first), bisect_right(lines, last)
+        indexes = range(begin, end) if order is None else order[begin:end]
+        return [self.Comment(self, i) for i in indexes]
+
+    def on_line(self, line: int) -> list[Comment]:
+        return self.on_lines(line, line)
+
+    # bulk operations
+
+    def strip(self, source: list[str]) -> list[str]:
+        """
+        removes '#' comments from source in one pass and records them,
+        comments inside string literals (triple-quoted ones too) are kept
+        :param source: source code as list[str]
+        :return: comment-free lines, trailing whitespace before comments is dropped
+        """
+        stripped = []
+        quote = ""      # quote of string literal continued from previous line
+        for number, line in enumerate(source):
+            column, quote = _comment_start(line, quote)
+            if column < 0:
+                stripped.append(line)
+                continue
+            newline = "\n" if line.endswith("\n") else ""
+            self.add((number, column), line[column:len(line) - len(newline)])
+            stripped.append(line[:column].rstrip() + newline)
+        return stripped
+
+    def restore(self, source: list[str]) -> list[str]:
+        """
+        puts recorded comments back into comment-free source,
+        a comment goes to its column if code of line ends before it
+        :return: new lines, source isn't changed
+        """
+        lines, order = self._index()
+        restored = list(source)
+        text = self.buffer
+        offsets, columns = self.offsets, self.columns
+        position = 0
+        while position < len(lines):
+            number = lines[position]
+            end = bisect_right(lines, number, position)
+            if number >= len(restored):
+                break
+            line = restored[number]
+            newline = "\n" if line.endswith("\n") else ""
+            code = line[:len(line) - len(newline)]
+            for k in range(position, end):
+                i = k if order is None else order[k]
+                gap = columns[i] - len(code)
+                code += " " * (gap if gap > 0 else 1 if code else 0) + text[offsets[i]:offsets[i + 1]]
+            restored[number] = code + newline
+            position = end
+        return restored
+
 
-    def __getitem__(self, index: int):
-        return self.comments[index]
\ No newline at end of file
+def _comment_start(line: str, quote: str) -> tuple[int, str]:
+    """
+    :param quote: quote of string literal open at line start, "" if none
+    :return: column of comment or -1, quote of string literal open at line end
+    """
+    i, size = 0, len(line)
+    while i < size:
+        if quote:
+            end = line.find(quote, i)
+            escape = line.find("\\", i)
+            if escape != -1 and (end == -1 or escape < end):
+                i = escape + 2
+                continue
+            if end == -1:
+                return -1, quote if len(quote) == 3 else ""    # single-quoted strings end with line
+            i = end + len(quote)
+            quote = ""
+            continue
+        c = line[i]
+        if c == "#":
+            return i, ""
+        if c in "'\"":
+            quote = line[i:i + 3] if line.startswith(c * 3, i) else c
+            i += len(quote)
+        else:
+            i += 1
+    return -1, quote if len(quote) == 3 else ""
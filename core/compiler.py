@@ -1,7 +1,51 @@
 import argparse
+import os
+import sys
+
+core_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(core_path, 'preprocessor'))
+sys.path.insert(0, os.path.dirname(core_path))
+
 from preprocessor import processor
+from context import Context
+from errors import PreprocessorError
+
+
+def compile(args: argparse.Namespace, include_cache=None) -> Context:
+    # '-E' and '-M' end with preprocessor
+    if args.E or args.deps_only:
+        return processor.process(args, include_cache)
+
+    context = processor.process(args, include_cache, keep_source=True)
+    if context.code:
+        return context
+    source, context.source = context.source, None
 
+    filename = processor.compiled_filename(args)
+    if os.path.abspath(filename) == os.path.abspath(args.input):
+        context.diagnostics.append(f"compiled file '{filename}' would overwrite input, see '-o'")
+        context.code = 1
+        return context
 
-def compile(args: argparse.Namespace):
-    processor.process(args)
-    
\ No newline at end of file
+    # transformer needs ast, units stopping at preprocessor don't import it
+    from core.transformer import transform
+    try:
+        unit = transform(''.join(source), args.input, args, context.vars_table)
+        if args.check_only:
+            return context
+        if getattr(args, "backend", "source") == "bytecode":
+            from core.generator import bytecode
+            cached = bytecode.write(unit, filename, checked=args.invalidation == "checked-hash")
+            if args.verbose:
+                print(f"target file is {filename}, bytecode is {cached}")
+        else:
+            from core.generator import source as generator
+            generator.write(unit, filename)
+            if args.verbose:
+                print(f"target file is {filename}")
+    except PreprocessorError as e:
+        from source_map import SourceMap
+        e.source_map = SourceMap.of(source)
+        context.diagnostics.append(e.what(source))
+        context.code = 1
+    return context
@@ -0,0 +1,114 @@
+"""
+Batch compilation driver of the Python+ compiler.
+
+Inputs (files, directories, glob patterns) are expanded into
+translation units, which are compiled in a pool of worker processes.
+Every unit gets its own Context; output and diagnostics of units are
+reported in input order, independent of worker scheduling.
+"""
+import argparse
+import contextlib
+import copy
+import glob
+import io
+import os
+import sys
+from collections.abc import Iterable
+
+import compiler
+
+
+def is_pattern(path: str) -> bool:
+    return any(c in path for c in '*?[')
+
+
+def expand_inputs(inputs: list[str], suffix: str) -> list[str]:
+    """
+    :param inputs: files, directories or glob patterns
+    :param suffix: suffix of source files searched in directories
+    :return: unique files in given order, matches of a pattern are sorted
+    """
+    files = []
+    seen = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            import pathlib
+            matches = sorted(str(p) for p in pathlib.Path(path).rglob(f"*{suffix}") if p.is_file())
+        elif is_pattern(path):
+            matches = sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        else:
+            matches = [path]    # missing file is reported by its own unit
+
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                files.append(match)
+    return files
+
+
+def compile_unit(args: argparse.Namespace, include_cache=None) -> tuple[str, int, str, list[str]]:
+    """
+    compiles one translation unit, never raises
+    :param include_cache: IncludeCache shared between units
+    :return: input, exit code, captured stdout, diagnostics
+    """
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        try:
+            context = compiler.compile(args, include_cache)
+            code, diagnostics = context.code, context.diagnostics
+        except OSError as e:
+            code, diagnostics = 3, [f"I/O Error: {e}"]
+        except Exception as e:
+            code, diagnostics = 2, [f"Unexpected error: {e}"]
+    return args.input, code, stdout.getvalue(), diagnostics
+
+
+def unit_args(args: argparse.Namespace, input_file: str, batch: bool) -> argparse.Namespace:
+    unit = copy.copy(args)
+    unit.input = input_file
+    if batch:
+        unit.output = None  # output is named after input
+        unit.deps_file = None
+        if unit.include_graph is not None:
+            unit.include_graph = ''
+        if unit.source_map is not None:
+            unit.source_map = ''
+    return unit
+
+
+def compile_all(args: argparse.Namespace, include_cache=None) -> int:
+    """
+    compiles all inputs given in args
+    :param include_cache: IncludeCache kept by caller (compile server),
+                          units are compiled in this process to share it
+    :return: exit code, the highest code of units
+    """
+    files = expand_inputs(args.inputs, args.suffix)
+    if not files:
+        print("No input files", file=sys.stderr)
+        return 1
+
+    batch = len(args.inputs) > 1 or any(os.path.isdir(p) or is_pattern(p) for p in args.inputs)
+    units = [unit_args(args, f, batch) for f in files]
+
+    if include_cache is not None:
+        return report((compile_unit(unit, include_cache) for unit in units), batch)
+    if args.jobs == 1 or len(units) == 1:
+        return report(map(compile_unit, units), batch)
+
+    # worker pool is imported only when needed, it takes most of startup time
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(units))) as executor:
+        return report(executor.map(compile_unit, units), batch)
+
+
+def report(results: Iterable[tuple[str, int, str, list[str]]], batch: bool) -> int:
+    """ prints results in input order, returns the highest exit code """
+    code = 0
+    for input_file, unit_code, output, diagnostics in results:
+        sys.stdout.write(output)
+        for diagnostic in diagnostics:
+            print(f"{input_file}: {diagnostic}" if batch else diagnostic, file=sys.stderr)
+        code = max(code, unit_code)
+    return code
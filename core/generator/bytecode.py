@@ -0,0 +1,75 @@
+"""
+In this file, the bytecode backend of generator is defined.
+
+The unit is written as Python source (see source.py) and compiled once
+to a code object which is cached next to it the way importlib does,
+'__pycache__/<name>.<tag>.pyc':
+
+    magic number | flags | source hash | marshalled code object
+
+The .pyc is hash-based (PEP 552): a checked one is used by imports
+while the hash of its source matches, an unchecked one until it is
+rebuilt. It is valid for the interpreter version running the compiler.
+
+A unit changed by passes is compiled from its emitted text, so lines of
+tracebacks are the lines of the written source; an unchanged one, whose
+text is its input, from its tree without parsing it again.
+"""
+import ast
+import importlib.util
+import marshal
+import os
+from types import CodeType
+
+from errors import TransformError
+from core.generator.source import emit
+from core.transformer.unit import TranslationUnit
+
+
+def code(unit: TranslationUnit, filename: str, text: str) -> CodeType:
+    """
+    :param text: source written for unit
+    :raise TransformError: unit is rejected by the compiler, e.g. 'return' out of function
+    """
+    source = text if unit.changed else ast.fix_missing_locations(unit.tree)
+    try:
+        return compile(source, filename, 'exec', dont_inherit=True)
+    except SyntaxError as e:
+        raise TransformError(f"syntax error: {e.msg}", e.lineno - 1 if e.lineno else None)
+
+
+def pyc(compiled: CodeType, source: bytes, checked: bool = True) -> bytes:
+    """ contents of hash-based .pyc of source """
+    flags = 0b01 | (0b10 if checked else 0)
+    return (importlib.util.MAGIC_NUMBER + flags.to_bytes(4, 'little')
+            + importlib.util.source_hash(source) + marshal.dumps(compiled))
+
+
+def _write_atomic(filename: str, data: bytes) -> None:
+    """ readers, e.g. imports of concurrent builds, never see a partial file """
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, filename)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def write(unit: TranslationUnit, filename: str, checked: bool = True) -> str:
+    """
+    writes source of unit to filename and its bytecode to __pycache__
+    :return: name of .pyc file
+    :raise TransformError: tree is rejected by the compiler
+    """
+    text = emit(unit)
+    source = text.encode('utf-8')   # hash is of bytes read by import, newlines aren't translated
+    data = pyc(code(unit, filename, text), source, checked)
+
+    cached = importlib.util.cache_from_source(filename)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    _write_atomic(filename, source)
+    _write_atomic(cached, data)
+    return cached
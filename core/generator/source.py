@@ -0,0 +1,21 @@
+"""
+In this file, the Python source backend of generator is defined.
+
+An unchanged unit is written as its lowered text, so layout and
+comments of source are kept. A unit changed by passes is unparsed from
+its tree, comments are lost and lines may move.
+"""
+import ast
+
+from core.transformer.unit import TranslationUnit
+
+
+def emit(unit: TranslationUnit) -> str:
+    if not unit.changed:
+        return unit.text
+    return ast.unparse(unit.tree) + "\n"
+
+
+def write(unit: TranslationUnit, filename: str) -> None:
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(emit(unit))
@@ -1,12 +1,11 @@
 import cli.cfgparse
-import compiler
+import driver
 
 
 def main():
-    cli.cfgparse.init_parser()
     args = cli.cfgparse.parse_args()
 
-    compiler.compile(args)
+    exit(driver.compile_all(args))
 
 
 if __name__ == "__main__":
@@ -1 +1,10 @@
-import core.plugins.jump
+"""
+Manifest of preprocessor API plugins.
+
+Every entry maps directive to 'module:function' ('[block]' suffix for
+directives closed by @end). A plugin module is imported only when its
+directive first appears in source, so plugins don't slow down startup.
+"""
+plugins = {
+    "jump": "core.plugins.jump:jump",
+}
@@ -0,0 +1,155 @@
+"""
+In this file, the index of matched block directives is defined.
+
+One pass with a stack pairs every block opener (@repeat, @invisible,
+...) with its 'end' directive, respecting nesting. The index listens
+to splices of its SourceBuffer and updates itself: only inserted lines
+are scanned. A splice that cuts a block in half, or touches an
+unmatched opener or 'end', marks the index dirty, it is rebuilt on
+demand.
+
+Positions are kept like in a gap buffer: directives before the cursor
+are stored as absolute positions (codes >= 0), the others as negative
+distances from the end of source (codes < 0). A splice moves the cursor
+to its start, so nothing behind it has to be shifted; the preprocessor
+moves forward, which makes cursor moves amortized O(1).
+"""
+import handlers
+from source_buffer import SourceBuffer
+
+
+class BlockIndex:
+
+    def __init__(self, source: SourceBuffer):
+        self.source = source
+        self.size = 0                       # length of source known to index
+        self.cursor = 0
+        self.pairs: dict[int, int] = {}     # opener code -> end code
+        self.ends: dict[int, int] = {}      # end code -> opener code
+        self.unmatched: set[int] = set()    # codes of openers and ends without pair
+        self.head: list[int] = []           # positions before cursor, ascending
+        self.tail: list[int] = []           # codes after cursor, descending
+        self.dirty = True
+        source.listeners.append(self.on_splice)
+
+    @classmethod
+    def of(cls, source: SourceBuffer) -> "BlockIndex":
+        """ returns index attached to source, creates it on first use """
+        if source.block_index is None:
+            source.block_index = cls(source)
+        return source.block_index
+
+    def _code(self, position: int) -> int:
+        return position if position < self.cursor else position - self.size
+
+    def _position(self, code: int) -> int:
+        return code if code >= 0 else code + self.size
+
+    def end_of(self, opener: int) -> int:
+        """ returns index of 'end' matching block opener or -1 """
+        if self.dirty:
+            self.rebuild()
+        end = self.pairs.get(self._code(opener))
+        return -1 if end is None else self._position(end)
+
+    def rebuild(self) -> None:
+        self.pairs.clear()
+        self.ends.clear()
+        self.unmatched.clear()
+        self.head.clear()
+        self.size = len(self.source)
+        self.cursor = 0
+        positions, _ = self._scan(0, self.size)
+        self.tail = [p - self.size for p in reversed(positions)]
+        self.dirty = False
+
+    def _scan(self, start: int, stop: int) -> tuple[list[int], bool]:
+        """
+        pairs blocks of lines[start:stop], range must be behind cursor
+        :return: positions of found openers and ends, False if range isn't balanced
+        """
+        stack = []
+        positions = []
+        balanced = True
+        for i, line in handlers.candidate_lines(self.source, start, stop):
+            name = handlers.directive_name(line)
+            if name is None:
+                continue
+            if handlers.is_block_opener(line):
+                stack.append(i)
+            elif name == handlers.end_directive:
+                if stack:
+                    opener, end = self._code(stack.pop()), self._code(i)
+                    self.pairs[opener] = end
+                    self.ends[end] = opener
+                else:
+                    self.unmatched.add(self._code(i))
+                    balanced = False
+            else:
+                continue
+            positions.append(i)
+
+        for opener in stack:
+            self.unmatched.add(self._code(opener))
+        return positions, balanced and not stack
+
+    def _recode(self, old: int, new: int) -> None:
+        if old in self.pairs:
+            end = self.pairs.pop(old)
+            self.pairs[new] = end
+            self.ends[end] = new
+        elif old in self.ends:
+            opener = self.ends.pop(old)
+            self.ends[new] = opener
+            self.pairs[opener] = new
+        else:
+            self.unmatched.remove(old)
+            self.unmatched.add(new)
+
+    def _move_cursor(self, position: int) -> None:
+        while self.tail and self.tail[-1] + self.size < position:
+            code = self.tail.pop()
+            self._recode(code, code + self.size)
+            self.head.append(code + self.size)
+        while self.head and self.head[-1] >= position:
+            code = self.head.pop()
+            self._recode(code, code - self.size)
+            self.tail.append(code - self.size)
+        self.cursor = position
+
+    def on_splice(self, start: int, stop: int, inserted: int) -> None:
+        if self.dirty:
+            return
+
+        # positions are in coordinates before splice until size is updated
+        self._move_cursor(start)
+        removed = []
+        while self.tail and self.tail[-1] + self.size < stop:
+            removed.append(self.tail.pop())
+        if removed and not self._remove_inner(set(removed)):
+            self.dirty = True
+            return
+
+        self.size += inserted - (stop - start)
+        if inserted:
+            positions, balanced = self._scan(start, start + inserted)
+            self.tail.extend(p - self.size for p in reversed(positions))
+            if not balanced:
+                self.dirty = True
+
+    def _remove_inner(self, removed: set[int]) -> bool:
+        """
+        drops pairs lying inside removed range,
+        balanced blocks inside it don't change pairing of others
+        :return: False if a pair is cut by range bounds
+        """
+        for code in removed:
+            if code in self.unmatched:
+                return False
+            partner = self.pairs.get(code, self.ends.get(code))
+            if partner not in removed:
+                return False
+        for code in removed:
+            if code in self.pairs:
+                del self.ends[self.pairs.pop(code)]
+        return True
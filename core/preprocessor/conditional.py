@@ -1,32 +1,120 @@
-from typing import List, Callable
+"""
+In this file, the conditional directives and macro definitions are defined.
+
+    @if EXPRESSION
+    ...
+    @elif EXPRESSION
+    ...
+    @else
+    ...
+    @end
+
+Expressions are evaluated by expression.py. The kept branch replaces
+the whole block in one splice, other branches are dropped without
+reading their lines: the block end is taken from the block index and
+only directive candidates of the block are checked for @elif/@else.
+"""
+import re
+
+from errors import DirectiveSyntaxError
+from expression import Evaluator
+from handlers import register_handler, directive_name, is_block_opener, candidate_lines
+from core.preprocessor.lexer import tokenize
+from context import Context
+from source_buffer import SourceBuffer
+from utils import search_end
+from block_index import BlockIndex
+
+branch_directives = ("elif", "else")
+
+# '@define NAME text' or '@define NAME(a, b) text'
+_definition = re.compile(r"([A-Za-z_]\w*(?:\([^)]*\))?)\s*(.*)", re.S)
 
-from errors import *
-from handlers import register_handler, directive_prefix
-from context import Context, State
 
 def is_conditional(line: str) -> bool:
-    return any(line.strip().startswith(f"{directive}") for directive in conditional_handlers)
+    return directive_name(line) in conditional_handlers
+
+
+def argument(line: str) -> str:
+    """ text after directive name without comment """
+    return tokenize(line).text
+
+
+def branches(lines: SourceBuffer, line_index: int, end_index: int) -> list[int]:
+    """ positions of @elif and @else of block, nested blocks are jumped over """
+    found = []
+    position = line_index + 1
+    while True:
+        for i, line in candidate_lines(lines, position, end_index):
+            if is_block_opener(line):
+                position = BlockIndex.of(lines).end_of(i) + 1
+                break
+            if directive_name(line) in branch_directives:
+                found.append(i)
+        else:
+            return found
+
+
+def ifpp(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    end_index = search_end(lines, line_index)
+    if end_index == -1:
+        raise DirectiveSyntaxError("if::Missed 'end' directive", context.base_line)
+
+    starts = [line_index] + branches(lines, line_index, end_index)
+    for i in starts[1:-1]:
+        if directive_name(lines[i]) == "else":
+            raise DirectiveSyntaxError("if::'else' must be the last branch", context.base_line)
+
+    evaluator = Evaluator.of(context)
+    for begin, stop in zip(starts, starts[1:] + [end_index]):
+        line = lines[begin]
+        if directive_name(line) != "else":
+            condition = argument(line)
+            if not condition:
+                raise DirectiveSyntaxError(f"{directive_name(line)}::expected condition", context.base_line)
+            if not evaluator.evaluate(condition):
+                continue
+        lines[line_index:end_index+1] = lines.view(begin + 1, stop)
+        return line_index   # kept branch is processed next
+
+    del lines[line_index:end_index+1]
+    return line_index
+
+
+def branch(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    raise DirectiveSyntaxError(f"'{directive_name(lines[line_index])}' outside of 'if' block", context.base_line)
 
-def end(lines: List[str], line_index: int, context: Context) -> int:
-    if context.state != State.WAITING_END_OF_BLOCK:
-        raise DirectiveSyntaxError("Unexpected directive 'end'", context.base_line)
-    return line_index   # nothing modified
 
-def define(lines: List[str], line_index: int, context: Context) -> int:
-    pass
+def define(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    match = _definition.fullmatch(argument(lines[line_index]))
+    if match is None:
+        raise DirectiveSyntaxError("define::expected '@define NAME text' or '@define NAME(a, b) text'",
+                                   context.base_line)
+    holder, text = match.groups()
+    try:
+        context.macro_table.define_from(f"{holder}={text}" if text else holder)
+    except ValueError as e:
+        raise DirectiveSyntaxError(f"define::{e}", context.base_line)
+    del lines[line_index]
+    return line_index
 
-def undef(lines: List[str], line_index: int, context: Context) -> int:
-    pass
 
-def ifpp(lines: List[str], line_index: int) -> int:
-    pass
+def undef(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    holder = argument(lines[line_index])
+    if not holder.isidentifier():
+        raise DirectiveSyntaxError("undef::expected '@undef NAME'", context.base_line)
+    context.macro_table.undef(holder)
+    del lines[line_index]
+    return line_index
 
 
-conditional_handlers ={
-    "define" : define,
-    "undef" : undef,
-    "if" : ifpp
+conditional_handlers = {
+    "if": ifpp,
+    "elif": branch,
+    "else": branch,
+    "define": define,
+    "undef": undef
 }
 
 for name, handler in conditional_handlers.items():
-    register_handler(name, handler)
\ No newline at end of file
+    register_handler(name, handler, block=name == "if")
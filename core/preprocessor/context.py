@@ -1,4 +1,5 @@
 from argparse import Namespace
+from contextlib import nullcontext
 from enum import Enum, auto
 
 
@@ -15,10 +16,13 @@ class Context:
                  defines: list[str] | None = None,
                  filename: str="",
                  base_line: int=0,
-                 col_num: int=0):
+                 col_num: int=0,
+                 include_cache=None):
 
         from macro_processor import MacrosTable
         from core.build_vars import BuildVarsTable
+        from include_cache import IncludeCache
+        from include_graph import IncludeGraph
 
         self.config = args
         if defines is None:
@@ -32,5 +36,40 @@ class Context:
         self.col_num = col_num
 
         self.vars_table = BuildVarsTable()
+        # evaluator of directive expressions, see expression.py
+        self.evaluator = None
+        # expanded include files, may be shared between contexts
+        self.include_cache = include_cache if include_cache is not None else IncludeCache()
+        # a shared cache validates entries the way the unit asks, entries without digests are read again
+        self.include_cache.check_hash = getattr(args, "include_hash", False)
+        # absolute paths of all files included while processing
+        self.dependencies = set()
+        # files included while processing with lines of their directives
+        self.include_graph = IncludeGraph(filename)
+        # concurrent include reader, created by the first include, see include_resolver.py
+        self.include_resolver = None
+        # processed source kept for compiler passes, see processor.process
+        self.source = None
+        # error messages of unit, reported by caller
+        self.diagnostics = []
         self.code = 0
         self.state = State.INIT
+        # enabled by '--profile' flag
+        self.profiler = None
+        if getattr(args, "profile", None):
+            from profiler import Profiler
+            self.profiler = Profiler()
+
+    def span(self, name: str, category: str = "plugin", handler=None):
+        """
+        hook for profiling, usable by plugins:
+            with context.span("my_plugin::parse"):
+                ...
+        does nothing unless profiling is enabled
+        """
+        if self.profiler is None:
+            return _no_span
+        return self.profiler.span(name, category, handler)
+
+
+_no_span = nullcontext()
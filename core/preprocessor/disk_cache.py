@@ -0,0 +1,158 @@
+"""
+In this file, the persistent preprocessing cache is defined.
+
+Every translation unit gets a manifest keyed by its path, content,
+code of the preprocessor and registered handlers. The manifest lists digests of all
+files included transitively and values of the symbols (build vars,
+macros) the unit read before assigning them itself, and points to the stored '-E' output.
+A unit is served from disk only if all of them are unchanged.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+
+import handlers
+from context import Context
+from include_cache import file_digest
+
+cache_version = "3"    # bump when layout of entries changes
+_module_digests: dict[str, str] = {}
+_preprocessor_path = os.path.dirname(os.path.abspath(__file__))
+# modules outside of preprocessor package whose code changes its output
+_shared_modules = [os.path.join(os.path.dirname(_preprocessor_path), "build_vars.py")]
+_preprocessor_digest = None
+
+
+def _module_path(module_name: str) -> str | None:
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return getattr(module, "__file__", None)
+    try:
+        spec = importlib.util.find_spec(module_name)    # plugin not loaded yet
+    except (ImportError, ValueError):
+        return None
+    return spec.origin if spec is not None else None
+
+
+def _module_digest(module_name: str) -> str:
+    if module_name not in _module_digests:
+        path = _module_path(module_name)
+        _module_digests[module_name] = file_digest(path) if path and os.path.isfile(path) else ""
+    return _module_digests[module_name]
+
+
+def handlers_signature() -> str:
+    """ hash of registered directives and the code of their handlers, loaded or not """
+    digest = hashlib.sha256()
+    for directive in sorted(handlers.handlers):
+        handler = handlers.handlers[directive]
+        if isinstance(handler, handlers.PluginSpec):
+            module, name = handler.module, handler.function
+        else:
+            module = getattr(handler, "__module__", "")
+            name = getattr(handler, "__qualname__", repr(handler))
+        digest.update(f"{directive}={module}.{name}:{_module_digest(module)}\n".encode())
+    return digest.hexdigest()
+
+
+def preprocessor_signature() -> str:
+    """ hash of code of all preprocessor modules, a changed preprocessor doesn't reuse outputs """
+    global _preprocessor_digest
+    if _preprocessor_digest is None:
+        digest = hashlib.sha256()
+        modules = sorted(os.path.join(_preprocessor_path, name) for name in os.listdir(_preprocessor_path)
+                         if name.endswith(".py"))
+        for path in modules + _shared_modules:
+            digest.update(f"{os.path.basename(path)}:{file_digest(path)}\n".encode())
+        _preprocessor_digest = digest.hexdigest()
+    return _preprocessor_digest
+
+
+def read_symbols(context: Context) -> dict[str, str]:
+    """ current values of symbols processed unit read before assigning them """
+    symbols = {}
+    for name in context.vars_table.accessed:
+        symbols[f"var:{name}"] = _symbol_value(context, f"var:{name}")
+    for name in context.macro_table.accessed:
+        symbols[f"macro:{name}"] = _symbol_value(context, f"macro:{name}")
+    return symbols
+
+
+def _symbol_value(context: Context, key: str) -> str:
+    """ looks symbol up without marking it as accessed """
+    kind, name = key.split(':', 1)
+    if kind == "var":
+        return repr(context.vars_table.vars.get(name))
+    return repr(context.macro_table.definition(name))
+
+
+class DiskCache:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def unit_key(self, input_file: str, context: Context) -> str:
+        """ must be computed before processing, while context is fresh """
+        digest = hashlib.sha256()
+        digest.update(f"{cache_version}\n{os.path.abspath(input_file)}\n".encode())
+        digest.update(f"{file_digest(input_file)}\n{preprocessor_signature()}\n{handlers_signature()}\n".encode())
+        macros = context.macro_table
+        digest.update(f"{sorted(macros.definition(holder) for holder in macros.table)}\n".encode())
+        return digest.hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, key[:2], key)
+        return base + ".json", base + ".i"
+
+    def restore(self, key: str, context: Context, target: str, source_map: str | None = None) -> bool:
+        """
+        copies cached output of unchanged unit to target
+        :param key: unit key computed before processing
+        :param context: context of unit, used to read current symbol values
+        :param source_map: target of source map, a unit stored without map misses
+        :return: True on cache hit
+        """
+        manifest_path, output_path = self._paths(key)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            for path, digest in manifest["files"].items():
+                if file_digest(path) != digest:
+                    return False
+            for symbol, value in manifest["symbols"].items():
+                if _symbol_value(context, symbol) != value:
+                    return False
+            if source_map is not None:
+                shutil.copyfile(output_path + ".map", source_map)
+            shutil.copyfile(output_path, target)
+            context.dependencies.update(manifest["files"])
+            context.include_graph.update(tuple(edge) for edge in manifest["edges"])
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def store(self, key: str, context: Context, target: str, source_map: str | None = None) -> None:
+        """ saves output of processed unit together with its dependencies and source map if given """
+        manifest_path, output_path = self._paths(key)
+        manifest = {
+            "input": os.path.abspath(context.filename),
+            "files": {path: file_digest(path) for path in sorted(context.dependencies)},
+            "symbols": read_symbols(context),
+            "edges": list(context.include_graph)
+        }
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+
+        # write to temporary files first, concurrent runs may share cache
+        suffix = f".{os.getpid()}.tmp"
+        if source_map is not None:
+            shutil.copyfile(source_map, output_path + ".map" + suffix)
+            os.replace(output_path + ".map" + suffix, output_path + ".map")
+        shutil.copyfile(target, output_path + suffix)
+        os.replace(output_path + suffix, output_path)
+        with open(manifest_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + suffix, manifest_path)
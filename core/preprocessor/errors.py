@@ -2,7 +2,7 @@
 In this file, the hierarchy of exception and warning
 classes for the Python+ compiler preprocessor is defined.
 """
-from typing import List, Callable
+from collections.abc import Callable
 
 
 """ Base Preprocessor Error type for Python+ compiler """
@@ -13,13 +13,22 @@ class PreprocessorError(Exception):
                  line: int | None = None):
         self.message = message
         self.line_num = line
+        # map of source the error is reported in, set by processor, see source_map.py
+        self.source_map = None
         super().__init__(message)
 
+    def position(self) -> str:
+        """ 'line N' of processed source followed by original position if it differs """
+        position = f"line {self.line_num + 1}"
+        if self.source_map is not None:
+            position += self.source_map.describe(self.line_num)
+        return position
+
     def what(self, source: list[str]) -> str:
         """ returns detailed message about error """
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            return f"Error at line {self.line_num + 1}: {self.message}\n{line}"
+            return f"Error at {self.position()}: {self.message}\n{line}"
         else:
             return self.message
 
@@ -67,7 +76,7 @@ class SelfReferenceError(PreprocessorError):
     def what(self, source: list[str]):
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            error_string = f"Circular include error at '{self.filename}' line {self.line_num + 1}: {self.message}\n>{line}\n"
+            error_string = f"Circular include error at '{self.filename}' {self.position()}: {self.message}\n>{line}\n"
 
             if self.col_num is not None and 0 <= self.col_num < len(line):
                 mask = [self.col_num, 1]  # spaces ~ + 1 arrow ^
@@ -85,7 +94,7 @@ class SourceIndexError(PreprocessorError):
     from context import Context
     def __init__(self,
                  message: str="",
-                 handler: Callable[[List[str], int, Context], int]=...,
+                 handler: Callable[[list[str], int, Context], int]=...,
                  line: int | None = None):
         self.message = message
         self.handler = handler
@@ -96,7 +105,7 @@ class SourceIndexError(PreprocessorError):
         """ returns detailed message about error """
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            return f"Handler '{self.handler}' returned invalid index; at line {self.line_num + 1}: {self.message}\n{line}"
+            return f"Handler '{self.handler}' returned invalid index; at {self.position()}: {self.message}\n{line}"
         else:
             return self.message
 
@@ -112,9 +121,12 @@ class DirectiveSyntaxError(PreprocessorError):
     def __init__(self,
                  message: str = "",
                  line: int | None = None,
-                 column: int | None = None):
+                 column: int | None = None,
+                 argument: int | None = None):
+        """ :param argument: index of directive argument pointed at, see lexer.LineTokens.span """
         super().__init__(message, line)
         self.col_num = column
+        self.argument = argument
 
     @staticmethod
     def direct_mistake_line(mask: list[int],
@@ -129,12 +141,16 @@ class DirectiveSyntaxError(PreprocessorError):
     def what(self, source: list[str], mask: list[int] | None = None) -> str:
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            error_string = f"Invalid directive syntax at line {self.line_num + 1}: {self.message}\n>{line}\n"
+            error_string = f"Invalid directive syntax at {self.position()}: {self.message}\n>{line}\n"
 
             if mask is not None:
                 pointer_string = self.direct_mistake_line(mask)
             elif self.col_num is not None and 0 <= self.col_num < len(line):
                 pointer_string = self.direct_mistake_line([self.col_num, 1])
+            elif self.argument is not None:
+                from core.preprocessor.lexer import tokenize
+                begin, end = tokenize(line).span(self.argument)
+                pointer_string = self.direct_mistake_line([begin + 1, end - begin])    # after '>'
             else:
                 pointer_string = ''
 
@@ -155,7 +171,7 @@ class UnexpectedFileError(PreprocessorError):
     def what(self, source: list[str]):
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            error_string = f"Unexpected filename at line {self.line_num + 1}: {self.message}\n>{line}\n"
+            error_string = f"Unexpected filename at {self.position()}: {self.message}\n>{line}\n"
             pos = line.find(self.filename)
             pointer_string = DirectiveSyntaxError.direct_mistake_line(
                 [pos + 1 if pos >= 0 else 0, len(self.filename)],
@@ -169,6 +185,16 @@ class UnexpectedFileError(PreprocessorError):
         return f"Unexpected filename: '{self.filename}';\n{self.message}"
 
 
+class ExpansionLimitError(PreprocessorError):
+    """ directive would produce more lines than allowed, e.g. '--repeat-limit' """
+
+    def what(self, source: list[str]) -> str:
+        if self.line_num is not None and 0 <= self.line_num < len(source):
+            line = source[self.line_num]
+            return f"Expansion limit exceeded at {self.position()}: {self.message}\n>{line}\n"
+        return self.message
+
+
 class UndefinedVariableError(PreprocessorError):
 
     def __init__(self,
@@ -183,7 +209,7 @@ class UndefinedVariableError(PreprocessorError):
     def what(self, source: list[str]):
         if self.line_num is not None and 0 <= self.line_num < len(source):
             line = source[self.line_num]
-            error_string = f"Invalid directive syntax at ({self.line_num + 1}): {self.message}\n>{line}\n"
+            error_string = f"Invalid directive syntax at {self.position()}: {self.message}\n>{line}\n"
 
             if self.col_num is not None and 0 <= self.col_num < len(line):
                 mask = [ self.col_num, len(self.identifier) ]
@@ -196,5 +222,25 @@ class UndefinedVariableError(PreprocessorError):
             return self.message
 
 
+class TransformError(PreprocessorError):
+    """ Python+ code rejected by transformer, reported at line of preprocessed source """
+
+    def what(self, source: list[str]) -> str:
+        if self.line_num is not None and 0 <= self.line_num < len(source):
+            line = source[self.line_num]
+            return f"Invalid Python+ code at {self.position()}: {self.message}\n>{line}\n"
+        return self.message
+
+
+class CastError(TransformError):
+    """ comp_cast or bool_cast which doesn't hold for its classes """
+
+    def what(self, source: list[str]) -> str:
+        if self.line_num is not None and 0 <= self.line_num < len(source):
+            line = source[self.line_num]
+            return f"Invalid cast at {self.position()}: {self.message}\n>{line}\n"
+        return self.message
+
+
 class RedefinitionWarning(PreprocessorWarning):
     pass
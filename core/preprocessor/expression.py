@@ -0,0 +1,305 @@
+"""
+In this file, the compile-time expression evaluator is defined.
+
+Expressions of @if, @elif and @setvar use Python syntax restricted to
+literals, names, arithmetic, comparisons, boolean operators,
+conditional expressions and a few pure functions; there is no eval.
+A name is a build variable or an object-like macro, whose expansion is
+evaluated as expression itself; defined(NAME) tests both tables. A call
+of function-like macro is expanded and evaluated the same way.
+
+Parsed expressions are compiled into closures and cached by text,
+subexpressions without names are folded at parse time. The evaluator
+of a context reuses the last result of an expression while none of its
+inputs has changed: build variables it read, also through expansions
+of macros, are versioned one by one, macros by a generation of the
+whole table (an expansion may use any macro).
+"""
+import ast
+import operator
+from collections.abc import Callable
+from functools import lru_cache
+
+from errors import DirectiveSyntaxError, PreprocessorError, UndefinedVariableError
+
+# guards against expressions building huge values at compile time
+max_exponent = 10_000
+max_length = 1_000_000
+
+
+def _power(a, b):
+    if isinstance(b, int) and abs(b) > max_exponent:
+        raise ValueError(f"exponent {b} is too large")
+    return a ** b
+
+
+def _shift(a, b):
+    if isinstance(b, int) and b > max_exponent:
+        raise ValueError(f"shift {b} is too large")
+    return a << b
+
+
+def _multiply(a, b):
+    for sequence, count in ((a, b), (b, a)):
+        if isinstance(sequence, (str, tuple, list)) and isinstance(count, int) \
+                and len(sequence) * count > max_length:
+            raise ValueError("sequence is too long")
+    return a * b
+
+
+_binary = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: _multiply,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: _power, ast.LShift: _shift, ast.RShift: operator.rshift,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+_unary = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert}
+_compare = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Is: operator.is_, ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+}
+functions = {"int": int, "float": float, "str": str, "bool": bool, "len": len, "abs": abs, "min": min, "max": max}
+
+# compiled node: scope -> value, scope is Evaluator
+Compiled = Callable[["Evaluator"], object]
+
+
+class Expression:
+    __slots__ = ("text", "names", "evaluate")
+
+    def __init__(self, text: str, names: tuple[str, ...], evaluate: Compiled):
+        self.text = text
+        self.names = names          # sorted names read by expression
+        self.evaluate = evaluate
+
+    def __repr__(self):
+        return f"Expression({self.text!r}, names={self.names})"
+
+
+@lru_cache(maxsize=1024)
+def parse(text: str) -> Expression:
+    """ :raise DirectiveSyntaxError: invalid or unsupported expression """
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise DirectiveSyntaxError(f"expression::{e.msg}: '{text.strip()}'")
+    compiler = _Compiler(text.strip())
+    evaluate, _ = compiler.compile(tree.body)
+    return Expression(text, tuple(sorted(compiler.names)), evaluate)
+
+
+class _Compiler:
+    """ turns AST into closures, constant subtrees are evaluated once """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.names: set[str] = set()
+
+    def compile(self, node: ast.AST) -> tuple[Compiled, bool]:
+        """ :return: closure and whether it is constant """
+        method = getattr(self, f"_{node.__class__.__name__}", None)
+        if method is None:
+            raise DirectiveSyntaxError(f"expression::'{ast.unparse(node)}' isn't supported in '{self.text}'")
+        return method(node)
+
+    def _fold(self, evaluate: Compiled, constant: bool) -> tuple[Compiled, bool]:
+        if not constant:
+            return evaluate, False
+        try:
+            value = evaluate(None)
+        except Exception:   # reported when evaluated
+            return evaluate, False
+        return (lambda scope: value), True
+
+    def _Constant(self, node: ast.Constant):
+        value = node.value
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            raise DirectiveSyntaxError(f"expression::literal {value!r} isn't supported in '{self.text}'")
+        return (lambda scope: value), True
+
+    def _Name(self, node: ast.Name):
+        name = node.id
+        self.names.add(name)
+        return (lambda scope: scope.value(name)), False
+
+    def _Tuple(self, node: ast.Tuple | ast.List):
+        items = [self.compile(item) for item in node.elts]
+        evaluate = lambda scope: tuple(item(scope) for item, _ in items)
+        return self._fold(evaluate, all(constant for _, constant in items))
+
+    _List = _Tuple
+
+    def _UnaryOp(self, node: ast.UnaryOp):
+        function = _unary.get(node.op.__class__)
+        operand, constant = self.compile(node.operand)
+        if function is None:
+            raise DirectiveSyntaxError(f"expression::operator isn't supported in '{self.text}'")
+        return self._fold(lambda scope: function(operand(scope)), constant)
+
+    def _BinOp(self, node: ast.BinOp):
+        function = _binary.get(node.op.__class__)
+        if function is None:
+            raise DirectiveSyntaxError(f"expression::operator isn't supported in '{self.text}'")
+        (left, left_constant), (right, right_constant) = self.compile(node.left), self.compile(node.right)
+        return self._fold(lambda scope: function(left(scope), right(scope)), left_constant and right_constant)
+
+    def _BoolOp(self, node: ast.BoolOp):
+        values = [self.compile(value) for value in node.values]
+        operands = [value for value, _ in values]
+        if isinstance(node.op, ast.And):
+            def evaluate(scope):
+                for operand in operands:
+                    result = operand(scope)
+                    if not result:
+                        return result
+                return result
+        else:
+            def evaluate(scope):
+                for operand in operands:
+                    result = operand(scope)
+                    if result:
+                        return result
+                return result
+        return self._fold(evaluate, all(constant for _, constant in values))
+
+    def _Compare(self, node: ast.Compare):
+        left, constant = self.compile(node.left)
+        steps = []
+        for op, comparator in zip(node.ops, node.comparators):
+            right, right_constant = self.compile(comparator)
+            steps.append((_compare[op.__class__], right))
+            constant = constant and right_constant
+
+        def evaluate(scope):
+            a = left(scope)
+            for function, right in steps:
+                b = right(scope)
+                if not function(a, b):
+                    return False
+                a = b
+            return True
+        return self._fold(evaluate, constant)
+
+    def _IfExp(self, node: ast.IfExp):
+        (test, a), (body, b), (orelse, c) = map(self.compile, (node.test, node.body, node.orelse))
+        return self._fold(lambda scope: body(scope) if test(scope) else orelse(scope), a and b and c)
+
+    def _Call(self, node: ast.Call):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise DirectiveSyntaxError(f"expression::only calls like 'name(args)' are supported in '{self.text}'")
+        name = node.func.id
+
+        if name == "defined":
+            if len(node.args) != 1 or not isinstance(node.args[0], ast.Name):
+                raise DirectiveSyntaxError(f"expression::'defined' takes one name in '{self.text}'")
+            symbol = node.args[0].id
+            self.names.add(symbol)
+            return (lambda scope: scope.defined(symbol)), False
+
+        if name in functions:
+            function = functions[name]
+            args = [self.compile(arg) for arg in node.args]
+            evaluate = lambda scope: function(*(arg(scope) for arg, _ in args))
+            return self._fold(evaluate, all(constant for _, constant in args))
+
+        # function-like macro, its expansion is evaluated
+        call = ast.get_source_segment(self.text, node)
+        self.names.add(name)
+        return (lambda scope: scope.macro_call(name, call)), False
+
+
+class Evaluator:
+    """ evaluates expressions of directives of one context, see Context.evaluator """
+
+    def __init__(self, context):
+        self.context = context
+        self._results: dict[str, tuple[tuple, object]] = {}    # text -> (inputs stamp, value)
+        self._expanding: set[str] = set()   # macros being evaluated
+        self._read: set[str] | None = None  # build variables read by expression being evaluated
+
+    @classmethod
+    def of(cls, context) -> "Evaluator":
+        """ returns evaluator of context, creates it on first use """
+        if context.evaluator is None:
+            context.evaluator = cls(context)
+        return context.evaluator
+
+    def evaluate(self, text: str):
+        """
+        :raise DirectiveSyntaxError: invalid expression or failed operation
+        :raise UndefinedVariableError: unknown name
+        """
+        expression = parse(text)
+        if not expression.names:
+            return self._run(expression)
+
+        cached = self._results.get(text)
+        if cached is not None and self._current(cached[0]):
+            return cached[1]
+        outer, self._read = self._read, set()
+        try:
+            value = self._run(expression)
+            read = self._read
+        finally:
+            if outer is not None:
+                outer |= self._read
+            self._read = outer
+        self._results[text] = (self._stamp(read), value)
+        return value
+
+    def _stamp(self, names) -> tuple:
+        version = self.context.vars_table.version
+        return self.context.macro_table.generation, tuple((name, version(name)) for name in names)
+
+    def _current(self, stamp: tuple) -> bool:
+        generation, versions = stamp
+        version = self.context.vars_table.version
+        return generation == self.context.macro_table.generation and \
+            all(version(name) == number for name, number in versions)
+
+    def _run(self, expression: Expression):
+        try:
+            return expression.evaluate(self)
+        except PreprocessorError:
+            raise
+        except (ArithmeticError, TypeError, ValueError, IndexError, KeyError, RecursionError) as e:
+            raise DirectiveSyntaxError(f"expression::{e} in '{expression.text.strip()}'")
+
+    # scope of compiled expressions
+
+    def value(self, name: str):
+        variables = self.context.vars_table
+        if self._read is not None:
+            self._read.add(name)    # also a macro, defining a variable of its name changes the value
+        if name in variables.vars:
+            return variables.value(name)
+        macros = self.context.macro_table
+        if macros.is_defined(name):
+            return self._macro_value(name, name)
+        raise UndefinedVariableError(f"expression::'{name}' is neither build variable nor macro", name)
+
+    def defined(self, name: str) -> bool:
+        if self._read is not None:
+            self._read.add(name)
+        return name in self.context.vars_table.vars or self.context.macro_table.is_defined(name)
+
+    def macro_call(self, name: str, call: str):
+        if not self.context.macro_table.is_defined(name):
+            raise UndefinedVariableError(f"expression::'{name}' is neither function nor macro", name)
+        return self._macro_value(name, call)
+
+    def _macro_value(self, name: str, text: str):
+        """ evaluates expansion of macro usage, macro defined without text is 1 like '-D' in C """
+        if name in self._expanding:
+            raise DirectiveSyntaxError(f"expression::macro '{name}' refers to itself")
+        expansion = self.context.macro_table.expand(text).strip()
+        if expansion == text:
+            raise DirectiveSyntaxError(f"expression::macro '{name}' isn't usable here without arguments")
+        if not expansion:
+            return 1
+        self._expanding.add(name)
+        try:
+            return self._run(parse(expansion))
+        finally:
+            self._expanding.discard(name)
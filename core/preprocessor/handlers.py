@@ -1,49 +1,95 @@
-from typing import List, Callable
+import importlib
+import re
+from collections.abc import Callable, Iterator
 
 from context import Context
-from errors import DirectiveSyntaxError
+from errors import DirectiveSyntaxError, ExpansionLimitError, PreprocessorError
+from core.preprocessor.lexer import tokenize, string_state, DIRECTIVE
+from source_buffer import SourceBuffer
 from utils import search_end
 
 
-def setvar(lines: List[str], line_index: int, context: Context) -> int:
-    pass
+def setvar(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    # '@setvar NAME = EXPRESSION' or '@setvar const NAME = EXPRESSION'
+    target, assign, text = tokenize(lines[line_index]).text.partition('=')
+    *qualifiers, identifier = target.split() or ['']
+    if not assign or not identifier.isidentifier() or not text.strip() or qualifiers not in ([], ["const"]):
+        raise DirectiveSyntaxError("setvar::expected '@setvar [const] NAME = EXPRESSION'", context.base_line)
+    var = context.vars_table.vars.get(identifier)
+    if isinstance(var, dict) and "const" in var.get("qualifiers", ()):
+        raise DirectiveSyntaxError(f"setvar::variable '{identifier}' is const", context.base_line)
+
+    from expression import Evaluator    # ast is imported only by units using expressions
+    value = Evaluator.of(context).evaluate(text)
+    if qualifiers:
+        context.vars_table.add(value, identifier, qualifiers)
+    else:
+        context.vars_table.set(identifier, value)
+    del lines[line_index]
+    return line_index
 
 
-def invisible(lines: List[str], line_index: int, context: Context) -> int:
+def invisible(lines: SourceBuffer, line_index: int, context: Context) -> int:
     # @invisible ~ @repeat 0
-    lines[line_index] = f"{directive_prefix}repeat {0}"
-    return repeat(lines, line_index, context)
+    return expand_block(lines, line_index, 0, context)
 
 
-def mirror(lines: List[str], line_index: int, context: Context) -> int:
+def mirror(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
-def repeat(lines: List[str], line_index: int, context: Context) -> int:
+def repeat(lines: SourceBuffer, line_index: int, context: Context) -> int:
+    # '@repeat N' or '@repeat N as name', N is a number or a macro defined as number
+    args = tokenize(lines[line_index]).args
+    if len(args) not in (1, 3) or len(args) == 3 and (args[1] != "as" or not args[2].isidentifier()):
+        raise DirectiveSyntaxError("repeat::expected '@repeat N' or '@repeat N as name'", context.base_line)
+    count = context.macro_table.expand(args[0]).strip()
+    if not count.isdigit():
+        raise DirectiveSyntaxError(f"repeat::count must be a non-negative integer, got '{count}'",
+                                   context.base_line, argument=0)
+    return expand_block(lines, line_index, int(count), context, args[2] if len(args) == 3 else None)
+
+def expand_block(lines: SourceBuffer,
+                 line_index: int,
+                 count: int,
+                 context: Context,
+                 counter: str | None = None) -> int:
+    """
+    replaces block opened at line_index with its body repeated count times,
+    the body isn't copied, see SourceBuffer.repeated; directives of the
+    repeated body (nested blocks, includes, conditions) are handled next
+    :param counter: name replaced by iteration number in body lines
+    """
     end_index = search_end(lines, line_index)
     if end_index == -1:
         raise DirectiveSyntaxError("utils.search_end::Missed 'end' directive", context.base_line)
-    lines[line_index:end_index+1] = lines[line_index+1:end_index] * 5
-    return line_index + 5 * (end_index-line_index-1)
-
-def random(lines: List[str], line_index: int, context: Context) -> int:
+    size = count * (end_index - line_index - 1)
+    limit = getattr(context.config, "repeat_limit", None)
+    if limit is not None and size > limit:
+        raise ExpansionLimitError(f"repeat::{size} lines exceed the limit of {limit}, see '--repeat-limit'",
+                                  context.base_line)
+    lines[line_index:end_index+1] = lines.repeated(line_index+1, end_index, count, counter, directive_prefix)
+    return line_index
+
+def random(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
-def debug(lines: List[str], line_index: int, context: Context) -> int:
+def debug(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
-def info(lines: List[str], line_index: int, context: Context) -> int:
+def info(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
-def warning(lines: List[str], line_index: int, context: Context) -> int:
+def warning(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
-def error(lines: List[str], line_index: int, context: Context) -> int:
+def error(lines: SourceBuffer, line_index: int, context: Context) -> int:
     pass
 
 
 directive_prefix = "@"  # space-free prefix
 
 handlers = {
+    f"{directive_prefix}setvar"     : setvar,
     f"{directive_prefix}invisible"  : invisible,
     f"{directive_prefix}mirror"     : mirror,
     f"{directive_prefix}repeat"     : repeat,
@@ -54,18 +100,83 @@ handlers = {
     f"{directive_prefix}error"      : error
 }
 
+# directives whose body is closed by 'end' directive
+block_directives = {
+    f"{directive_prefix}invisible",
+    f"{directive_prefix}repeat"
+}
+end_directive = "end"
+
+# directive name (without prefix) -> handler, rebuilt from 'handlers'
+_dispatch: dict[str, Callable[[list[str], int, Context], int]] = {}
+_blocks: set[str] = set()
+
+
+class PluginSpec:
+    """ handler given as 'module:function', the module is imported on first use of directive """
+    __slots__ = ("module", "function")
+
+    def __init__(self, target: str):
+        module, _, function = target.partition(':')
+        if not module or not function:
+            raise ValueError(f"plugin target must be 'module:function', got '{target}'")
+        self.module = module.strip()
+        self.function = function.strip()
+
+    def load(self) -> Callable[[list[str], int, Context], int]:
+        return getattr(importlib.import_module(self.module), self.function)
+
+    def __repr__(self):
+        return f"{self.module}:{self.function}"
+
+
+# manifest entry: 'module:function' optionally followed by '[block]'
+_manifest_entry = re.compile(r"\s*([\w.]+\s*:\s*[\w.]+)\s*(?:\[\s*(block)\s*\])?\s*$")
+
+
+def register_plugin(directive: str, entry: str, *, block: bool = False) -> None:
+    """
+    registers handler by manifest entry without importing it:
+        register_plugin("jump", "core.plugins.jump:jump")
+        register_plugin("loop", "my_plugins.loop:loop [block]")
+    """
+    match = _manifest_entry.match(entry)
+    if match is None:
+        raise ValueError(f"invalid plugin entry for '{directive}': '{entry}'")
+    register_handler(directive, PluginSpec(match.group(1)),
+                     overwrite=True, block=block or match.group(2) is not None)
+
+
+def _load_plugin(name: str) -> Callable[[list[str], int, Context], int]:
+    directive = directive_prefix + name
+    spec = handlers[directive]
+    try:
+        handler = spec.load()
+    except (ImportError, AttributeError) as e:
+        raise PreprocessorError(f"plugin '{directive}' can't be loaded from '{spec}': {e}")
+    # module may register handler itself while imported
+    handlers[directive] = handler
+    _rebuild_dispatch()
+    return handler
+
 
 def register_handler(
         directive: str,
         handler: Callable[[list[str], int, Context], int],
         *,
-        overwrite: bool=False
+        overwrite: bool=False,
+        block: bool=False
 ) -> None:
+    """
+    :param block: directive opens a block closed by 'end' directive
+    """
 
     if not directive.startswith(directive_prefix):
         directive = directive_prefix + directive
 
-    if directive in handlers:
+    if isinstance(handlers.get(directive), PluginSpec):
+        overwrite = True    # loaded plugin replaces its manifest entry
+    elif directive in handlers:
         print(f"Directive '{directive}' already registered")
         if overwrite:
             print(f"Directive '{directive}' overwritten.")
@@ -74,6 +185,9 @@ def register_handler(
             return
 
     handlers[directive] = handler
+    if block:
+        block_directives.add(directive)
+    _rebuild_dispatch()
 
 
 def unregister_handler(directive: str) -> None:
@@ -85,25 +199,176 @@ def unregister_handler(directive: str) -> None:
         raise ValueError(f"Directive '{directive}' isn't registered")
 
     handlers.pop(directive)
-
-
-def is_directive(line: str, directive: str | None = None) -> bool:
-    stripped = line.strip()
-    if directive is not None:
-        if not directive.startswith(directive_prefix):
-            directive = directive_prefix + directive
-        return stripped.startswith(directive)
+    block_directives.discard(directive)
+    _rebuild_dispatch()
+
+
+def _rebuild_dispatch() -> None:
+    """
+    compiles handlers table into name-keyed dispatch index,
+    must be called after every change of handlers table
+    """
+    _dispatch.clear()
+    for directive, handler in handlers.items():
+        _dispatch[directive[len(directive_prefix):]] = handler
+
+    _blocks.clear()
+    _blocks.update(d[len(directive_prefix):] for d in block_directives if d in handlers)
+
+
+def directive_name(line: str) -> str | None:
+    """ returns prefix-free name of directive line, registered or not """
+    tokens = tokenize(line)
+    return tokens.name if tokens.kind == DIRECTIVE else None
+
+
+def is_registered(line: str) -> bool:
+    """ line is a directive with handler, other '@name' lines are code, e.g. decorators """
+    return directive_name(line) in _dispatch
+
+
+def is_block_opener(line: str) -> bool:
+    return directive_name(line) in _blocks
+
+
+def is_block_end(line: str) -> bool:
+    return directive_name(line) == end_directive
+
+
+def match_directive(line: str) -> Callable[[list[str], int, Context], int] | None:
+    """
+    classifies line and returns its handler in one pass
+    :param line: source line
+    :return: registered handler or None for non-directive line
+    """
+    tokens = tokenize(line)
+    if tokens.kind != DIRECTIVE:
+        return None
+    handler = _dispatch.get(tokens.name)
+    if handler.__class__ is PluginSpec:
+        handler = _load_plugin(tokens.name)
+    return handler
+
+
+def skip_plain(lines: list[str], index: int) -> int:
+    """
+    skips lines known to hold no directive (mapped input, see mapped_source.py)
+    :return: first index at or after given one which has to be checked
+    """
+    locate = getattr(lines, "locate", None)   # plain lists are accepted too
+    if locate is None:
+        return index
+    while index < len(lines):
+        piece, offset = locate(index)
+        next_mark = getattr(piece.lines, "next_mark", None)
+        if next_mark is None:
+            break
+        begin = piece.start + offset
+        mark = next_mark(begin, piece.start + piece.length)
+        index += mark - begin
+        if mark < piece.start + piece.length:
+            break
+    return index
+
+
+def _marked_lines(lines: SourceBuffer, start: int, stop: int) -> Iterator[tuple[int, str]]:
+    """ yields (index, line) of lines[start:stop], skips unmarked mapped lines """
+    index = start
+    for piece in lines.view(start, stop).pieces():
+        for offset, line in _piece_lines(piece):
+            yield index + offset, line
+        index += piece.length
+
+
+def _piece_lines(piece) -> Iterator[tuple[int, str]]:
+    """ yields (offset, line) of lines of piece, skips unmarked mapped lines """
+    end = piece.start + piece.length
+    next_mark = getattr(piece.lines, "next_mark", None)
+    if next_mark is None:
+        yield from enumerate(piece.lines[piece.start:end])
     else:
-        return any(stripped.startswith(handler) for handler in handlers)
+        mark = next_mark(piece.start, end)
+        while mark < end:
+            yield mark - piece.start, piece.lines[mark]
+            mark = next_mark(mark + 1, end)
+
+
+def candidate_lines(lines: SourceBuffer, start: int, stop: int) -> Iterator[tuple[int, str]]:
+    """
+    yields (index, line) of directive lines of lines[start:stop], registered or not,
+    lines inside triple-quoted strings are skipped, lines[start] is out of strings
+    """
+    state = None
+    for index, line in _marked_lines(lines, start, stop):
+        if state is None:
+            tokens = tokenize(line)
+            if tokens.kind == DIRECTIVE:
+                yield index, line
+                if tokens.name in _dispatch:
+                    continue    # replaced, other ones are code like decorators
+        state = string_state(line, state)
+
+
+def strings_after(lines: SourceBuffer, start: int, stop: int, state: str | None = None) -> str | None:
+    """ string state after lines[start:stop] which are code, see lexer.string_state """
+    for _, line in _marked_lines(lines, start, stop):
+        state = string_state(line, state)
+    return state
+
+
+def piece_strings_after(piece, state: str | None = None) -> str | None:
+    """ string state after lines of piece which are code, see strings_after """
+    for _, line in _piece_lines(piece):
+        state = string_state(line, state)
+    return state
+
+
+def next_directive(lines: list[str], index: int, state: str | None = None) -> tuple[int, str | None]:
+    """
+    :param state: string state before lines[index], see lexer.string_state
+    :return: index of first directive line at or after given one, len(lines) if there is none,
+             and string state before it
+    """
+    while True:
+        index = skip_plain(lines, index)
+        if index >= len(lines):
+            return index, state
+        line = lines[index]
+        if state is None and match_directive(line) is not None:
+            return index, state
+        state = string_state(line, state)
+        index += 1
 
 
-def get_handler(line: str) -> Callable[[List[str], int, Context], int]:
-    name = line.split()[0].strip()
-    if name not in handlers:
+def is_directive(line: str, directive: str | None = None) -> bool:
+    if directive is None:
+        return match_directive(line) is not None
+
+    tokens = tokenize(line)
+    if tokens.kind != DIRECTIVE:
+        return False
+    if directive.startswith(directive_prefix):
+        directive = directive[len(directive_prefix):]
+    return tokens.name.startswith(directive)
+
+
+def get_handler(line: str) -> Callable[[list[str], int, Context], int]:
+    handler = match_directive(line)
+    if handler is None:
+        tokens = tokenize(line)
+        name = directive_prefix + tokens.name if tokens.kind == DIRECTIVE else line.strip()
         raise ValueError(f"No handler registered as '{name}'")
-    return handlers[name]
+    return handler
+
 
+_rebuild_dispatch()
 
 """ vvv All handlers must be registered here vvv """
-import include
-import core.plugins.register    # preprocessor API plugins
\ No newline at end of file
+register_plugin("include", "include:include")
+register_plugin("if", "conditional:ifpp [block]")
+for _directive, _function in (("elif", "branch"), ("else", "branch"), ("define", "define"), ("undef", "undef")):
+    register_plugin(_directive, f"conditional:{_function}")
+
+from core.plugins.register import plugins    # manifest of preprocessor API plugins
+for _directive, _entry in plugins.items():
+    register_plugin(_directive, _entry)
\ No newline at end of file
@@ -1,44 +1,50 @@
 import re
-import sys
 import os
-from typing import List
-
 import handlers
 from context import Context
+from include_cache import IncludeCache, file_stamp, read_source
+from source_buffer import SourceBuffer
+from core.preprocessor.lexer import tokenize, string_state
 from errors import (
     DirectiveSyntaxError,
     UnexpectedFileError,
-    SelfReferenceError,
-    PreprocessorError
+    SelfReferenceError
 )
 
 
-def include(lines: List[str],
+def include(lines: SourceBuffer,
             line_index: int,
             context: Context) -> int:
     to_include = read_arg(lines[line_index])
     path_chain = []
 
     if not is_valid_filename(to_include):
-        raise DirectiveSyntaxError(f"Include::Invalid filename: '{to_include}'", context.base_line)
+        raise DirectiveSyntaxError(f"Include::Invalid filename: '{to_include}'", context.base_line, argument=0)
     if not file_exists(to_include):
         raise UnexpectedFileError("checkout given filenames", to_include, context.base_line)
 
-    try:
-        includes = collect_includes(to_include, path_chain, context)
-        lines[line_index:line_index+1] = includes
-        return line_index
-    except PreprocessorError as e:
-        e.line_num = context.base_line
-        print(e.what(lines), sys.stderr)
-        return -1
+    workers = getattr(context.config, "include_workers", 1)
+    with context.span("include expansion", "phase"):
+        if workers > 1:
+            if context.include_resolver is None:
+                from include_resolver import IncludeResolver    # asyncio is slow to import
+                context.include_resolver = IncludeResolver(context, workers)
+                context.include_resolver.prefetch(lines, line_index)
+            entry = context.include_resolver.resolve(to_include)
+        else:
+            entry = expand_include(to_include, path_chain, context)
+    context.dependencies.add(os.path.abspath(to_include))
+    context.dependencies.update(entry.includes)
+    includer, line = lines.origin(line_index)
+    context.include_graph.add(os.path.abspath(includer), line + 1, os.path.abspath(to_include))
+    context.include_graph.update(entry.edges)
+    lines[line_index:line_index+1] = entry.lines.included(includer, line)
+    return line_index
 
 
 def read_arg(line: str) -> str:
-    match = re.search(r'include\s+(?:"([^"]+)"|\'([^\']+)\'|(\S+))', line)
-    if match:
-        return match.group(1) or match.group(2) or match.group(3)
-    return ''
+    args = tokenize(line).args
+    return args[0] if args else ''
 
 
 def is_include(line: str) -> bool:
@@ -62,29 +68,63 @@ def file_exists(filename: str) -> bool:
 
 def collect_includes(to_include: str,
                      path_chain: list[str],
-                     context: Context) -> list[str]:
-    if to_include in path_chain:
+                     context: Context) -> SourceBuffer:
+    """
+    :param to_include: included filename
+    :param path_chain: absolute paths of files being expanded
+    :return: expanded file content, shared with include cache
+    """
+    return expand_include(to_include, path_chain, context).lines.copy()
+
+
+def expand_include(to_include: str,
+                   path_chain: list[str],
+                   context: Context) -> IncludeCache.Entry:
+    path = os.path.abspath(to_include)
+    if path in path_chain:
         raise SelfReferenceError(f"Cyclic include detected. Path chain: {path_chain}", to_include)
 
-    with open(to_include, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    path_chain.append(to_include)
-
-    i = 0
+    cache = context.include_cache
+    entry = cache.get(path)
+    if entry is not None:
+        if entry.includes.intersection(path_chain):
+            # cached expansion reaches a file being expanded right now
+            raise SelfReferenceError(f"Cyclic include detected. Path chain: {path_chain + [path]}", to_include)
+        return entry
+
+    stamp = file_stamp(path)
+    lines, digest = read_source(path, to_include, handlers.directive_prefix, cache.check_hash)
+    if context.profiler is not None:
+        context.profiler.add_bytes(stamp[1])
+    includes = set()
+    stamps = {path: (stamp, digest)}
+    edges = []
+    path_chain.append(path)
+
+    i = handlers.skip_plain(lines, 0)
+    state = None    # see lexer.string_state
     while i < len(lines):
-        if is_include(lines[i]):
-            path = read_arg(lines[i])
-            if path == '':
+        if state is None and is_include(lines[i]):
+            child = read_arg(lines[i])
+            if child == '':
                 raise UnexpectedFileError("include::invalid path syntax", to_include)
 
-            included_lines = collect_includes(path, path_chain, context)
-            lines[i:i+1] = included_lines
-            i += len(included_lines)
+            line = lines.origin(i)[1]   # children before are spliced already
+            child_entry = expand_include(child, path_chain, context)
+            includes.add(os.path.abspath(child))
+            includes.update(child_entry.includes)
+            stamps.update(child_entry.stamps)
+            edges.append((path, line + 1, os.path.abspath(child)))
+            edges.extend(child_entry.edges)
+            lines[i:i+1] = child_entry.lines.included(to_include, line)
+            i += len(child_entry.lines)
         else:
+            state = string_state(lines[i], state)
             i += 1
+        i = handlers.skip_plain(lines, i)
 
     path_chain.pop()
-    return lines
+    return cache.put(path, lines, includes, stamps, tuple(edges))
 
 
 handlers.register_handler("include", include)
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+In this file, the cache of expanded include files is defined.
+
+Entries are keyed by absolute path and validated by (mtime, size)
+of the file and of every file it includes transitively. With
+'--include-hash' content hashes are compared as well: an edit keeping
+the stamp is detected, a file only touched is still valid.
+"""
+import io
+import os
+
+from include_graph import Edge
+from mapped_source import map_source
+from source_buffer import SourceBuffer
+
+
+def file_stamp(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(path: str) -> str:
+    from hashlib import sha256  # imported only if digests are used, it is slow to import
+    with open(path, 'rb') as f:
+        return sha256(f.read()).hexdigest()
+
+
+def read_source(path: str,
+                filename: str,
+                prefix: str,
+                with_digest: bool = False) -> tuple[SourceBuffer, str | None]:
+    """
+    reads file lines with universal newlines, like readlines(),
+    the file is memory mapped if possible, see mapped_source.py
+    :param filename: name stored in buffer for origins
+    :param prefix: directive prefix
+    :return: lines and sha256 of raw content if requested
+    """
+    mapped = map_source(path, filename, prefix, with_digest)
+    if mapped is not None:
+        return mapped
+
+    if not with_digest:
+        with open(path, 'r', encoding='utf-8') as f:
+            return SourceBuffer(f.readlines(), filename), None
+
+    from hashlib import sha256
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text = io.StringIO(raw.decode('utf-8'), newline=None)
+    return SourceBuffer(text.readlines(), filename), sha256(raw).hexdigest()
+
+
+class IncludeCache:
+
+    class Entry:
+        __slots__ = ("lines", "includes", "stamps", "edges")
+
+        def __init__(self,
+                     lines: SourceBuffer,
+                     includes: frozenset[str],
+                     stamps: dict[str, tuple[tuple[int, int], str | None]],
+                     edges: tuple[Edge, ...] = ()):
+            self.lines = lines          # expanded content, shared by every include
+            self.includes = includes    # absolute paths included transitively
+            self.stamps = stamps        # path -> ((mtime_ns, size), digest)
+            self.edges = edges          # include graph edges inside the file, transitive
+
+        def __repr__(self):
+            return f"Entry(lines={len(self.lines)}, includes={sorted(self.includes)})"
+
+    def __init__(self, check_hash: bool = False):
+        self.entries: dict[str, IncludeCache.Entry] = {}
+        self.check_hash = check_hash
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> "IncludeCache.Entry | None":
+        """
+        :param path: absolute path of included file
+        :return: valid entry or None, counts hit or miss
+        """
+        entry = self.entries.get(path)
+        if entry is None or not self._is_valid(entry):
+            self.entries.pop(path, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self,
+            path: str,
+            lines: SourceBuffer,
+            includes: set[str],
+            stamps: dict[str, tuple[tuple[int, int], str | None]],
+            edges: tuple[Edge, ...] = ()) -> "IncludeCache.Entry":
+        entry = self.Entry(lines, frozenset(includes), stamps, edges)
+        self.entries[path] = entry
+        return entry
+
+    def _is_valid(self, entry: "IncludeCache.Entry") -> bool:
+        for path, (stamp, digest) in entry.stamps.items():
+            try:
+                current = file_stamp(path)
+            except OSError:
+                return False
+            if current == stamp and not self.check_hash:
+                continue
+            if digest is None or file_digest(path) != digest:
+                return False
+            entry.stamps[path] = (current, digest)   # touched, content is the same
+        return True
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,98 @@
+"""
+In this file, the include graph of a translation unit is defined.
+
+Every @include processed for the unit adds an edge
+(including file, line of directive, included file) to the graph of
+its context, edges of cached include expansions are replayed from the
+cache. The graph is exported as a make dependency file ('-M', '-MD')
+or as JSON ('--include-graph'), so build tools can skip units whose
+dependencies haven't changed without running the compiler.
+"""
+import os
+from collections.abc import Iterable, Iterator
+
+# (absolute path of including file, 1-based line, absolute path of included file)
+Edge = tuple[str, int, str]
+
+
+class IncludeGraph:
+
+    def __init__(self, root: str = ""):
+        self.root = os.path.abspath(root) if root else ""
+        self.edges: dict[str, list[tuple[int, str]]] = {}
+        self._seen: set[Edge] = set()
+
+    def add(self, includer: str, line: int, included: str) -> None:
+        edge = (includer, line, included)
+        if edge not in self._seen:
+            self._seen.add(edge)
+            self.edges.setdefault(includer, []).append((line, included))
+
+    def update(self, edges: Iterable[Edge]) -> None:
+        for edge in edges:
+            self.add(*edge)
+
+    def __iter__(self) -> Iterator[Edge]:
+        for includer, targets in self.edges.items():
+            for line, included in targets:
+                yield includer, line, included
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def files(self) -> list[str]:
+        """ :return: root followed by included files in order of first inclusion """
+        files = dict.fromkeys([self.root] if self.root else [])
+        for includer, _, included in self:
+            files.setdefault(includer)
+            files.setdefault(included)
+        return list(files)
+
+    def to_json(self, target: str) -> dict:
+        return {
+            "input": self.root,
+            "target": os.path.abspath(target),
+            "files": self.files(),
+            "edges": [{"from": includer, "line": line, "to": included} for includer, line, included in self]
+        }
+
+    def write_json(self, filename: str, target: str) -> None:
+        import json
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(target), f, indent=1)
+            f.write('\n')
+
+    def make_rule(self, target: str) -> str:
+        """
+        :return: make rule of target depending on all files of graph,
+                 followed by empty rules of included files, so deleted
+                 ones don't break the build (like 'gcc -MP')
+        """
+        files = [_make_path(path) for path in self.files()]
+        lines = [f"{_make_path(target)}:"]
+        for path in files:
+            lines[-1] += " \\"
+            lines.append(f" {path}")
+        rule = "\n".join(lines) + "\n"
+        for path in files[1:] if self.root else files:
+            rule += f"\n{path}:\n"
+        return rule
+
+    def write_depfile(self, filename: str | None, target: str) -> None:
+        """ :param filename: dependency file, stdout if None """
+        if filename is None:
+            print(self.make_rule(target), end='')
+            return
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(self.make_rule(target))
+
+
+def _make_path(path: str) -> str:
+    """ relative to working directory when below it, escaped for make """
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:  # other drive
+        relative = os.pardir
+    if not relative.startswith(os.pardir):
+        path = relative
+    return path.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
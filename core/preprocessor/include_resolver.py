@@ -0,0 +1,142 @@
+"""
+In this file, the asynchronous include resolver is defined.
+
+An included file is scanned for @include directives first, then all
+its direct children are read concurrently (asyncio on top of a thread
+pool) and expanded the same way, and finally they are spliced in
+source order. Wide include fan-outs on network or cold filesystems
+wait for the slowest file instead of the sum of all of them.
+Includes of the processed source itself are run one by one by the
+include handler, so their files are prefetched when the resolver is
+created.
+
+Errors are raised in source order, after all children of a file are
+done, so the reported error doesn't depend on which file was read
+first. Cycles are detected by the chain of files being expanded, like
+in include.expand_include.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import handlers
+from context import Context
+from errors import SelfReferenceError, UnexpectedFileError
+from include import is_include, read_arg
+from include_cache import IncludeCache, file_stamp, read_source
+from source_buffer import SourceBuffer
+
+# worker count -> pool, shared by all units of process
+_executors: dict[int, ThreadPoolExecutor] = {}
+
+
+def executor(workers: int) -> ThreadPoolExecutor:
+    if workers not in _executors:
+        _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="include")
+    return _executors[workers]
+
+
+class FileLoader:
+    """ reads files in thread pool, each file once per resolution """
+
+    def __init__(self, pool: ThreadPoolExecutor, check_hash: bool):
+        self.pool = pool
+        self.check_hash = check_hash
+        self._reads: dict[str, asyncio.Future] = {}
+
+    def read(self, loop: asyncio.AbstractEventLoop, path: str, filename: str) -> asyncio.Future:
+        """
+        starts reading, the file is read even while loop isn't running
+        :return: future of (stamp, lines, digest) or of OSError,
+                 lines are shared, copy them before splicing
+        """
+        future = self._reads.get(path)
+        if future is None:
+            future = loop.run_in_executor(self.pool, self._read, path, filename)
+            self._reads[path] = future
+        return future
+
+    def _read(self, path: str, filename: str):
+        # error is returned, prefetched file may never be awaited
+        try:
+            stamp = file_stamp(path)
+            lines, digest = read_source(path, filename, handlers.directive_prefix, self.check_hash)
+        except OSError as e:
+            return e
+        return stamp, lines, digest
+
+
+class IncludeResolver:
+    """ one per unit, see Context.include_resolver """
+
+    def __init__(self, context: Context, workers: int):
+        self.context = context
+        self.loader = FileLoader(executor(workers), context.include_cache.check_hash)
+        self.loop = asyncio.new_event_loop()
+
+    def prefetch(self, lines: SourceBuffer, start: int) -> None:
+        """ starts reading files included by lines[start:] which aren't cached """
+        cache = self.context.include_cache
+        for _, line in handlers.candidate_lines(lines, start, len(lines)):
+            if is_include(line):
+                child = read_arg(line)
+                path = os.path.abspath(child)
+                if child and path not in cache.entries:
+                    self.loader.read(self.loop, path, child)
+
+    def resolve(self, to_include: str) -> IncludeCache.Entry:
+        """ expands included file, the result is stored in include cache """
+        return self.loop.run_until_complete(self._expand(to_include, ()))
+
+    def close(self) -> None:
+        self.loop.close()
+
+    async def _expand(self, to_include: str, path_chain: tuple[str, ...]) -> IncludeCache.Entry:
+        path = os.path.abspath(to_include)
+        if path in path_chain:
+            raise SelfReferenceError(f"Cyclic include detected. Path chain: {list(path_chain)}", to_include)
+
+        cache = self.context.include_cache
+        entry = cache.get(path)
+        # cached expansion reaching a file being expanded is expanded again,
+        # so the cycle is reported at the same place as without cache
+        if entry is not None and not entry.includes.intersection(path_chain):
+            return entry
+
+        result = await self.loader.read(self.loop, path, to_include)
+        if isinstance(result, OSError):
+            raise result
+        stamp, lines, digest = result
+        lines = lines.copy()
+        if self.context.profiler is not None:
+            self.context.profiler.add_bytes(stamp[1])
+
+        directives = [(i, read_arg(line)) for i, line in handlers.candidate_lines(lines, 0, len(lines))
+                      if is_include(line)]
+        chain = path_chain + (path,)
+        results = iter(await asyncio.gather(
+            *(self._expand(child, chain) for _, child in directives if child),
+            return_exceptions=True
+        ))
+
+        children = []
+        for i, child in directives:
+            if child == '':
+                raise UnexpectedFileError("include::invalid path syntax", to_include)
+            result = next(results)
+            if isinstance(result, BaseException):
+                raise result
+            children.append((i, child, result))
+
+        includes = set()
+        stamps = {path: (stamp, digest)}
+        edges = []
+        for i, child, child_entry in children:
+            includes.add(os.path.abspath(child))
+            includes.update(child_entry.includes)
+            stamps.update(child_entry.stamps)
+            edges.append((path, i + 1, os.path.abspath(child)))
+            edges.extend(child_entry.edges)
+        for i, _, child_entry in reversed(children):   # splices don't move earlier lines
+            lines[i:i+1] = child_entry.lines.included(to_include, i)
+        return cache.put(path, lines, includes, stamps, tuple(edges))
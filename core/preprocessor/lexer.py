@@ -0,0 +1,190 @@
+"""
+In this file, the lexer of preprocessor lines is defined.
+
+A line is classified once into its kind, directive name, arguments and
+their column spans; handlers and error reporting take all of them from
+tokenize() instead of scanning the line again. Arguments of directives
+are split by a ply lexer, so quoted ones may hold spaces, '@' and '#',
+and a '#' outside of quotes starts a comment which is not an argument.
+
+    @include "my file.ppy"  # comment
+    ^^^^^^^^ ^^^^^^^^^^^^^  ^^^^^^^^^
+    name     argument       comment
+
+Adjacent tokens form one argument like words of a shell command. Results
+are cached by line text, equal lines share one LineTokens. Arguments
+without quotes and '#' are plain words and are split without ply, which
+is imported with the first line needing it.
+
+A line is classified alone, a directive-like line may be a line of a
+triple-quoted string. string_state() carries the string opened by lines
+before, dispatch takes lines inside a string as code:
+
+    '''                     string_state -> "'''"
+    @include "x.ppy"        not a directive, output as it is
+    '''                     string_state -> None
+"""
+import re
+from functools import lru_cache
+from threading import Lock
+
+DIRECTIVE = "directive"     # '@name ...', directive or decorator
+COMMENT = "comment"
+BLANK = "blank"
+CODE = "code"
+
+
+class LineTokens:
+    __slots__ = ("kind", "name", "args", "spans", "text", "comment")
+
+    def __init__(self,
+                 kind: str,
+                 name: str | None = None,
+                 args: tuple[str, ...] = (),
+                 spans: tuple[tuple[int, int], ...] = (),
+                 text: str = "",
+                 comment: int = -1):
+        self.kind = kind
+        self.name = name        # directive name without prefix
+        self.args = args        # arguments, quotes of single string ones removed
+        self.spans = spans      # (begin, end) columns of name followed by ones of arguments
+        self.text = text        # argument text without comment, stripped
+        self.comment = comment  # column of comment or -1
+
+    def span(self, argument: int | None = None) -> tuple[int, int]:
+        """ :return: columns of argument, of directive name if None or missing """
+        if argument is None or argument + 1 >= len(self.spans):
+            return self.spans[0] if self.spans else (0, 0)
+        return self.spans[argument + 1]
+
+    def __repr__(self):
+        return f"LineTokens({self.kind!r}, name={self.name!r}, args={self.args}, comment={self.comment})"
+
+
+def _rule(regex: str):
+    """ like ply.lex.TOKEN, rules don't depend on docstrings kept by -OO """
+    def decorate(function):
+        function.regex = regex
+        return function
+    return decorate
+
+
+class _Rules:
+    """ ply rules of directive arguments, functions are tried in order of definition """
+    tokens = ("STRING", "COMMENT", "WORD")
+    t_ignore = " \t\r\n\f\v"
+
+    @_rule(r"""[rRbBuUfF]{0,2}("([^"\\\n]|\\.)*"|'([^'\\\n]|\\.)*')""")
+    def t_STRING(self, t):
+        return t
+
+    @_rule(r"\#.*")
+    def t_COMMENT(self, t):
+        return t
+
+    @_rule(r"""[^\s"'#]+|["']""")   # unclosed quote is a word
+    def t_WORD(self, t):
+        return t
+
+    def t_error(self, t):   # unreachable, every character is matched
+        t.lexer.skip(1)
+
+
+_lexer = None
+_lock = Lock()      # ply lexer holds its input, lines of parallel units are split one by one
+
+
+def _tokens(text: str):
+    global _lexer
+    with _lock:
+        if _lexer is None:
+            from ply import lex
+            _lexer = lex.lex(object=_Rules(), errorlog=lex.NullLogger())
+        _lexer.input(text)
+        return list(iter(_lexer.token, None))
+
+
+_quoted = re.compile(r"""["'#]""")
+_word = re.compile(r"\S+")
+_blank = LineTokens(BLANK)
+_code = LineTokens(CODE)
+
+
+@lru_cache(maxsize=4096)
+def tokenize(line: str) -> LineTokens:
+    stripped = line.lstrip()
+    if not stripped:
+        return _blank
+    indent = len(line) - len(stripped)
+    prefix = handlers.directive_prefix
+    if stripped.startswith('#'):
+        return LineTokens(COMMENT, comment=indent)
+    if not stripped.startswith(prefix) or len(stripped) == len(prefix) or stripped[len(prefix)].isspace():
+        return _code
+
+    begin = indent + len(prefix)
+    end = begin
+    while end < len(line) and not line[end].isspace():
+        end += 1
+
+    args, spans, comment = [], [(begin, end)], -1
+    if not _quoted.search(line, end):     # words only, ply isn't needed
+        for word in _word.finditer(line, end):
+            args.append(word.group())
+            spans.append(word.span())
+        return LineTokens(DIRECTIVE, line[begin:end], tuple(args), tuple(spans), line[end:].strip())
+
+    last, run = None, []
+    for token in _tokens(line[end:]) + [None]:
+        position = token.lexpos + end if token is not None else None
+        if run and (token is None or position != last or token.type == "COMMENT"):
+            first = run[0].lexpos + end
+            if len(run) == 1 and run[0].type == "STRING":
+                value = run[0].value
+                value = value[value.find(value[-1]) + 1:-1]     # without prefix and quotes
+            else:
+                value = line[first:last]
+            args.append(value)
+            spans.append((first, last))
+            run = []
+        if token is None:
+            break
+        if token.type == "COMMENT":
+            comment = position
+            break
+        run.append(token)
+        last = position + len(token.value)
+
+    text = line[end:comment if comment != -1 else len(line)].strip()
+    return LineTokens(DIRECTIVE, line[begin:end], tuple(args), tuple(spans), text, comment)
+
+
+_string_token = re.compile(r"""\\.|\"\"\"|'''|["'#]""")
+triple_quotes = ('"""', "'''")
+
+
+def string_state(line: str, state: str | None = None) -> str | None:
+    """
+    :param state: quotes of triple-quoted string open before line, None outside of strings
+    :return: quotes of triple-quoted string open after line
+    """
+    if state is None:
+        if '"' not in line and "'" not in line:
+            return None
+    elif state not in line:
+        return state
+    quote = state
+    for token in _string_token.finditer(line):
+        token = token.group()
+        if quote is None:
+            if token == '#':
+                break
+            if token[0] != '\\':
+                quote = token
+        elif token == quote or token[0] == quote:  # '"a"""' is "a" and ""
+            quote = None
+    return quote if quote in triple_quotes else None    # other strings end with line
+
+
+# imported last, handlers depends on this module
+import handlers
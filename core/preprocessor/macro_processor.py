@@ -1,18 +1,34 @@
 import re
+from functools import lru_cache
+
+from errors import DirectiveSyntaxError
+
+
+_identifier = r"[A-Za-z_]\w*"
+_define_syntax = re.compile(rf"\s*({_identifier})(?:\(\s*((?:{_identifier}\s*(?:,\s*{_identifier}\s*)*)?)\))?(?:=(.*))?\s*$", re.S)
+# string literals and comments are copied as they are, a triple-quoted string may go on after line
+_skipped = (r'"""(?:\\.|[^\\])*?(?:"""|\Z)|\'\'\'(?:\\.|[^\\])*?(?:\'\'\'|\Z)|'
+            r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|#.*')
+# rest of triple-quoted string open before line, by its quotes
+_string_end = {quotes: re.compile(rf"(?:\\.|[^\\])*?{quotes}", re.S) for quotes in ('"""', "'''")}
+
 
 class Macros:
 
     def __init__(self, holder: str, name: str):
-        self.holder = holder
-        self.name = name
-    
-    @staticmethod
-    def replace(line: str) -> str:
-        pass
+        self.holder = holder    # identifier replaced in source
+        self.name = name        # replacement text
+
+    def replace(self, args: list[str] | None = None) -> str:
+        return self.name
 
     @staticmethod
     def is_valid_syntax(line: str) -> bool:
-        pass
+        """ checks definition 'NAME', 'NAME=text' or 'NAME(a, b)=text' """
+        return _define_syntax.match(line) is not None
+
+    def __repr__(self):
+        return f"Macros(holder={self.holder!r}, name={self.name!r})"
 
 
 class ParamMacros(Macros):
@@ -23,23 +39,212 @@ class ParamMacros(Macros):
                  args: list[str]):
         super().__init__(holder, name)
         self.args = args
+        self._params = re.compile(rf"\b(?:{'|'.join(map(re.escape, args))})\b") if args else None
 
-    @staticmethod
-    def replace(line: str) -> str:
-        pass
+    def replace(self, args: list[str] | None = None) -> str:
+        args = args or []
+        if len(args) != len(self.args):
+            raise DirectiveSyntaxError(f"macro '{self.holder}' takes {len(self.args)} arguments, {len(args)} given")
+        if self._params is None:
+            return self.name
+        values = dict(zip(self.args, args))
+        return self._params.sub(lambda m: values[m.group(0)], self.name)
 
     @staticmethod
     def is_valid_syntax(line: str) -> bool:
-        pass
+        match = _define_syntax.match(line)
+        return match is not None and match.group(2) is not None
+
+    def __repr__(self):
+        return f"ParamMacros(holder={self.holder!r}, name={self.name!r}, args={self.args!r})"
+
+
+@lru_cache(maxsize=256)
+def _compile(holders: tuple[str, ...]) -> tuple[re.Pattern, re.Pattern]:
+    """
+    :return: regex rejecting lines without macro identifiers,
+             tokenizer of strings, comments and macro identifiers
+    """
+    names = '|'.join(map(re.escape, holders))
+    return (re.compile(rf"\b(?:{names})\b"),
+            re.compile(rf"(?P<skip>{_skipped})|\b(?P<name>{names})\b"))
+
+
+@lru_cache(maxsize=256)
+def _compile_bytes(holders: tuple[str, ...]) -> re.Pattern:
+    # ASCII word boundaries of bytes patterns are a superset of unicode ones
+    names = b'|'.join(re.escape(holder.encode('utf-8')) for holder in holders)
+    return re.compile(rb"\b(?:" + names + rb")\b")
+
+
+def split_args(text: str, pos: int) -> tuple[list[str], int] | None:
+    """
+    parses call arguments '(a, f(b, c))' starting at pos
+    :return: stripped arguments and position after ')' or None if there is no call
+    """
+    while pos < len(text) and text[pos] in ' \t':
+        pos += 1
+    if pos >= len(text) or text[pos] != '(':
+        return None
+
+    args = []
+    depth = 0
+    start = pos + 1
+    quote = None
+    i = pos
+    while i < len(text):
+        c = text[i]
+        if quote is not None:
+            if c == '\\':
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+            if depth == 0:
+                args.append(text[start:i].strip())
+                return ([] if args == [''] else args), i + 1
+        elif c == ',' and depth == 1:
+            args.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    return None
+
 
 class MacrosTable:
 
     def __init__(self,
                  defines: list[str]):
-        self.table = [Macros(holder, "") for holder in defines]
+        self.table: dict[str, Macros] = {}
+        self.generation = 0     # changed by every define and undef
+        self._patterns = None
+        self._expansions: dict[tuple[str, frozenset[str]], str] = {}   # of object-like macros
+        self.assigned = set()   # symbols defined or undefined by the unit, see is_defined
+        for definition in defines:
+            self.define_from(definition)
+        self.assigned.clear()   # '-D' defines are part of cache keys
+        # symbols looked up before the unit defined or undefined them, part of cache keys
+        self.accessed = set()
+
+    def define(self, holder: str, name: str = "", args: list[str] | None = None) -> None:
+        self.table[holder] = Macros(holder, name) if args is None else ParamMacros(holder, name, args)
+        self.assigned.add(holder)
+        self.generation += 1
+        self._patterns = None
+        self._expansions.clear()
+
+    def define_from(self, definition: str) -> None:
+        """ defines macro given as 'NAME', 'NAME=text' or 'NAME(a, b)=text' """
+        match = _define_syntax.match(definition)
+        if match is None:
+            raise ValueError(f"invalid macro definition: '{definition}'")
+        holder, params, name = match.groups()
+        args = None if params is None else [p.strip() for p in params.split(',') if p.strip()]
+        self.define(holder, name or "", args)
+
+    def undef(self, holder: str) -> None:
+        self.assigned.add(holder)
+        if self.table.pop(holder, None) is not None:
+            self.generation += 1
+            self._patterns = None
+            self._expansions.clear()
 
     def is_defined(self, symbol: str) -> bool:
-        return any([macro.holder == symbol for macro in self.table])
+        if symbol not in self.assigned:
+            self.accessed.add(symbol)
+        return symbol in self.table
+
+    def definition(self, symbol: str) -> str | None:
+        """ representation of macro for cache keys, doesn't mark symbol accessed """
+        macro = self.table.get(symbol)
+        return None if macro is None else repr(macro)
+
+    def _compiled(self) -> tuple[re.Pattern, re.Pattern]:
+        if self._patterns is None:
+            self._patterns = _compile(tuple(sorted(self.table)))
+        return self._patterns
+
+    def bytes_candidates(self) -> re.Pattern:
+        """ bytes regex matching every undecoded line expand() may change """
+        return _compile_bytes(tuple(sorted(self.table)))
+
+    def expand(self, line: str, string: str | None = None) -> str:
+        """
+        returns line with macros expanded, the same object if nothing changed
+        :param string: quotes of triple-quoted string open before line, see lexer.string_state
+        """
+        if not self.table:
+            return line
+        candidates, _ = self._compiled()
+        if candidates.search(line) is None:
+            return line
+        if string is not None:
+            end = _string_end[string].match(line)
+            if end is None:
+                return line
+            rest = line[end.end():]
+            expanded = self.expand(rest)
+            return line if expanded is rest else line[:end.end()] + expanded
+        return self._expand(line, frozenset())
 
     def replace(self, line: str, holder: str) -> str:
-        pass
\ No newline at end of file
+        """ expands only given macro in line """
+        if holder not in self.table:
+            return line
+        return self._expand(line, frozenset(self.table) - {holder}, recursive=False)
+
+    def _expand(self, text: str, guard: frozenset[str], recursive: bool = True) -> str:
+        """
+        :param guard: macros being expanded, they are not expanded again
+        """
+        _, tokens = self._compiled()
+        out = []
+        pos = 0
+        while True:
+            match = tokens.search(text, pos)
+            if match is None:
+                out.append(text[pos:])
+                return ''.join(out)
+
+            out.append(text[pos:match.start()])
+            pos = match.end()
+            holder = match.group("name")
+            if holder is None or holder in guard:
+                out.append(match.group(0))
+                continue
+
+            macro = self.table[holder]
+            if isinstance(macro, ParamMacros):
+                call = split_args(text, pos)
+                if call is None:    # name of function-like macro without call
+                    out.append(holder)
+                    continue
+                args, pos = call
+                if recursive:
+                    args = [self._expand(arg, guard) for arg in args]
+                replacement = macro.replace(args)
+            elif recursive:
+                out.append(self._object_expansion(macro, guard))
+                continue
+            else:
+                replacement = macro.replace()
+
+            out.append(self._expand(replacement, guard | {holder}) if recursive else replacement)
+
+    def _object_expansion(self, macro: Macros, guard: frozenset[str]) -> str:
+        """ expansion of object-like macro depends only on table and guard, it is cached """
+        key = (macro.holder, guard)
+        expansion = self._expansions.get(key)
+        if expansion is None:
+            replacement = macro.replace()
+            candidates, _ = self._compiled()
+            if candidates.search(replacement) is None:
+                expansion = replacement
+            else:
+                expansion = self._expand(replacement, guard | {macro.holder})
+            self._expansions[key] = expansion
+        return expansion
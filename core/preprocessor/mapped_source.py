@@ -0,0 +1,212 @@
+"""
+In this file, the memory mapped input of the Python+ preprocessor is defined.
+
+A source file is mapped instead of read, and bytes-level scans mark
+the lines which may hold a directive (directive prefix after
+indentation) or open or close a triple-quoted string. The file becomes one MappedLines piece of SourceBuffer:
+lines are decoded only when a handler touches them, the preprocessor
+jumps from mark to mark, and lines nobody touched are written to
+output as memoryview slices of the mapping.
+
+Files whose newlines would be translated by text mode ('\\r') and empty
+files are not mapped, the caller reads them as text. A mapped file must
+not be truncated while its lines are in use (include cache holds them).
+"""
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from collections.abc import Iterator, Sequence
+
+from source_buffer import Piece, SourceBuffer
+
+
+_count_chunk = 1 << 20      # bytes copied at once while counting lines
+
+
+# any non-ASCII bytes are taken as possible unicode whitespace, like '\s' of str patterns
+_indent = re.compile(rb"(?:[ \t\f\v\x1c-\x1f]|[\x80-\xff])*")
+
+
+def directive_candidates(data, prefix: bytes) -> Iterator[int]:
+    """ yields byte offsets of lines starting with prefix after indentation or holding triple quotes """
+    last = -1
+    for start in merge(_prefixed(data, prefix), _holding(data, b'"""'), _holding(data, b"'''")):
+        if start != last:
+            yield start
+        last = start
+
+
+def _holding(data, text: bytes) -> Iterator[int]:
+    find = data.find
+    pos = find(text)
+    while pos >= 0:
+        yield data.rfind(b'\n', 0, pos) + 1
+        line_end = find(b'\n', pos)
+        if line_end < 0:
+            return
+        pos = find(text, line_end)
+
+
+def _prefixed(data, prefix: bytes) -> Iterator[int]:
+    find = data.find
+    pos = find(prefix)
+    while pos >= 0:
+        line_start = data.rfind(b'\n', 0, pos) + 1
+        if _indent.fullmatch(data, line_start, pos):
+            yield line_start
+        line_end = find(b'\n', pos)
+        if line_end < 0:
+            return
+        pos = find(prefix, line_end)
+
+
+def _count_newlines(data, begin: int, end: int) -> int:
+    count = 0
+    for pos in range(begin, end, _count_chunk):
+        count += data[pos:min(end, pos + _count_chunk)].count(b'\n')
+    return count
+
+
+def _count_lines(data, begin: int, end: int) -> int:
+    """ number of lines in data[begin:end], the last one may lack newline """
+    count = _count_newlines(data, begin, end)
+    if end > begin and data[end - 1] != ord('\n'):
+        count += 1
+    return count
+
+
+_line = re.compile(r"[^\n]*\n|[^\n]+")
+
+
+def split_lines(text: str) -> list[str]:
+    """ splits like readlines(), only at '\\n' """
+    return _line.findall(text)
+
+
+class MappedLines(Sequence):
+    """
+    lines of byte range of mapped file, decoded on access;
+    only marked lines (directive candidates) may hold a directive
+    """
+    __slots__ = ("data", "begin", "end", "_length", "marks", "_offsets")
+
+    def __init__(self,
+                 data: mmap.mmap,
+                 begin: int,
+                 end: int,
+                 length: int,
+                 marks: array,
+                 mark_offsets: array):
+        """
+        :param marks: ascending indexes of marked lines
+        :param mark_offsets: byte offsets of marked lines
+        """
+        self.data = data
+        self.begin = begin
+        self.end = end
+        self._length = length
+        self.marks = marks
+        # line index -> byte offset, known for marked lines, others are found from the nearest one
+        self._offsets = dict(zip(marks, mark_offsets))
+        self._offsets[0] = begin
+        self._offsets[length] = end
+
+    def offset(self, index: int) -> int:
+        """ returns byte offset of line, 0 <= index <= len(self) """
+        offset = self._offsets.get(index)
+        if offset is not None:
+            return offset
+
+        known = bisect_right(self.marks, index) - 1
+        line = self.marks[known] if known >= 0 else 0
+        offset = self._offsets[line]
+        find = self.data.find
+        while line < index:
+            offset = find(b'\n', offset, self.end) + 1
+            line += 1
+        self._offsets[index] = offset
+        return offset
+
+    def next_mark(self, start: int, stop: int) -> int:
+        """ returns index of first marked line in [start, stop) or stop """
+        i = bisect_left(self.marks, start)
+        return self.marks[i] if i < len(self.marks) and self.marks[i] < stop else stop
+
+    def raw(self, start: int, stop: int) -> memoryview:
+        """ undecoded lines[start:stop], shares memory with mapping """
+        return memoryview(self.data)[self.offset(start):self.offset(stop)]
+
+    def search(self, pattern: re.Pattern, start: int, stop: int) -> bool:
+        """ checks if bytes pattern occurs in lines[start:stop] """
+        return pattern.search(self.data, self.offset(start), self.offset(stop)) is not None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key: int | slice) -> str | list[str]:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                return self[start:max(start, stop)][::step]
+            if start >= stop:
+                return []
+            return split_lines(str(self.raw(start, stop), 'utf-8'))
+
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError("mapped lines index out of range")
+        return str(self.raw(key, key + 1), 'utf-8')
+
+    def __repr__(self):
+        return f"MappedLines(begin={self.begin}, end={self.end}, lines={self._length})"
+
+
+def map_file(path: str) -> mmap.mmap | None:
+    """ returns read-only mapping of file or None if it should be read as text """
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if data.find(b'\r') >= 0:
+        data.close()
+        return None
+    return data
+
+
+def map_source(path: str,
+               filename: str,
+               prefix: str,
+               with_digest: bool = False) -> tuple[SourceBuffer, str | None] | None:
+    """
+    :param filename: name stored in buffer for origins
+    :param prefix: directive prefix, lines starting with it are marked, see directive_candidates
+    :return: buffer and sha256 of content if requested, None if file isn't mapped
+    """
+    data = map_file(path)
+    if data is None:
+        return None
+
+    marks = array('q')
+    mark_offsets = array('q')
+    line = 0
+    pos = 0
+    for start in directive_candidates(data, prefix.encode('utf-8')):
+        line += _count_newlines(data, pos, start)
+        marks.append(line)
+        mark_offsets.append(start)
+        pos = start
+    length = line + _count_lines(data, pos, len(data))
+
+    lines = MappedLines(data, 0, len(data), length, marks, mark_offsets)
+    digest = None
+    if with_digest:
+        from hashlib import sha256  # imported only if digests are used, it is slow to import
+        digest = sha256(data).hexdigest()
+    return SourceBuffer.from_pieces([Piece(lines, 0, length, filename)], filename), digest
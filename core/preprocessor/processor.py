@@ -9,41 +9,238 @@ sys.path.insert(0, core_path)
 
 from cli.cfgparse import parse_args
 from context import Context
-from handlers import is_directive, get_handler
+from handlers import (
+    match_directive, next_directive, directive_name, directive_prefix, strings_after, piece_strings_after
+)
+from core.preprocessor.lexer import string_state
 from errors import PreprocessorError, SourceIndexError
+from include_cache import read_source as read_file
+from mapped_source import MappedLines
+from source_buffer import RepeatedLines, SourceBuffer
+from source_map import SourceMap
+from stream import process_stream
 
 
-def process(args: argparse.Namespace) -> Context:
-    input_file: str = args.input
-    with open(input_file, 'r', encoding='utf-8') as f:
-        source = f.readlines()
+def preprocessed_filename(args: argparse.Namespace) -> str:
+    """ name of '-E' output file """
+    target = args.input if args.output is None else args.output
+    return replace_extension(target, '.i')
+
+
+def compiled_filename(args: argparse.Namespace) -> str:
+    """ name of compiled file """
+    target = args.input if args.output is None else args.output
+    return replace_extension(target, '.py')
+
+
+def write_dependencies(args: argparse.Namespace, context: Context) -> None:
+    """ writes '-M', '-MD' and '--include-graph' outputs of processed unit, built into target of rules """
+    target = preprocessed_filename(args) if args.E else compiled_filename(args)
+    graph = context.include_graph
+    if args.deps_only or args.deps:
+        deps_file = args.deps_file
+        if deps_file is None and args.deps:
+            deps_file = replace_extension(target, '.d')
+        graph.write_depfile(deps_file, target)
+    if args.include_graph is not None:
+        graph.write_json(args.include_graph or replace_extension(target, '.deps.json'), target)
+
+
+def source_map_filename(args: argparse.Namespace) -> str | None:
+    """ name of '--source-map' output file, None if not requested """
+    if args.source_map is None:
+        return None
+    return args.source_map or preprocessed_filename(args) + '.map'
+
+
+def read_source(input_file: str) -> SourceBuffer:
+    source, _ = read_file(input_file, input_file, directive_prefix)
+    return source
+
+
+def expand_macros(source: SourceBuffer, start: int, stop: int, context: Context, state: str | None = None) -> None:
+    """
+    expands macros in lines[start:stop] with one splice except in strings and comments,
+    a failed expansion is reported at its own line
+    :param state: string state before lines[start], see lexer.string_state
+    """
+    macros = context.macro_table
+    if not macros.table:
+        return
+
+    pattern = macros.bytes_candidates()
+
+    def untouched(piece) -> bool:
+        """ mapped lines without macro candidates, also as body of repeated lines """
+        lines = piece.lines
+        if isinstance(lines, RepeatedLines) and not lines.mapped:
+            return all(map(untouched, lines.source.pieces()))
+        return isinstance(lines, MappedLines) and not lines.search(pattern, piece.start, piece.start + piece.length)
+
+    def keep(piece) -> bool:
+        nonlocal state
+        if not untouched(piece):
+            return False
+        if not isinstance(piece.lines, RepeatedLines):     # bodies are taken as closing their strings
+            state = piece_strings_after(piece, state)
+        return True
+
+    def expand(line: str) -> str:
+        nonlocal state
+        expanded = macros.expand(line, state)
+        state = string_state(line, state)
+        return expanded
+
+    try:
+        source.map(start, stop, expand, keep=keep)
+    except PreprocessorError as e:
+        # map reads repeated segments once per body line, so the failed line is searched again
+        for index in range(start, stop):
+            try:
+                macros.expand(source[index])
+            except PreprocessorError:
+                e.line_num = index
+                break
+        raise
 
-    context = Context(args, [], input_file)
+
+def run_directives(source: SourceBuffer, context: Context) -> None:
+    """ applies handlers to source, errors are collected in context """
+    verbose = context.config.verbose
+    if context.profiler is not None:
+        source.listeners.append(context.profiler.on_splice)
     pointer = 0
+    state = None    # triple-quoted string open before pointer, see lexer.string_state
     try:
         while pointer < len(source):
-            if is_directive(source[pointer]):
-                handler = get_handler(source[pointer])
-                if args.verbose:
+            before = state
+            stop, state = next_directive(source, pointer, state)
+            handler = match_directive(source[pointer]) if stop == pointer else None
+            if handler is not None:
+                if verbose:
                     print(f"Processing directive at line {pointer + 1}: {source[pointer].strip()}")
-                pointer = handler(source, pointer, context)
-                if pointer < 0 or pointer > len(source):
-                    raise SourceIndexError(f"invalid index returned: {pointer}", handler)
+                name = directive_prefix + directive_name(source[pointer])
+                start = pointer
+                with context.span(name, "directive", handler):
+                    stop = handler(source, pointer, context)
+                if stop < 0 or stop > len(source):
+                    raise SourceIndexError(f"invalid index returned: {stop}", handler)
+                state = strings_after(source, start, stop)
             else:
-                pointer += 1
+                start = pointer
+
+            # lines skipped by handler are output as they are, except macros
+            try:
+                expand_macros(source, start, stop, context, before)
+            except PreprocessorError as e:
+                pointer = e.line_num
+                raise
+            pointer = stop
     except PreprocessorError as e:
+        # collected for caller, one broken unit must not stop a batch
         e.line_num = pointer
-        print(e.what(source), file=sys.stderr)
-        exit(1)
+        e.source_map = SourceMap.of(source)
+        context.diagnostics.append(e.what(source))
+        context.code = 1
 
-    if args.E:  # preprocess only mode enabled
-        target = input_file if args.output is None else args.output
-        filename = replace_extension(target, '.i')
+
+def write_output(source: SourceBuffer, filename: str) -> None:
+    """
+    mapped lines which weren't touched are written without decoding,
+    output replaces filename when complete, mapped input is never truncated
+    """
+    partial = f"{filename}.{os.getpid()}.part"
+    try:
+        _write_pieces(source, partial)
+        os.replace(partial, filename)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def _write_pieces(source: SourceBuffer, filename: str) -> None:
+    if os.linesep != '\n':     # text mode translates newlines
         with open(filename, 'w', encoding='utf-8') as f:
             f.writelines(source)
+        return
+
+    with open(filename, 'wb') as f:
+        for piece in source.pieces():
+            end = piece.start + piece.length
+            if isinstance(piece.lines, MappedLines):
+                f.write(piece.lines.raw(piece.start, end))
+            elif isinstance(piece.lines, RepeatedLines):
+                for text in piece.lines.text(piece.start, end):
+                    f.write(text.encode('utf-8'))
+            else:
+                f.write(''.join(piece.lines[piece.start:end]).encode('utf-8'))
+
+
+def process(args: argparse.Namespace, include_cache=None, keep_source: bool = False) -> Context:
+    """
+    :param include_cache: IncludeCache shared with other units, e.g. by compile server
+    :param keep_source: processed source is kept as context.source for compiler passes,
+                        the unit is processed buffered then
+    """
+    input_file: str = args.input
+    context = Context(args, args.define, input_file, include_cache=include_cache)
+    # '-M' only checks source
+    filename = preprocessed_filename(args) if args.E and not args.deps_only else None
+    map_filename = source_map_filename(args) if filename is not None else None
+    if filename is not None and os.path.abspath(filename) == os.path.abspath(input_file):
+        context.diagnostics.append(f"preprocessed file '{filename}' would overwrite input, see '-o'")
+        context.code = 1
+        return context
+
+    cache = None
+    if filename is not None and args.cache_dir:
+        from disk_cache import DiskCache
+        cache = DiskCache(args.cache_dir)
+    if cache is not None:
+        cache_key = cache.unit_key(input_file, context)
+        if cache.restore(cache_key, context, filename, map_filename):
+            if args.verbose:
+                print(f"target file {filename} restored from cache")
+            write_dependencies(args, context)
+            return context
+
+    try:
+        if args.stream and not keep_source:
+            with context.span("stream", "phase"):
+                process_stream(context, filename)
+        else:
+            with context.span("read", "phase"):
+                source = read_source(input_file)
+                if context.profiler is not None:
+                    context.profiler.add_bytes(os.path.getsize(input_file))
+            with context.span("directives", "phase"):
+                run_directives(source, context)
+            if keep_source:
+                context.source = source
+            if filename is not None and not context.code:   # preprocess only mode enabled
+                with context.span("write", "phase"):
+                    write_output(source, filename)
+                    if map_filename is not None:
+                        SourceMap.of(source).write(map_filename, filename)
+    finally:
+        if context.include_resolver is not None:
+            context.include_resolver.close()
+
+    if not context.code:
+        write_dependencies(args, context)
+    if filename is not None and not context.code:
+        if cache is not None:
+            cache.store(cache_key, context, filename, map_filename)
         if args.verbose:
             print(f"target file is {filename}")
 
+    if args.verbose:
+        cache = context.include_cache
+        print(f"include cache: {cache.hits} hits, {cache.misses} misses")
+    if context.profiler is not None:
+        context.profiler.report(args.profile, args.profile_output)
+
     return context
 
 
@@ -51,7 +248,11 @@ if __name__ == "__main__":
     try:
         sys.argv = ['processor.py', '-i', 'example.txt', '--verbose', '-E', '-o', 'output']
         args = parse_args()
-        process(args)
+        context = process(args)
+        for diagnostic in context.diagnostics:
+            print(diagnostic, file=sys.stderr)
+        if context.code:
+            exit(context.code)
     except PreprocessorError as e:
         print(f"Error: {e}", file=sys.stderr)
         exit(1)
@@ -0,0 +1,140 @@
+"""
+In this file, the profiler of the Python+ preprocessor is defined.
+
+Spans are opened through Context.span, so handlers and plugins can
+emit their own. Every span records call count, cumulative and self
+time, lines inserted and removed in source while it was the innermost
+span, and bytes read. Results are printed as a table sorted by self
+time, or dumped as JSON or Chrome trace (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+class SpanStats:
+    __slots__ = ("calls", "cumulative", "self_time", "inserted", "removed", "bytes_read")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.inserted = 0
+        self.removed = 0
+        self.bytes_read = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Frame:
+    __slots__ = ("name", "category", "handler", "start", "children", "inserted", "removed", "bytes_read")
+
+    def __init__(self, name: str, category: str, handler: str | None, start: float):
+        self.name = name
+        self.category = category
+        self.handler = handler
+        self.start = start
+        self.children = 0.0
+        self.inserted = 0
+        self.removed = 0
+        self.bytes_read = 0
+
+
+def handler_label(handler) -> str:
+    module = getattr(handler, "__module__", None) or "?"
+    return f"{module}.{getattr(handler, '__qualname__', repr(handler))}"
+
+
+class Profiler:
+
+    def __init__(self):
+        # category -> span name -> stats
+        self.stats: dict[str, dict[str, SpanStats]] = {}
+        self.events = []    # Chrome trace events
+        self._stack: list[_Frame] = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, category: str = "plugin", handler=None):
+        """
+        :param handler: directive handler, its stats are aggregated too
+        """
+        label = handler_label(handler) if handler is not None else None
+        frame = _Frame(name, category, label, time.perf_counter())
+        self._stack.append(frame)
+        try:
+            yield frame
+        finally:
+            self._close(frame, time.perf_counter())
+
+    def _close(self, frame: _Frame, now: float) -> None:
+        self._stack.pop()
+        duration = now - frame.start
+        if self._stack:
+            self._stack[-1].children += duration
+
+        keys = [(frame.category, frame.name)]
+        if frame.handler is not None:
+            keys.append(("handler", frame.handler))
+        for category, name in keys:
+            stats = self.stats.setdefault(category, {}).setdefault(name, SpanStats())
+            stats.calls += 1
+            stats.cumulative += duration
+            stats.self_time += duration - frame.children
+            stats.inserted += frame.inserted
+            stats.removed += frame.removed
+            stats.bytes_read += frame.bytes_read
+
+        self.events.append({
+            "name": frame.name, "cat": frame.category, "ph": "X",
+            "ts": (frame.start - self._origin) * 1e6, "dur": duration * 1e6,
+            "pid": os.getpid(), "tid": 0
+        })
+
+    def on_splice(self, start: int, stop: int, inserted: int) -> None:
+        """ SourceBuffer listener, counts lines changed by innermost span """
+        if self._stack:
+            self._stack[-1].inserted += inserted
+            self._stack[-1].removed += stop - start
+
+    def add_bytes(self, count: int) -> None:
+        if self._stack:
+            self._stack[-1].bytes_read += count
+
+    def as_dict(self) -> dict:
+        return {
+            category: {name: stats.as_dict() for name, stats in spans.items()}
+            for category, spans in self.stats.items()
+        }
+
+    def format_table(self) -> str:
+        rows = []
+        for category in sorted(self.stats, key=lambda c: (c != "phase", c)):
+            spans = self.stats[category]
+            rows.append(f"{category:<40}{'calls':>8}{'cum ms':>11}{'self ms':>11}"
+                        f"{'+lines':>9}{'-lines':>9}{'bytes':>11}")
+            for name, s in sorted(spans.items(), key=lambda item: -item[1].self_time):
+                rows.append(f"  {name:<38}{s.calls:>8}{s.cumulative * 1e3:>11.3f}{s.self_time * 1e3:>11.3f}"
+                            f"{s.inserted:>9}{s.removed:>9}{s.bytes_read:>11}")
+        return '\n'.join(rows) + '\n'
+
+    def report(self, kind: str, filename: str | None = None) -> None:
+        """
+        :param kind: 'table', 'json' or 'trace'
+        :param filename: output file, stdout if None
+        """
+        if kind == "table":
+            text = self.format_table()
+        elif kind == "json":
+            text = json.dumps(self.as_dict(), indent=2) + '\n'
+        else:
+            text = json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"}) + '\n'
+
+        if filename is None:
+            sys.stdout.write(text)
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(text)
@@ -0,0 +1,593 @@
+"""
+In this file, the source buffer of the Python+ preprocessor is defined.
+
+Lines are kept in pieces (ranges of immutable line sequences) placed
+in a persistent implicit treap ordered by position, so splices cost
+O(log n) instead of shifting the whole list, and slices share pieces
+instead of copying lines. Every piece remembers where its lines come
+from, so any output line can be mapped back to (file, original line)
+and to the @include directives it was expanded by, see source_map.py.
+"""
+import random
+import re
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator, MutableSequence, Sequence
+
+
+class RepeatedLines(Sequence):
+    """
+    Body repeated count times, backing sequence of @repeat segments.
+    The body is stored once whatever the count is, as a buffer sharing
+    pieces of the source; it is decoded only when its lines are read.
+    A counter name, if given, is replaced by the iteration number
+    (from 0) when a line is read.
+    """
+    __slots__ = ("source", "count", "counter", "prefix", "_body", "_mapped",
+                 "_pattern", "_counted", "_marks")
+
+    def __init__(self,
+                 source: "SourceBuffer",
+                 count: int,
+                 counter: str | None = None,
+                 prefix: str = "",
+                 body: list[str] | None = None):
+        """
+        :param source: body lines as they were read, for origins
+        :param prefix: directive prefix, lines holding it or triple quotes are candidates, see next_mark
+        :param body: transformed body lines, see map
+        """
+        self.source = source
+        self.count = count
+        self.counter = counter
+        self.prefix = prefix
+        self._body = body
+        self._mapped = body is not None
+        self._pattern = re.compile(rf"\b{re.escape(counter)}\b") if counter else None
+        self._counted = None    # body lines holding counter, computed with body
+        self._marks = self._candidates() if prefix else []
+
+    def _candidates(self) -> list[int]:
+        """ body lines which may be directives or change string state, mapped lines aren't decoded """
+        if self._body is not None:
+            return [i for i, line in enumerate(self._body) if self._candidate(line)]
+        marks = []
+        index = 0
+        for piece in self.source.pieces():
+            end = piece.start + piece.length
+            next_mark = getattr(piece.lines, "next_mark", None)
+            if next_mark is None:
+                marks.extend(index + i for i, line in enumerate(piece.lines[piece.start:end])
+                             if self._candidate(line))
+            else:
+                mark = next_mark(piece.start, end)
+                while mark < end:
+                    marks.append(index + mark - piece.start)
+                    mark = next_mark(mark + 1, end)
+            index += piece.length
+        return marks
+
+    def _candidate(self, line: str) -> bool:
+        return self.prefix in line or '"""' in line or "'''" in line
+
+    @property
+    def body(self) -> list[str]:
+        if self._body is None:
+            self._body = list(self.source)
+        if self._pattern is not None and self._counted is None:
+            self._counted = [self._pattern.search(line) is not None for line in self._body]
+        return self._body
+
+    @property
+    def mapped(self) -> bool:
+        """ body was transformed, lines differ from source """
+        return self._mapped
+
+    def __len__(self) -> int:
+        return len(self.source) * self.count
+
+    def __getitem__(self, key: int | slice) -> str | list[str]:
+        if isinstance(key, slice):
+            return [self._line(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("repeated lines index out of range")
+        return self._line(key)
+
+    def _line(self, index: int) -> str:
+        body = self.body
+        iteration, offset = divmod(index, len(body))
+        if self._counted is not None and self._counted[offset]:
+            return self._pattern.sub(str(iteration), body[offset])
+        return body[offset]
+
+    def iterate(self, start: int, stop: int) -> Iterator[str]:
+        if self.counter is None and start < stop:
+            body = self._body if self._body is not None else list(self.source)
+            size = len(body)
+            iteration, offset = divmod(start, size)
+            end = stop - iteration * size
+            while end > 0:
+                yield from body[offset:min(end, size)]
+                offset = 0
+                end -= size
+        else:
+            yield from map(self._line, range(start, stop))
+
+    def text(self, start: int, stop: int) -> Iterator[str]:
+        """ joined lines[start:stop] in chunks, the body is joined once for all whole iterations """
+        size = len(self.source)
+        head = min(stop, -(-start // size) * size)     # up to first whole iteration
+        if start < head:
+            yield ''.join(self.iterate(start, head))
+        whole = (stop - head) // size if head < stop else 0
+        if whole:
+            period = ''.join(self.body)
+            if self.counter is None:
+                batch = max(1, (1 << 16) // max(1, len(period)))
+                for done in range(0, whole, batch):
+                    yield period * min(batch, whole - done)
+            else:
+                parts = self._pattern.split(period)
+                first = head // size
+                for iteration in range(first, first + whole):
+                    yield str(iteration).join(parts)
+        yield ''.join(self.iterate(head + whole * size, stop))
+
+    def origin(self, index: int) -> tuple[str, int]:
+        return self.source.origin(index % len(self.source))
+
+    def next_mark(self, start: int, stop: int) -> int:
+        """ index of first line in [start, stop) which may be directive, stop if there is none """
+        if not self._marks or start >= stop:
+            return stop
+        size = len(self.source)
+        iteration, offset = divmod(start, size)
+        i = bisect_left(self._marks, offset)
+        if i == len(self._marks):
+            iteration, i = iteration + 1, 0
+        return min(stop, iteration * size + self._marks[i])
+
+    def map(self, function) -> "RepeatedLines":
+        """ applies function to body lines, counter is replaced in its results; self if nothing changed """
+        old = self.body
+        body = [function(line) for line in old]
+        if all(new is line for new, line in zip(body, old)):
+            return self
+        return RepeatedLines(self.source, self.count, self.counter, self.prefix, body)
+
+    def __repr__(self):
+        return f"RepeatedLines(body={len(self.source)}, count={self.count}, counter={self.counter!r})"
+
+
+# (file, original line) of @include directive
+Site = tuple[str, int]
+
+
+class Piece:
+    __slots__ = ("lines", "start", "length", "filename", "origin_line", "generated", "stack")
+
+    def __init__(self,
+                 lines: Sequence[str],
+                 start: int,
+                 length: int,
+                 filename: str = "",
+                 origin_line: int = 0,
+                 generated: bool = False,
+                 stack: tuple[Site, ...] = ()):
+        self.lines = lines              # backing sequence, never modified
+        self.start = start              # first used index of backing sequence
+        self.length = length
+        self.filename = filename
+        self.origin_line = origin_line  # original line of lines[start]
+        self.generated = generated      # all lines map to origin_line
+        self.stack = stack              # includes the lines were expanded by, outermost first
+
+    def split(self, offset: int) -> tuple["Piece", "Piece"]:
+        tail_origin = self.origin(offset)[1]
+        return (
+            Piece(self.lines, self.start, offset,
+                  self.filename, self.origin_line, self.generated, self.stack),
+            Piece(self.lines, self.start + offset, self.length - offset,
+                  self.filename, tail_origin, self.generated, self.stack)
+        )
+
+    def origin(self, offset: int) -> tuple[str, int]:
+        if self.generated:
+            return self.filename, self.origin_line
+        if self.lines.__class__ is RepeatedLines:
+            return self.lines.origin(self.start + offset)
+        return self.filename, self.origin_line + offset
+
+    def __repr__(self):
+        return (f"Piece(start={self.start}, length={self.length}, "
+                f"filename={self.filename!r}, origin_line={self.origin_line})")
+
+
+class _Node:
+    __slots__ = ("piece", "prio", "size", "left", "right", "sites")
+
+    def __init__(self,
+                 piece: Piece,
+                 prio: float,
+                 left: "_Node | None",
+                 right: "_Node | None",
+                 sites: tuple[Site, ...] = ()):
+        self.piece = piece
+        self.prio = prio
+        self.left = left
+        self.right = right
+        self.size = piece.length + _size(left) + _size(right)
+        # include sites put in front of stacks of all pieces of subtree,
+        # pushed down lazily, so including a buffer costs O(1), see _push
+        self.sites = sites
+
+
+_rng = random.Random(0x5EED)    # deterministic tree shapes between runs
+
+
+def _size(node: _Node | None) -> int:
+    return node.size if node is not None else 0
+
+
+def _push(node: _Node) -> _Node:
+    """ returns equal node without sites, they are moved to its piece and children """
+    sites = node.sites
+    piece = node.piece
+    left, right = node.left, node.right
+    return _Node(
+        Piece(piece.lines, piece.start, piece.length, piece.filename, piece.origin_line, piece.generated,
+              sites + piece.stack),
+        node.prio,
+        None if left is None else _Node(left.piece, left.prio, left.left, left.right, sites + left.sites),
+        None if right is None else _Node(right.piece, right.prio, right.left, right.right, sites + right.sites)
+    )
+
+
+def _merge(a: _Node | None, b: _Node | None) -> _Node | None:
+    """ concatenates two trees, nodes are never modified (path copying) """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        if a.sites:
+            a = _push(a)
+        return _Node(a.piece, a.prio, a.left, _merge(a.right, b))
+    if b.sites:
+        b = _push(b)
+    return _Node(b.piece, b.prio, _merge(a, b.left), b.right)
+
+
+def _split(node: _Node | None, k: int) -> tuple[_Node | None, _Node | None]:
+    """ splits tree into first k lines and the rest """
+    if node is None:
+        return None, None
+    if node.sites:
+        node = _push(node)
+
+    left_size = _size(node.left)
+    if k <= left_size:
+        left, right = _split(node.left, k)
+        return left, _Node(node.piece, node.prio, right, node.right)
+
+    piece_end = left_size + node.piece.length
+    if k >= piece_end:
+        left, right = _split(node.right, k - piece_end)
+        return _Node(node.piece, node.prio, node.left, left), right
+
+    head, tail = node.piece.split(k - left_size)
+    return (_Node(head, node.prio, node.left, None),
+            _Node(tail, node.prio, None, node.right))
+
+
+def _sited_pieces(node: _Node | None) -> Iterator[Piece]:
+    """ pieces of tree with sites of their ancestors put in front of their stacks """
+    stack = []
+    sites = ()
+    while stack or node is not None:
+        while node is not None:
+            sites += node.sites
+            stack.append((node, sites))
+            node = node.left
+        node, sites = stack.pop()
+        piece = node.piece
+        if sites:
+            piece = Piece(piece.lines, piece.start, piece.length, piece.filename, piece.origin_line,
+                          piece.generated, sites + piece.stack)
+        yield piece
+        node = node.right
+
+
+def _pieces(node: _Node | None) -> Iterator[Piece]:
+    """ pieces of tree, their stacks may miss sites of ancestors """
+    stack = []
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        yield node.piece
+        node = node.right
+
+
+class SourceBuffer(MutableSequence):
+    """
+    List compatible sequence of source lines, so handlers and
+    plugins written for list[str] keep working unchanged
+    """
+
+    def __init__(self,
+                 lines: Iterable[str] = (),
+                 filename: str = "",
+                 first_line: int = 0):
+        """
+        :param lines: source lines, a given list is owned by buffer afterward
+        :param filename: file the lines come from
+        :param first_line: original number of the first line
+        """
+        if not isinstance(lines, list):
+            lines = list(lines)
+        self.filename = filename
+        self._root = self._leaf(Piece(lines, 0, len(lines), filename, first_line)) if lines else None
+        self._cache = None   # (piece, begin, end) of the last located line
+        # callbacks (start, stop, inserted) notified after every splice
+        self.listeners = []
+        # index of blocks maintained by preprocessor, see block_index.py
+        self.block_index = None
+
+    @classmethod
+    def _from_root(cls, root: _Node | None, filename: str) -> "SourceBuffer":
+        buffer = cls((), filename)
+        buffer._root = root
+        return buffer
+
+    @classmethod
+    def from_pieces(cls, pieces: Iterable[Piece], filename: str = "") -> "SourceBuffer":
+        """ builds buffer of given pieces, their backing sequences are shared """
+        root = None
+        for piece in pieces:
+            if piece.length:
+                root = _merge(root, cls._leaf(piece))
+        return cls._from_root(root, filename)
+
+    @staticmethod
+    def _leaf(piece: Piece) -> _Node:
+        return _Node(piece, _rng.random(), None, None)
+
+    def _set_root(self, root: _Node | None) -> None:
+        self._root = root
+        self._cache = None
+
+    def _normalize(self, index: int) -> int:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("source buffer index out of range")
+        return index
+
+    def _locate(self, index: int) -> tuple[Piece, int]:
+        """ returns piece holding line and offset inside it """
+        if self._cache is not None:
+            piece, begin, end = self._cache
+            if begin <= index < end:
+                return piece, index - begin
+
+        node = self._root
+        begin = 0
+        while True:
+            left_size = _size(node.left)
+            if index < begin + left_size:
+                node = node.left
+            elif index < begin + left_size + node.piece.length:
+                begin += left_size
+                self._cache = (node.piece, begin, begin + node.piece.length)
+                return node.piece, index - begin
+            else:
+                begin += left_size + node.piece.length
+                node = node.right
+
+    def _slice_bounds(self, key: slice) -> tuple[int, int]:
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("source buffer supports only contiguous slices")
+        return start, max(start, stop)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __getitem__(self, key: int | slice) -> str | list[str]:
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                return list(self)[key]
+            return list(self.view(*self._slice_bounds(key)))
+        piece, offset = self._locate(self._normalize(key))
+        return piece.lines[piece.start + offset]
+
+    def __setitem__(self, key: int | slice, value) -> None:
+        if isinstance(key, slice):
+            self.splice(*self._slice_bounds(key), value)
+            return
+        index = self._normalize(key)
+        filename, line, stack = self._site(index)
+        self._replace(index, index + 1,
+                      self._leaf(Piece([value], 0, 1, filename, line, stack=stack)))
+
+    def __delitem__(self, key: int | slice) -> None:
+        if isinstance(key, slice):
+            self.splice(*self._slice_bounds(key), ())
+            return
+        index = self._normalize(key)
+        self._replace(index, index + 1, None)
+
+    def __iter__(self) -> Iterator[str]:
+        for piece in _pieces(self._root):
+            if piece.lines.__class__ is RepeatedLines:
+                yield from piece.lines.iterate(piece.start, piece.start + piece.length)
+            else:
+                yield from piece.lines[piece.start:piece.start + piece.length]
+
+    def __mul__(self, count: int) -> "SourceBuffer":
+        """ repeats buffer by doubling, pieces are shared, not copied """
+        result = None
+        chunk = self._root
+        while count > 0:
+            if count & 1:
+                result = _merge(result, chunk)
+            count >>= 1
+            if count:
+                chunk = _merge(chunk, chunk)
+        return self._from_root(result, self.filename)
+
+    def repeated(self,
+                 start: int,
+                 stop: int,
+                 count: int,
+                 counter: str | None = None,
+                 prefix: str = "") -> "SourceBuffer":
+        """
+        returns lines[start:stop] repeated count times as one segment,
+        the body is stored once, see RepeatedLines
+        :param counter: name replaced by iteration number in repeated lines
+        :param prefix: directive prefix, lines holding it stay candidates of directive search
+        """
+        view = self.view(start, stop)
+        if count <= 0 or not len(view):
+            return self._from_root(None, self.filename)
+        lines = RepeatedLines(view, count, counter, prefix)
+        filename, line, stack = view._site(0)
+        # priority of the body keeps tree shape as if the body was spliced back
+        root = _Node(Piece(lines, 0, len(lines), filename, line, stack=stack), view._root.prio, None, None)
+        return self._from_root(root, self.filename)
+
+    def __repr__(self):
+        return f"SourceBuffer(filename={self.filename!r}, lines={len(self)})"
+
+    def _replace(self, start: int, stop: int, middle: _Node | None) -> None:
+        left, rest = _split(self._root, start)
+        _, right = _split(rest, stop - start)
+        self._set_root(_merge(_merge(left, middle), right))
+        for listener in self.listeners:
+            listener(start, stop, _size(middle))
+
+    def insert(self, index: int, value: str) -> None:
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        self.splice(min(index, size), min(index, size), [value])
+
+    def extend(self, values: Iterable[str]) -> None:
+        size = len(self)
+        self.splice(size, size, values)
+
+    def splice(self, start: int, stop: int, lines: Iterable[str]) -> None:
+        """
+        replaces lines[start:stop] with given lines in O(log n)
+        :param lines: SourceBuffer (pieces and origins are shared) or any iterable of str
+        """
+        if isinstance(lines, SourceBuffer):
+            middle = lines._root
+        else:
+            if not isinstance(lines, list):
+                lines = list(lines)
+            if lines:
+                filename, line, stack = self._site(start)
+                middle = self._leaf(Piece(lines, 0, len(lines), filename, line, True, stack))
+            else:
+                middle = None
+        self._replace(start, stop, middle)
+
+    def map(self, start: int, stop: int, function, keep=None) -> None:
+        """
+        replaces lines[start:stop] with function(line) in one splice,
+        pieces whose lines are all returned unchanged (same objects) are kept,
+        function is called once per body line of repeated segments
+        :param keep: predicate of pieces known to stay unchanged, they are not read
+        """
+        if start >= stop:
+            return
+        pieces = []
+        changed = False
+        for piece in self.view(start, stop).pieces():
+            if keep is not None and keep(piece):
+                pieces.append(piece)
+                continue
+            if piece.lines.__class__ is RepeatedLines:
+                mapped = piece.lines.map(function)     # body is mapped once
+                if mapped is not piece.lines:
+                    piece = Piece(mapped, piece.start, piece.length, piece.filename, piece.origin_line,
+                                  stack=piece.stack)
+                    changed = True
+                pieces.append(piece)
+                continue
+            lines = piece.lines[piece.start:piece.start + piece.length]
+            mapped = [function(line) for line in lines]
+            if any(new is not old for new, old in zip(mapped, lines)):
+                piece = Piece(mapped, 0, piece.length, piece.filename, piece.origin_line, piece.generated,
+                              piece.stack)
+                changed = True
+            pieces.append(piece)
+        if changed:
+            self._replace(start, stop, SourceBuffer.from_pieces(pieces)._root)
+
+    def _site(self, index: int) -> tuple[str, int, tuple[Site, ...]]:
+        """ origin and include stack of inserted lines: the replaced line or the one before it """
+        if index >= len(self):
+            if index == 0:
+                return self.filename, 0, ()
+            index -= 1
+        return *self.origin(index), self.stack(index)
+
+    def view(self, start: int, stop: int) -> "SourceBuffer":
+        """ returns lines[start:stop] as buffer sharing pieces with this one """
+        _, rest = _split(self._root, start)
+        middle, _ = _split(rest, stop - start)
+        return self._from_root(middle, self.filename)
+
+    def copy(self) -> "SourceBuffer":
+        """ O(1) copy, pieces are shared """
+        return self._from_root(self._root, self.filename)
+
+    def pieces(self) -> Iterator[Piece]:
+        return _sited_pieces(self._root)
+
+    def locate(self, index: int) -> tuple[Piece, int]:
+        """ returns piece holding line at given index and offset inside it """
+        return self._locate(self._normalize(index))
+
+    def origin(self, index: int) -> tuple[str, int]:
+        """ returns (file, original line) of line at given index """
+        piece, offset = self._locate(self._normalize(index))
+        return piece.origin(offset)
+
+    def stack(self, index: int) -> tuple[Site, ...]:
+        """ returns sites of @include directives line at given index was expanded by, outermost first """
+        index = self._normalize(index)
+        node = self._root
+        sites = ()
+        while True:
+            sites += node.sites
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index < left_size + node.piece.length:
+                break
+            else:
+                index -= left_size + node.piece.length
+                node = node.right
+        piece = node.piece
+        if piece.lines.__class__ is RepeatedLines:
+            body = piece.lines.source
+            return sites + body.stack((piece.start + index - left_size) % len(body))
+        return sites + piece.stack
+
+    def included(self, filename: str, line: int) -> "SourceBuffer":
+        """
+        returns buffer of these lines as included by directive at (filename, line) in O(1),
+        pieces are shared
+        """
+        root = self._root
+        if root is not None:
+            root = _Node(root.piece, root.prio, root.left, root.right, ((filename, line), *root.sites))
+        return self._from_root(root, self.filename)
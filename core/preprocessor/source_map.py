@@ -0,0 +1,194 @@
+"""
+In this file, the source map of preprocessed output is defined.
+
+Output lines are described by runs of lines coming from one place,
+kept in parallel int arrays instead of an object per line:
+
+    starts[i]   first output line of run
+    file_ids[i] id of original file, see SourceMap.files
+    lines[i]    original line of the first line of run, 0-based
+    periods[i]  the run repeats period lines of original (@repeat),
+                0 if all lines map to lines[i] (generated lines)
+    frames[i]   id of innermost @include site the run was expanded by, -1 if none
+
+Include sites form a tree of frames (file, line, parent frame), so the
+expansion stack of a line is read by following parents. '-E' writes
+the map next to output as JSON when '--source-map' is given, and
+errors of preprocessor report original positions taken from it.
+"""
+from array import array
+from bisect import bisect_right
+
+from source_buffer import RepeatedLines, SourceBuffer
+
+version = 1
+
+
+class SourceMap:
+    __slots__ = ("files", "_file_ids", "starts", "file_ids", "lines", "periods", "frames",
+                 "frame_files", "frame_lines", "frame_parents", "_frame_ids", "size", "root")
+
+    def __init__(self, root: str = ""):
+        self.root = root    # processed file
+        self.files: list[str] = []
+        self._file_ids: dict[str, int] = {}
+        self.starts = array('i')
+        self.file_ids = array('i')
+        self.lines = array('i')
+        self.periods = array('i')
+        self.frames = array('i')
+        self.frame_files = array('i')
+        self.frame_lines = array('i')
+        self.frame_parents = array('i')
+        self._frame_ids: dict[tuple, int] = {}     # stack -> id of its innermost frame
+        self.size = 0   # mapped output lines
+
+    @classmethod
+    def of(cls, source: SourceBuffer) -> "SourceMap":
+        """ maps lines of processed buffer, costs O(pieces) """
+        source_map = cls(source.filename)
+        for piece in source.pieces():
+            if piece.lines.__class__ is RepeatedLines:
+                source_map._add_repeated(piece)
+            else:
+                source_map.add(piece.length, piece.filename, piece.origin_line,
+                               0 if piece.generated else piece.length, piece.stack)
+        return source_map
+
+    def _file(self, filename: str) -> int:
+        file_id = self._file_ids.get(filename)
+        if file_id is None:
+            file_id = self._file_ids[filename] = len(self.files)
+            self.files.append(filename)
+        return file_id
+
+    def _frame(self, stack: tuple) -> int:
+        if not stack:
+            return -1
+        frame = self._frame_ids.get(stack)
+        if frame is None:
+            parent = self._frame(stack[:-1])
+            filename, line = stack[-1]
+            frame = self._frame_ids[stack] = len(self.frame_files)
+            self.frame_files.append(self._file(filename))
+            self.frame_lines.append(line)
+            self.frame_parents.append(parent)
+        return frame
+
+    def add(self, length: int, filename: str, line: int, period: int, stack: tuple = ()) -> None:
+        """ appends run of length output lines, continuation of the last run is merged into it """
+        if length <= 0:
+            return
+        file_id, frame = self._file(filename), self._frame(stack)
+        if self.starts:
+            last = len(self.starts) - 1
+            run = self.size - self.starts[last]
+            if (self.file_ids[last] == file_id and self.frames[last] == frame
+                    and self.periods[last] == run and period == length
+                    and self.lines[last] + run == line):
+                self.periods[last] += length
+                self.size += length
+                return
+        self.starts.append(self.size)
+        self.file_ids.append(file_id)
+        self.lines.append(line)
+        self.periods.append(period)
+        self.frames.append(frame)
+        self.size += length
+
+    def _add_repeated(self, piece) -> None:
+        body = piece.lines.source
+        size = len(body)
+        index, end = piece.start, piece.start + piece.length
+        runs = list(body.pieces())
+        if len(runs) == 1:
+            # body is one run of original, whole iterations are one periodic run
+            run = runs[0]
+            if run.generated:
+                self.add(end - index, run.filename, run.origin_line, 0, run.stack)
+                return
+            offset = index % size
+            if offset:
+                head = min(size - offset, end - index)
+                self.add(head, run.filename, run.origin_line + offset, head, run.stack)
+                index += head
+            self.add(end - index, run.filename, run.origin_line, size, run.stack)
+            return
+        # runs of body are added for every iteration
+        while index < end:
+            local, position = body.locate(index % size)
+            length = min(local.length - position, end - index)
+            line = local.origin(position)[1]
+            self.add(length, local.filename, line, 0 if local.generated else length, local.stack)
+            index += length
+
+    def __len__(self) -> int:
+        return self.size
+
+    def lookup(self, index: int) -> tuple[str, int, list[tuple[str, int]]] | None:
+        """
+        :param index: output line, 0-based
+        :return: original file, 0-based line and include sites (file, line), innermost first
+        """
+        if not 0 <= index < self.size:
+            return None
+        run = bisect_right(self.starts, index) - 1
+        offset = index - self.starts[run]
+        period = self.periods[run]
+        line = self.lines[run] + (offset % period if period else 0)
+        sites = []
+        frame = self.frames[run]
+        while frame != -1:
+            sites.append((self.files[self.frame_files[frame]], self.frame_lines[frame]))
+            frame = self.frame_parents[frame]
+        return self.files[self.file_ids[run]], line, sites
+
+    def describe(self, index: int) -> str:
+        """ ' (file:line, included from file:line)', empty if line is at the same place of root file """
+        found = self.lookup(index)
+        if found is None:
+            return ""
+        filename, line, sites = found
+        if filename == self.root and line == index and not sites:
+            return ""
+        return " (" + ", ".join([f"{filename}:{line + 1}"] +
+                                [f"included from {f}:{l + 1}" for f, l in sites]) + ")"
+
+    def to_json(self, target: str) -> dict:
+        return {
+            "version": version,
+            "file": target,
+            "root": self.root,
+            "sources": self.files,
+            # flat rows: (file, line, parent), (start, file, line, period, frame)
+            "frames": [v for row in zip(self.frame_files, self.frame_lines, self.frame_parents) for v in row],
+            "runs": [v for row in zip(self.starts, self.file_ids, self.lines, self.periods, self.frames)
+                     for v in row],
+            "lines": self.size
+        }
+
+    def write(self, filename: str, target: str) -> None:
+        import json
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(target), f, separators=(',', ':'))
+            f.write('\n')
+
+    @classmethod
+    def read(cls, filename: str) -> "SourceMap":
+        """ :raise ValueError: unsupported or broken map """
+        import json
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != version:
+            raise ValueError(f"unsupported source map version: {data.get('version')}")
+        source_map = cls(data["root"])
+        source_map.files = list(data["sources"])
+        source_map._file_ids = {name: i for i, name in enumerate(source_map.files)}
+        frames, runs = data["frames"], data["runs"]
+        for column, values in enumerate((source_map.frame_files, source_map.frame_lines, source_map.frame_parents)):
+            values.extend(frames[column::3])
+        for column, values in enumerate((source_map.starts, source_map.file_ids, source_map.lines,
+                                         source_map.periods, source_map.frames)):
+            values.extend(runs[column::5])
+        source_map.size = data["lines"]
+        return source_map
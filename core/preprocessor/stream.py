@@ -0,0 +1,141 @@
+"""
+Streaming mode of the Python+ preprocessor.
+
+Input is read lazily and plain lines are written out as soon as they
+are read. Only a directive line is buffered, together with its body
+for block directives, while its handler runs; the unprocessed rest of
+the handler result is pushed back in front of the input. Memory use
+therefore depends on the largest directive, not on the input size.
+"""
+import os
+from collections.abc import Iterable, Iterator
+
+from context import Context
+from errors import DirectiveSyntaxError, PreprocessorError, SourceIndexError
+from handlers import match_directive, is_block_opener, is_block_end, directive_name, directive_prefix
+from core.preprocessor.lexer import string_state
+from source_buffer import SourceBuffer
+
+
+class LineStream:
+    """ iterator over input lines with pushed back lines on top """
+
+    def __init__(self, lines: Iterable[str]):
+        self._stack = [iter(lines)]
+        self.line = -1  # index of the last line read from input, pushed back lines aren't counted
+
+    def push(self, lines: Iterable[str]) -> None:
+        self._stack.append(iter(lines))
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        while self._stack:
+            line = next(self._stack[-1], None)
+            if line is not None:
+                if len(self._stack) == 1:
+                    self.line += 1
+                return line
+            self._stack.pop()
+        raise StopIteration
+
+
+class Window:
+    """ part of output starting at given line, enough for error reporting """
+
+    def __init__(self, offset: int, lines: list[str]):
+        self.offset = offset
+        self.lines = lines
+
+    def __len__(self) -> int:
+        return self.offset + len(self.lines)
+
+    def __getitem__(self, index: int) -> str:
+        return self.lines[index - self.offset]
+
+
+class StreamProcessor:
+
+    def __init__(self, context: Context):
+        self.context = context
+        self.emitted = 0        # lines already written, equals 'pointer' of buffered mode
+        self.block = []         # lines of directive being processed
+
+    def read_block(self, stream: LineStream) -> None:
+        """ buffers directive body up to its matching 'end' directive """
+        depth = 1
+        state = None    # see lexer.string_state
+        for line in stream:
+            self.block.append(line)
+            if state is None and is_block_opener(line):
+                depth += 1
+            elif state is None and is_block_end(line):
+                depth -= 1
+                if depth == 0:
+                    return
+            else:
+                state = string_state(line, state)
+        raise DirectiveSyntaxError("stream::Missed 'end' directive", self.emitted)
+
+    def expand(self, lines: Iterable[str]) -> Iterator[str]:
+        verbose = self.context.config.verbose
+        macros = self.context.macro_table
+        stream = LineStream(lines)
+        state = None    # see lexer.string_state
+        for line in stream:
+            handler = match_directive(line) if state is None else None
+            if handler is None:
+                self.emitted += 1
+                self.block = [line]     # reported if expansion fails
+                yield macros.expand(line, state)
+                state = string_state(line, state)
+                continue
+
+            self.block = [line]
+            first_line = stream.line    # pushed back directive is reported at its origin directive
+            if is_block_opener(line):
+                self.read_block(stream)
+            if verbose:
+                print(f"Processing directive at line {self.emitted + 1}: {line.strip()}")
+
+            buffer = SourceBuffer(self.block, self.context.filename, first_line)
+            if self.context.profiler is not None:
+                buffer.listeners.append(self.context.profiler.on_splice)
+            with self.context.span(directive_prefix + directive_name(line), "directive", handler):
+                pointer = handler(buffer, 0, self.context)
+            if pointer < 0 or pointer > len(buffer):
+                raise SourceIndexError(f"invalid index returned: {pointer}", handler)
+
+            state = None
+            for text in buffer.view(0, pointer):
+                yield macros.expand(text, state)
+                state = string_state(text, state)
+            self.emitted += pointer
+            if pointer < len(buffer):
+                stream.push(buffer.view(pointer, len(buffer)))
+            self.block = []
+
+
+def process_stream(context: Context, filename: str | None) -> None:
+    """
+    preprocesses context.filename writing result incrementally
+    :param filename: output file, None to only check input
+    """
+    processor = StreamProcessor(context)
+    partial = None if filename is None else f"{filename}.{os.getpid()}.part"
+    try:
+        with open(context.filename, 'r', encoding='utf-8') as source:
+            if partial is None:
+                for _ in processor.expand(source):
+                    pass
+            else:
+                with open(partial, 'w', encoding='utf-8') as f:
+                    f.writelines(processor.expand(source))
+                os.replace(partial, filename)
+    except PreprocessorError as e:
+        e.line_num = processor.emitted
+        context.diagnostics.append(e.what(Window(processor.emitted, processor.block)))
+        context.code = 1
+        if partial is not None and os.path.exists(partial):
+            os.remove(partial)
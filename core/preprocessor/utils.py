@@ -1,17 +1,35 @@
-import pathlib
+import os
 
 
 def replace_extension(filename: str, new_suffix: str) -> str:
-    path = pathlib.Path(filename)
     if not new_suffix.startswith('.'):
         new_suffix = '.' + new_suffix
-    new_filename = path.with_suffix(new_suffix)
-    return str(new_filename)
+    root, _ = os.path.splitext(os.path.normpath(filename))
+    return root + new_suffix
 
 def search_end(source: list[str], line_from: int) -> int:
-    for i in range(line_from, len(source)):
-        if is_directive(source[i].strip(), 'end'):
-            return i
+    """
+    returns index of 'end' directive closing block opened at line_from or -1,
+    nested blocks are skipped
+    """
+    if isinstance(source, SourceBuffer) and handlers.is_block_opener(source[line_from]):
+        return BlockIndex.of(source).end_of(line_from)
+
+    depth = 0
+    state = None    # see lexer.string_state
+    for i in range(line_from + 1, len(source)):
+        if state is None and handlers.is_block_opener(source[i]):
+            depth += 1
+        elif state is None and handlers.is_block_end(source[i]):
+            if depth == 0:
+                return i
+            depth -= 1
+        elif state is not None or not handlers.is_registered(source[i]):
+            state = string_state(source[i], state)
     return -1
 
-from handlers import is_directive
\ No newline at end of file
+# imported last, handlers depends on this module
+import handlers
+from core.preprocessor.lexer import string_state
+from block_index import BlockIndex
+from source_buffer import SourceBuffer
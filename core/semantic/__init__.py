@@ -0,0 +1,16 @@
+"""
+Semantic analysis of the Python+ compiler.
+
+Checks run on a parsed TranslationUnit before transformer passes and
+can't be disabled: casts are checked and lowered to their expressions
+(casts.py), noexcept functions are checked and recorded (noexcept.py).
+"""
+from core.semantic.casts import casts
+from core.semantic.noexcept import noexcept
+from core.transformer.unit import TranslationUnit
+
+
+def analyze(unit: TranslationUnit) -> None:
+    """ :raise TransformError: unit breaks a rule of Python+ """
+    casts(unit)
+    noexcept(unit)
@@ -0,0 +1,169 @@
+"""
+In this file, casts of Python+ are checked and lowered.
+
+    comp_cast{Vector, Vector}(a + b)    ->  a + b
+    bool_cast{Vector}(v)                ->  v
+
+A cast declares classes of operands of its expression. It is checked
+at compile time and only the expression is left in output, nothing is
+checked at run time; a cast standing as a statement is an assertion
+and is removed. Classes are classes of the unit with their bases, or
+builtins, other ones can't be checked and are errors.
+
+    comp_cast{T1, T2}   binary operator     __add__, ... of T1 or __radd__, ... of T2
+                        comparison          __lt__, ... of T1 or reflected __gt__, ... of T2,
+                                            __contains__ of T2 for 'in', chains pair by pair
+    comp_cast{T}        unary operator      __neg__, __pos__, __invert__ of T
+                        subscript           __getitem__ of T
+                        method call         the method of T
+    bool_cast{T}        __bool__ or __len__ of T
+
+Methods inherited from object count only for == and !=, the other
+comparisons of object return NotImplemented.
+"""
+import ast
+import builtins
+
+from errors import CastError
+from core.semantic.scopes import bound_names, bound_once
+from core.transformer.syntax import casts as cast_names
+from core.transformer.unit import TranslationUnit
+
+binary_methods = {
+    ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.MatMult: "matmul", ast.Div: "truediv",
+    ast.FloorDiv: "floordiv", ast.Mod: "mod", ast.Pow: "pow", ast.LShift: "lshift", ast.RShift: "rshift",
+    ast.BitOr: "or", ast.BitXor: "xor", ast.BitAnd: "and",
+}
+# comparison -> method of left operand, reflected method of right one
+compare_methods = {
+    ast.Eq: ("__eq__", "__eq__"), ast.NotEq: ("__ne__", "__ne__"),
+    ast.Lt: ("__lt__", "__gt__"), ast.LtE: ("__le__", "__ge__"),
+    ast.Gt: ("__gt__", "__lt__"), ast.GtE: ("__ge__", "__le__"),
+}
+unary_methods = {ast.USub: "__neg__", ast.UAdd: "__pos__", ast.Invert: "__invert__"}
+
+
+class Classes:
+    """ classes a cast may name: module level classes of the unit and builtins """
+
+    def __init__(self, tree: ast.Module):
+        once = bound_once(tree.body)
+        self.nodes = {n.name: n for n in tree.body if isinstance(n, ast.ClassDef) and n.name in once}
+
+    def defines(self, class_name: str, method: str, seen: frozenset[str] = frozenset()) -> bool:
+        """ :raise LookupError: class or one of its bases isn't known, its name is the message """
+        node = self.nodes.get(class_name) if class_name not in seen else None
+        if node is None:
+            cls = getattr(builtins, class_name, None)
+            if not isinstance(cls, type):
+                raise LookupError(class_name)
+            found = getattr(cls, method, None)
+            return found is not None and (method in ("__eq__", "__ne__") or found is not getattr(object, method, None))
+        if method in bound_names(node.body):
+            return True
+        for base in node.bases or [ast.Name("object")]:
+            if not isinstance(base, ast.Name):
+                raise LookupError(ast.unparse(base))
+            if self.defines(base.id, method, seen | {class_name}):
+                return True
+        return False
+
+
+class Casts(ast.NodeTransformer):
+
+    def __init__(self, unit: TranslationUnit):
+        self.unit = unit
+        self.classes = Classes(unit.tree)
+
+    def is_cast(self, node: ast.AST) -> bool:
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Subscript):
+            return False
+        name = node.func.value
+        return (isinstance(name, ast.Name) and name.id in cast_names
+                and (name.lineno, name.col_offset) in self.unit.casts)
+
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        node = self.generic_visit(node)
+        if not self.is_cast(node):
+            return node
+        return self.check(node)
+
+    def visit_Expr(self, node: ast.Expr) -> ast.stmt:
+        if not self.is_cast(node.value):
+            return self.generic_visit(node)
+        self.check(self.generic_visit(node.value))
+        return ast.copy_location(ast.Pass(), node)     # assertion only
+
+    def check(self, cast: ast.Call) -> ast.expr:
+        """ :return: expression of checked cast """
+        name = cast.func.value.id
+        line = cast.lineno - 1
+        if len(cast.args) != 1 or cast.keywords or isinstance(cast.args[0], ast.Starred):
+            raise CastError(f"{name}::expected one expression, '{name}{{T}}(expr)'", line)
+        types = cast.func.slice.elts if isinstance(cast.func.slice, ast.Tuple) else [cast.func.slice]
+        for t in types:
+            if not isinstance(t, ast.Name):
+                raise CastError(f"{name}::expected class name, got '{ast.unparse(t)}'", line)
+        types = [t.id for t in types]
+        expression = cast.args[0]
+        try:
+            if name == "bool_cast":
+                self.check_bool(types, line)
+            else:
+                self.check_operation(types, expression, line)
+        except LookupError as e:
+            raise CastError(f"{name}::class '{e.args[0]}' isn't known at compile time", line)
+        return expression
+
+    def check_bool(self, types: list[str], line: int) -> None:
+        if len(types) != 1:
+            raise CastError(f"bool_cast::expected one class, got {len(types)}", line)
+        if not (self.classes.defines(types[0], "__bool__") or self.classes.defines(types[0], "__len__")):
+            raise CastError(f"bool_cast::'{types[0]}' defines neither __bool__ nor __len__", line)
+
+    def check_operation(self, types: list[str], expression: ast.expr, line: int) -> None:
+        defines = self.classes.defines
+
+        def expect(count: int, operation: str) -> None:
+            if len(types) != count:
+                raise CastError(f"comp_cast::{operation} expects {count} classes, got {len(types)}", line)
+
+        if isinstance(expression, ast.BinOp):
+            expect(2, "binary operator")
+            method = binary_methods[type(expression.op)]
+            if not defines(types[0], f"__{method}__") and not defines(types[1], f"__r{method}__"):
+                raise CastError(f"comp_cast::'{types[0]}' has no __{method}__ and "
+                                f"'{types[1]}' has no __r{method}__", line)
+        elif isinstance(expression, ast.Compare):
+            expect(len(expression.comparators) + 1, "comparison")
+            for left, operator, right in zip(types, expression.ops, types[1:]):
+                if isinstance(operator, (ast.Is, ast.IsNot)):
+                    continue
+                if isinstance(operator, (ast.In, ast.NotIn)):
+                    if not defines(right, "__contains__"):
+                        raise CastError(f"comp_cast::'{right}' has no __contains__", line)
+                    continue
+                method, reflected = compare_methods[type(operator)]
+                if not defines(left, method) and not defines(right, reflected):
+                    raise CastError(f"comp_cast::'{left}' has no {method} and '{right}' has no {reflected}", line)
+        elif isinstance(expression, ast.UnaryOp) and not isinstance(expression.op, ast.Not):
+            expect(1, "unary operator")
+            method = unary_methods[type(expression.op)]
+            if not defines(types[0], method):
+                raise CastError(f"comp_cast::'{types[0]}' has no {method}", line)
+        elif isinstance(expression, ast.Subscript):
+            expect(1, "subscript")
+            if not defines(types[0], "__getitem__"):
+                raise CastError(f"comp_cast::'{types[0]}' has no __getitem__", line)
+        elif isinstance(expression, ast.Call) and isinstance(expression.func, ast.Attribute):
+            expect(1, "method call")
+            if not defines(types[0], expression.func.attr):
+                raise CastError(f"comp_cast::'{types[0]}' has no method '{expression.func.attr}'", line)
+        else:
+            raise CastError("comp_cast::expected operator, subscript or method call", line)
+
+
+def casts(unit: TranslationUnit) -> None:
+    if unit.casts:
+        Casts(unit).visit(unit.tree)
+        unit.changed = True
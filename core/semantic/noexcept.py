@@ -0,0 +1,152 @@
+"""
+In this file, noexcept functions are checked and handlers of their calls are removed.
+
+    @noexcept
+    def safe_divide(a, b):
+        ...
+
+    try:                                ->      r = safe_divide(a, b)
+        r = safe_divide(a, b)
+    except ZeroDivisionError:
+        r = 0
+
+'@noexcept' is a declaration, the decorator is removed from output. A
+noexcept function must not raise outside of try statements, that is
+checked at compile time, what functions it calls is up to its author.
+
+Handlers of a try statement are dead when its body can't raise: it
+only calls noexcept functions of the module with arguments they accept,
+assigns results to names, returns them or passes. Names and constants
+are taken as evaluated without errors. Such a try statement is replaced
+by its body followed by its else clause, a finally clause is kept.
+"""
+import ast
+
+from errors import TransformError
+from core.semantic.scopes import bound_names, bound_once, parameters
+from core.transformer.unit import TranslationUnit
+
+decorator = "noexcept"
+
+
+def is_noexcept(expression: ast.expr) -> bool:
+    return isinstance(expression, ast.Name) and expression.id == decorator
+
+
+def raises(function: ast.FunctionDef | ast.AsyncFunctionDef) -> ast.Raise | None:
+    """ raise statement of function body which isn't in body of try statement with handlers """
+    stack = list(function.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Raise):
+            return node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, (ast.Try, ast.TryStar)) and node.handlers:
+            stack.extend(node.orelse + node.finalbody)
+            stack.extend(s for handler in node.handlers for s in handler.body)
+            continue
+        stack.extend(child for child in ast.iter_child_nodes(node) if isinstance(child, ast.stmt))
+    return None
+
+
+def noexcept(unit: TranslationUnit) -> None:
+    """ semantic check, records noexcept functions of module in unit.noexcept """
+    once = bound_once(unit.tree.body)
+    for node in ast.walk(unit.tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        if not any(is_noexcept(d) for d in node.decorator_list):
+            continue
+        statement = raises(node)
+        if statement is not None:
+            raise TransformError(f"noexcept function '{node.name}' raises an exception", statement.lineno - 1)
+        node.decorator_list = [d for d in node.decorator_list if not is_noexcept(d)]
+        unit.changed = True
+        if node in unit.tree.body and node.name in once and isinstance(node, ast.FunctionDef) \
+                and not node.decorator_list:
+            unit.noexcept[node.name] = node
+
+
+def accepts(function: ast.FunctionDef, call: ast.Call) -> bool:
+    """ arguments of call match parameters of function """
+    arguments = function.args
+    if any(isinstance(a, ast.Starred) for a in call.args) or any(k.arg is None for k in call.keywords):
+        return False
+    positional = arguments.posonlyargs + arguments.args
+    if len(call.args) > len(positional) and arguments.vararg is None:
+        return False
+    given = {a.arg for a in positional[:len(call.args)]}
+    keywords = {a.arg for a in arguments.args + arguments.kwonlyargs}
+    for keyword in call.keywords:
+        if keyword.arg in given or (keyword.arg not in keywords and arguments.kwarg is None):
+            return False
+        given.add(keyword.arg)
+    defaults = {a.arg for a in positional[len(positional) - len(arguments.defaults):]} | \
+               {a.arg for a, d in zip(arguments.kwonlyargs, arguments.kw_defaults) if d is not None}
+    required = {a.arg for a in positional + arguments.kwonlyargs} - defaults
+    return required <= given
+
+
+class Elision(ast.NodeTransformer):
+
+    def __init__(self, unit: TranslationUnit):
+        self.functions = unit.noexcept
+        self.scopes: list[tuple[str, set[str]]] = []    # kind and bound names of enclosing scopes
+        self.elided = 0
+
+    def hidden(self, name: str) -> bool:
+        return any(name in bound for i, (kind, bound) in enumerate(self.scopes)
+                   if kind == "function" or i == len(self.scopes) - 1)
+
+    def safe(self, expression: ast.expr | None) -> bool:
+        """ expression can't raise """
+        if expression is None or isinstance(expression, (ast.Constant, ast.Name)):
+            return True
+        if isinstance(expression, ast.Call) and isinstance(expression.func, ast.Name):
+            function = self.functions.get(expression.func.id)
+            return (function is not None and not self.hidden(expression.func.id) and accepts(function, expression)
+                    and all(self.safe(a) for a in expression.args)
+                    and all(self.safe(k.value) for k in expression.keywords))
+        return False
+
+    def safe_statement(self, statement: ast.stmt) -> bool:
+        if isinstance(statement, ast.Pass):
+            return True
+        if isinstance(statement, (ast.Expr, ast.Return)):
+            return self.safe(statement.value)
+        if isinstance(statement, ast.Assign):
+            return all(isinstance(t, ast.Name) for t in statement.targets) and self.safe(statement.value)
+        return False
+
+    def visit_Try(self, node: ast.Try):
+        node = self.generic_visit(node)
+        if not node.handlers or not all(self.safe_statement(s) for s in node.body):
+            return node
+        self.elided += 1
+        if node.finalbody:
+            return ast.copy_location(ast.Try(node.body + node.orelse, [], [], node.finalbody), node)
+        return node.body + node.orelse
+
+    def visit_FunctionDef(self, node):
+        self.scopes.append(("function", bound_names(node.body) | {a.arg for a in parameters(node.args)}))
+        self.generic_visit(node)
+        self.scopes.pop()
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.scopes.append(("class", bound_names(node.body)))
+        self.generic_visit(node)
+        self.scopes.pop()
+        return node
+
+
+def elide(unit: TranslationUnit) -> None:
+    """ transformer pass removing handlers of try statements calling only noexcept functions """
+    if unit.noexcept:
+        elision = Elision(unit)
+        elision.visit(unit.tree)
+        if elision.elided:
+            unit.changed = True
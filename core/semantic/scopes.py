@@ -0,0 +1,59 @@
+"""
+In this file, scopes of Python code are analysed.
+
+Names are bound per scope: a function, a class body, a lambda or a
+comprehension. Statements of one scope are walked without entering
+nested ones, which is what passes need to know whether a name read at
+some place is a local, or a global of the unit.
+"""
+import ast
+
+nested_scopes = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda,
+                 ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def scope_nodes(nodes):
+    """ yields nodes of statements in source order, nested scopes are yielded but not entered """
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, nested_scopes):
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+
+def parameters(arguments: ast.arguments) -> list[ast.arg]:
+    return arguments.posonlyargs + arguments.args + arguments.kwonlyargs + \
+        [a for a in (arguments.vararg, arguments.kwarg) if a is not None]
+
+
+def bound_by(node: ast.AST) -> list[str]:
+    """ names bound by node itself, not by its children """
+    if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+        return [node.id]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return [a.asname or a.name.partition('.')[0] for a in node.names]
+    if isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+        return [node.name]
+    if isinstance(node, ast.MatchMapping) and node.rest:
+        return [node.rest]
+    return []
+
+
+def bound_names(nodes) -> set[str]:
+    """ names bound by statements of one scope """
+    bound = set()
+    for node in scope_nodes(nodes):
+        bound.update(bound_by(node))
+    return bound
+
+
+def bound_once(statements: list[ast.stmt]) -> set[str]:
+    """ names bound by exactly one statement of scope """
+    counts: dict[str, int] = {}
+    for statement in statements:
+        for name in bound_names([statement]):
+            counts[name] = counts.get(name, 0) + 1
+    return {name for name, count in counts.items() if count == 1}
@@ -0,0 +1,136 @@
+"""
+Compile server of the Python+ compiler.
+
+A long-running process which listens on a local Unix socket, so build
+systems calling the compiler once per file pay interpreter startup,
+imports and plugin registration only once. Include cache and compiled
+macro patterns stay warm between requests; included files are still
+validated by their stamps on every use.
+
+    python core/server.py [--socket PATH]
+    python core/client.py -i main.ppy -E -o main
+
+Protocol: one JSON request line per connection, answered by one JSON
+line, then the connection is closed.
+    {"command": "compile", "argv": [...], "cwd": "..."}
+        -> {"code": int, "stdout": str, "stderr": str}
+    {"command": "stats"}    -> {"requests": int, "include_cache": {...}}
+    {"command": "shutdown"} -> {"code": 0}
+argv has the schema of main.py arguments. Requests are served one at
+a time, each in the working directory of its client.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import warnings
+
+import cli.cfgparse
+import driver
+from client import default_socket_path, request
+from include_cache import IncludeCache
+
+
+class CompileServer(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path: str):
+        self.include_cache = IncludeCache()
+        self.requests = 0
+        self.stopping = False
+        super().__init__(socket_path, RequestHandler)
+        os.chmod(socket_path, 0o600)    # compiles with rights of its owner
+
+    def compile(self, argv: list[str], cwd: str) -> dict:
+        stdout, stderr = io.StringIO(), io.StringIO()
+        previous = os.getcwd()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), \
+                warnings.catch_warnings():
+            warnings.simplefilter("default")    # every request reports its warnings again
+            try:
+                os.chdir(cwd)   # inputs and includes are relative to client
+                args = cli.cfgparse.parse_args(argv, prog="main.py")
+                code = driver.compile_all(args, self.include_cache)
+            except SystemExit as e:     # argparse error or --help
+                code = e.code if isinstance(e.code, int) else 2
+            except OSError as e:
+                print(f"I/O Error: {e}", file=sys.stderr)
+                code = 3
+            finally:
+                os.chdir(previous)
+        return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def respond(self, message: dict) -> dict:
+        command = message.get("command")
+        if command == "compile":
+            self.requests += 1
+            return self.compile(list(message.get("argv", [])), message.get("cwd") or os.getcwd())
+        if command == "stats":
+            cache = self.include_cache
+            return {
+                "requests": self.requests,
+                "include_cache": {"entries": len(cache), "hits": cache.hits, "misses": cache.misses}
+            }
+        if command == "shutdown":
+            self.stopping = True
+            return {"code": 0}
+        return {"code": 2, "stdout": "", "stderr": f"unknown command: {command!r}\n"}
+
+    def serve(self) -> None:
+        while not self.stopping:
+            self.handle_request()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        try:
+            message = json.loads(self.rfile.readline())
+        except ValueError as e:
+            response = {"code": 2, "stdout": "", "stderr": f"invalid request: {e}\n"}
+        else:
+            response = self.server.respond(message)
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """ removes socket left by killed server, fails if a server still listens """
+    if not os.path.exists(socket_path):
+        return
+    try:
+        request({"command": "stats"}, socket_path)
+    except OSError:
+        os.remove(socket_path)
+        return
+    raise RuntimeError(f"server already listens on {socket_path}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Python+ compile server")
+    parser.add_argument('--socket', help="Unix socket path, PYTHONPLUS_SOCKET by default",
+                        default=None, type=str)
+    args = parser.parse_args()
+    socket_path = args.socket or default_socket_path()
+
+    try:
+        remove_stale_socket(socket_path)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    with CompileServer(socket_path) as server:
+        print(f"listening on {socket_path}")
+        sys.stdout.flush()
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
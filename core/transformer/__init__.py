@@ -0,0 +1,42 @@
+"""
+Transformer of the Python+ compiler.
+
+Preprocessed source is lowered to Python (see syntax.py), parsed once
+into a TranslationUnit, checked by semantic analysis (core/semantic)
+and rewritten by passes in order of 'passes'.
+A pass is a function changing the unit in place, given as
+'module:function' and imported when it runs; '--disable NAME' skips
+it, qualifiers of a skipped pass are removed all the same. Options of
+passes are read from unit.config, compiler arguments.
+"""
+import importlib
+
+from core.transformer.unit import TranslationUnit
+
+passes: dict[str, str] = {
+    "nodict": "core.transformer.nodict:nodict",
+    "noexcept": "core.semantic.noexcept:elide",
+    "const": "core.transformer.const:const",
+    "inline": "core.transformer.inline:inline",
+    "fold": "core.transformer.const:fold",
+}
+
+
+def transform(source: str, filename: str = "<unit>", config=None, variables=None) -> TranslationUnit:
+    """
+    :param config: compiler arguments, None for defaults
+    :param variables: BuildVarsTable the source was preprocessed with, None if there is no one
+    :raise TransformError: source isn't valid Python+
+    """
+    from core.semantic import analyze     # imports the unit module, see core/semantic/__init__.py
+
+    unit = TranslationUnit.parse(source, filename)
+    unit.config = config
+    unit.variables = variables
+    analyze(unit)
+    disabled = getattr(config, "disable", None) or ()
+    for name, entry in passes.items():
+        if name not in disabled:
+            module, _, function = entry.partition(':')
+            getattr(importlib.import_module(module), function)(unit)
+    return unit
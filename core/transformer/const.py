@@ -0,0 +1,439 @@
+"""
+In this file, the const pass is defined.
+
+    const SCALE = 2                         SCALE = 2
+    const LIMIT = SCALE * 512               LIMIT = 1024
+
+    def check(n):                           def check(n):
+        if __PLATFORM__ == "Windows":   ->      return n < 1024
+            return n < 100
+        return n < LIMIT
+
+A const name is bound once in its scope, binding it again, also from
+another scope by 'global' or 'nonlocal', is an error. When the value of
+a const assignment of the scope's own statements folds to a literal,
+the name read after the assignment is replaced by the literal, in the
+scope and nested ones not binding it; a const of a class body is
+replaced in the body only. The assignment stays, other modules may
+import the name.
+
+Build variables (see core/build_vars.py) which the unit doesn't bind
+are replaced the same way: predefined ones like __VERSION__ or
+__PLATFORM__ and ones set by '@setvar const NAME = expression'.
+
+Arithmetic, comparisons, boolean operators and conditional expressions
+of replaced names are folded, results too large for a constant are left
+as they are. Branches of if and while statements whose test folded to a
+literal are removed unless the function would change: become a plain
+function from a generator or coroutine, or read a global instead of a
+local. Expressions of literals only are left for CPython to fold, the
+value of a const assignment aside, so a unit without const names and
+build variables stays unchanged and keeps its comments.
+
+Literals put by the pass are marked and keep the mark when the inline
+pass copies them into callers, the 'fold' pass folds them there.
+"""
+import ast
+import operator
+import warnings
+
+from errors import TransformError
+from core.semantic.scopes import bound_by, bound_names, parameters, scope_nodes
+from core.transformer.unit import TranslationUnit
+
+literal_types = (int, float, complex, str, bytes, bool, type(None))
+# limits of folded values, the ones of CPython's optimizer
+max_int_bits = 128
+max_length = 4096
+
+binary_operators = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+    ast.BitOr: operator.or_, ast.BitXor: operator.xor, ast.BitAnd: operator.and_,
+}
+unary_operators = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert, ast.Not: operator.not_}
+compare_operators = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def is_literal(value) -> bool:
+    """ value is written in output as a literal """
+    if not isinstance(value, literal_types):
+        return False
+    if isinstance(value, (str, bytes)):
+        return len(value) <= max_length
+    return value == value     # nan has no literal
+
+
+def literal(node: ast.expr) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, literal_types)
+
+
+def affordable(op: ast.operator, left, right) -> bool:
+    """ operator doesn't build a huge value before its result is checked """
+    if isinstance(op, ast.Pow) and isinstance(left, int) and isinstance(right, int) and right > 0:
+        return abs(left) <= 1 or left.bit_length() * right <= max_int_bits
+    if isinstance(op, ast.LShift) and isinstance(left, int) and isinstance(right, int):
+        return left.bit_length() + right <= max_int_bits
+    if isinstance(op, ast.Mult):
+        for sequence, count in ((left, right), (right, left)):
+            if isinstance(sequence, (str, bytes)) and isinstance(count, int):
+                return len(sequence) * count <= max_length
+    return not (isinstance(op, ast.Mod) and isinstance(left, (str, bytes)))    # formatting widths may be any
+
+
+def evaluate(function, *operands) -> tuple[object, bool]:
+    """ :return: result and whether it is a literal, an error or a warning isn't """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            value = function(*operands)
+    except Exception:
+        return None, False
+    if isinstance(value, int) and value.bit_length() > max_int_bits:
+        return None, False
+    return value, is_literal(value)
+
+
+def _constant(node: ast.expr, value) -> ast.Constant:
+    """ literal replacing node, marked as put by the pass """
+    constant = ast.copy_location(ast.Constant(value), node)
+    constant.propagated = True
+    return constant
+
+
+def propagated(node: ast.expr) -> bool:
+    return literal(node) and getattr(node, "propagated", False)
+
+
+class Folder(ast.NodeTransformer):
+    """ folds expressions of literals put by the pass, removes dead branches """
+
+    def __init__(self, literals: bool = False):
+        """ :param literals: expressions of literals of source are folded too """
+        self.literals = literals
+        self.functions: list[ast.AST | None] = [None]   # function of visited statements, None out of functions
+        self.folded = 0
+
+    def fold(self, node: ast.expr, value) -> ast.Constant:
+        self.folded += 1
+        return _constant(node, value)
+
+    def foldable(self, *operands: ast.expr) -> bool:
+        """ operands are literals, one of them put by the pass """
+        return all(map(literal, operands)) and (self.literals or any(map(propagated, operands)))
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        node = self.generic_visit(node)
+        if self.foldable(node.left, node.right) and affordable(node.op, node.left.value, node.right.value):
+            value, ok = evaluate(binary_operators[type(node.op)], node.left.value, node.right.value)
+            if ok:
+                return self.fold(node, value)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        node = self.generic_visit(node)
+        if self.foldable(node.operand):
+            value, ok = evaluate(unary_operators[type(node.op)], node.operand.value)
+            if ok:
+                return self.fold(node, value)
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        node = self.generic_visit(node)
+        operands = [node.left] + node.comparators
+        if not self.foldable(*operands) or not all(type(op) in compare_operators for op in node.ops):
+            return node     # 'is' of literals depends on interning
+        value = True
+        for left, op, right in zip(operands, node.ops, operands[1:]):
+            value, ok = evaluate(compare_operators[type(op)], left.value, right.value)
+            if not ok:
+                return node
+            if not value:
+                break
+        return self.fold(node, value)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.expr:
+        node = self.generic_visit(node)
+        values = node.values
+        # leading literals either decide the result or are skipped
+        while len(values) > 1 and self.foldable(values[0]):
+            if bool(values[0].value) == isinstance(node.op, ast.Or):
+                return self.fold(node, values[0].value)
+            values = values[1:]
+        if len(values) == len(node.values):
+            return node
+        self.folded += 1
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.expr:
+        node = self.generic_visit(node)
+        if not self.foldable(node.test):
+            return node
+        self.folded += 1
+        return node.body if node.test.value else node.orelse
+
+    def visit_If(self, node: ast.If):
+        node = self.generic_visit(node)
+        if not self.foldable(node.test):
+            return node
+        kept, dead = (node.body, node.orelse) if node.test.value else (node.orelse, node.body)
+        if not self.removable(dead):
+            return node
+        self.folded += 1
+        return kept
+
+    def visit_While(self, node: ast.While):
+        node = self.generic_visit(node)
+        if not self.foldable(node.test) or node.test.value or not self.removable(node.body):
+            return node
+        self.folded += 1
+        return node.orelse
+
+    def removable(self, dead: list[ast.stmt]) -> bool:
+        for node in scope_nodes(dead):
+            if isinstance(node, (ast.Yield, ast.YieldFrom, ast.Await, ast.Global, ast.Nonlocal)):
+                return False
+        function = self.functions[-1]
+        names = bound_names(dead)
+        if function is None or not names:
+            return True     # names left unbound out of functions are looked up in globals either way
+        inside = {id(n) for statement in dead for n in ast.walk(statement)}
+        return not any(isinstance(n, ast.Name) and n.id in names and id(n) not in inside
+                       for n in ast.walk(function))
+
+    def visit_FunctionDef(self, node):
+        self.functions.append(node)
+        node = self.generic_visit(node)
+        self.functions.pop()
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.functions.append(None)
+        node = self.generic_visit(node)
+        self.functions.pop()
+        return node
+
+
+class Propagation(ast.NodeTransformer):
+    """ replaces names of literals read after their assignment """
+
+    def __init__(self, values: dict[str, object], assigned: dict[str, int], kind: str):
+        """
+        :param assigned: name -> last line of its assignment, names without one are replaced everywhere
+        :param kind: kind of scope of the names, 'module', 'function' or 'class'
+        """
+        self.values = values
+        self.assigned = assigned
+        self.scopes: list[tuple[str, set[str]]] = [(kind, set())]   # kind and bound names of scopes
+        self.replaced = 0
+
+    def hidden(self, name: str) -> bool:
+        last = len(self.scopes) - 1
+        return any(name in bound for i, (kind, bound) in enumerate(self.scopes) if kind != "class" or i == last)
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        if isinstance(node.ctx, ast.Load) and node.id in self.values and not self.hidden(node.id) \
+                and node.lineno > self.assigned.get(node.id, 0):
+            self.replaced += 1
+            return _constant(node, self.values[node.id])
+        return node
+
+    def nested(self, kind: str, bound: set[str], node: ast.AST, fields: tuple[str, ...]) -> None:
+        """ visits fields of node which are evaluated in a nested scope binding given names """
+        if self.scopes[0][0] == "class":
+            return      # names of class body aren't seen by nested scopes
+        self.scopes.append((kind, bound))
+        for field in fields:
+            value = getattr(node, field)
+            setattr(node, field, [self.visit(v) for v in value] if isinstance(value, list) else self.visit(value))
+        self.scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        node.decorator_list = [self.visit(d) for d in node.decorator_list]
+        node.args = self.visit(node.args)
+        if node.returns is not None:
+            node.returns = self.visit(node.returns)
+        bound = bound_names(node.body) | {a.arg for a in parameters(node.args)} | _declared(node.body)
+        self.nested("function", bound, node, ("body",))
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_arguments(self, node: ast.arguments) -> ast.arguments:
+        # defaults and annotations are evaluated in scope of definition
+        node.defaults = [self.visit(d) for d in node.defaults]
+        node.kw_defaults = [d if d is None else self.visit(d) for d in node.kw_defaults]
+        for a in parameters(node):
+            if a.annotation is not None:
+                a.annotation = self.visit(a.annotation)
+        return node
+
+    def visit_Lambda(self, node: ast.Lambda):
+        node.args = self.visit(node.args)
+        self.nested("function", {a.arg for a in parameters(node.args)}, node, ("body",))
+        return node
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        node.decorator_list = [self.visit(d) for d in node.decorator_list]
+        node.bases = [self.visit(b) for b in node.bases]
+        node.keywords = [self.visit(k) for k in node.keywords]
+        self.nested("class", bound_names(node.body) | _declared(node.body), node, ("body",))
+        return node
+
+    def visit_comprehension_scope(self, node):
+        targets = {n.id for g in node.generators for n in ast.walk(g.target) if isinstance(n, ast.Name)}
+        fields = ("key", "value") if isinstance(node, ast.DictComp) else ("elt",)
+        self.nested("function", targets, node, fields + ("generators",))
+        return node
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_comprehension_scope
+
+
+def _declared(statements: list[ast.stmt]) -> set[str]:
+    """ names declared global or nonlocal by statements of one scope """
+    return {name for n in scope_nodes(statements) if isinstance(n, (ast.Global, ast.Nonlocal)) for name in n.names}
+
+
+def _scopes(tree: ast.Module):
+    """ yields kind, node and statements of scopes having statements, enclosing ones first """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Module):
+            yield "module", node, node.body
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            yield "function", node, node.body
+        elif isinstance(node, ast.ClassDef):
+            yield "class", node, node.body
+
+
+def _const_name(statement: ast.stmt) -> str:
+    """ :return: name assigned by const statement """
+    targets = _targets(statement)
+    if len(targets) != 1 or not isinstance(targets[0], ast.Name) or statement.value is None:
+        raise TransformError("const assignment binds one name to a value", statement.lineno - 1)
+    return targets[0].id
+
+
+def _check_rebinding(kind: str, scope: ast.AST, statements: list[ast.stmt], names: dict[str, ast.stmt]) -> None:
+    """ :raise TransformError: const name is bound by another node of its scope or declared by a nested one """
+    for node in scope_nodes(statements):
+        for name in bound_by(node):
+            const = names.get(name)
+            if const is not None and not (isinstance(node, ast.Name) and node in _targets(const)):
+                raise TransformError(f"const '{name}' is bound again", node.lineno - 1)
+    if kind == "function":
+        for a in parameters(scope.args):
+            if a.arg in names:
+                raise TransformError(f"const '{a.arg}' is a parameter", names[a.arg].lineno - 1)
+    if kind == "class":
+        return
+    declaration = ast.Global if kind == "module" else ast.Nonlocal
+    for node in ast.walk(scope):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node is not scope:
+            declared = {name for n in scope_nodes(node.body) if isinstance(n, declaration) for name in n.names}
+            for name in declared & bound_names(node.body) & names.keys():
+                raise TransformError(f"const '{name}' is bound again by '{node.name}'", node.lineno - 1)
+
+
+def _targets(statement: ast.stmt) -> list[ast.expr]:
+    return statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+
+
+def _unit_bound(tree: ast.Module) -> set[str]:
+    """ names bound anywhere in unit """
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        else:
+            bound.update(bound_by(node))
+    return bound
+
+
+def build_variables(unit: TranslationUnit) -> dict[str, object]:
+    """ literal values of predefined and const build variables read by unit """
+    table = unit.variables
+    if table is None:
+        return {}
+    read = {n.id for n in ast.walk(unit.tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+    values = {}
+    for name in read - _unit_bound(unit.tree):
+        if name not in table.vars:
+            continue
+        var = table.vars.get(name)
+        if isinstance(var, dict):       # set by @setvar, see BuildVarsTable.add
+            if "const" not in var.get("qualifiers", ()):
+                continue
+            var = var.get("value")
+        if is_literal(var):
+            values[name] = var
+    return values
+
+
+def const(unit: TranslationUnit) -> None:
+    """ transformer pass propagating const names and build variables, then folding literals """
+    replaced = 0
+    for kind, scope, statements in _scopes(unit.tree):
+        consts = {}
+        for statement in scope_nodes(statements):
+            if isinstance(statement, (ast.Assign, ast.AnnAssign)) and unit.qualified(statement, "const"):
+                consts[_const_name(statement)] = statement
+        if not consts:
+            continue
+        _check_rebinding(kind, scope, statements, consts)
+
+        values, assigned = {}, {}
+        names = {id(s): name for name, s in consts.items()}
+        for statement in statements:    # consts of nested blocks may be left unassigned
+            name = names.get(id(statement))
+            if name is None:
+                continue
+            propagation, folder = Propagation(values, assigned, kind), Folder(literals=True)
+            statement.value = folder.visit(propagation.visit(statement.value))
+            replaced += propagation.replaced + folder.folded
+            if literal(statement.value) and is_literal(statement.value.value):
+                values[name] = statement.value.value
+                assigned[name] = statement.end_lineno
+        if values:
+            propagation = Propagation(values, assigned, kind)
+            statements[:] = [propagation.visit(s) for s in statements]
+            replaced += propagation.replaced
+
+    variables = build_variables(unit)
+    if variables:
+        propagation = Propagation(variables, {}, "module")
+        propagation.visit(unit.tree)
+        replaced += propagation.replaced
+
+    if replaced:
+        folder = Folder()
+        folder.visit(unit.tree)
+        _filled(unit.tree)
+        unit.changed = True
+
+
+def fold(unit: TranslationUnit) -> None:
+    """ transformer pass folding literals of const pass copied by passes run after it, e.g. inline """
+    folder = Folder()
+    folder.visit(unit.tree)
+    if folder.folded:
+        _filled(unit.tree)
+        unit.changed = True
+
+
+def _filled(tree: ast.Module) -> None:
+    """ bodies emptied by removed branches get 'pass' """
+    for node in ast.walk(tree):
+        if getattr(node, "body", None) == [] and not isinstance(node, ast.Module):
+            node.body = [ast.copy_location(ast.Pass(), node)]
@@ -0,0 +1,549 @@
+"""
+In this file, the inline pass is defined.
+
+Calls of 'inline' functions and methods are replaced by their bodies.
+A body of one return is substituted as expression where the call was,
+other bodies are put before the statement whose whole value is the call:
+
+    inline def dot(a, b):                   s = dot(v, w) * 2
+        return a.x * b.x + a.y * b.y   ->   s = (v.x * w.x + v.y * w.y) * 2
+
+    total += mean(row)                      _mean_s_1 = 0
+                                       ->   for _mean_x_2 in row: ...
+                                            total += _mean_s_1 / len(row)
+
+Locals of inlined body are renamed to names unused in the unit, and an
+argument is evaluated once in its place: arguments which aren't
+constants or locals of caller are bound to such names first, in the
+order they are written. Locals which arguments rebind with ':=' or
+nested functions declare nonlocal are bound as well. A call is
+inlined when its target is known statically:
+
+    - a function of the module, f(...), not shadowed at call site;
+    - a method by its class, C.m(x, ...), or by a receiver of known
+      class: self in methods of C, variables of caller assigned only
+      instances C(...) or annotated as C; methods overridden by a
+      subclass of the unit aren't inlined by receiver, other inline
+      methods are taken as final.
+
+'inline' is a hint, functions which can't be inlined stay calls: those
+calling themselves through inline functions, generators, ones with
+nested scopes, decorators, global or nonlocal names, returns before the
+end of body, and bodies larger than the budget ('--inline-budget', in
+nodes of syntax tree). Names the body reads from module must mean the
+same at call site, calls where a caller's local hides one aren't
+inlined. Definitions are kept, so functions can still be referenced.
+"""
+import ast
+import copy
+import itertools
+
+from core.semantic.scopes import bound_names, bound_once, nested_scopes, parameters, scope_nodes
+from core.transformer.unit import TranslationUnit
+
+default_budget = 40
+
+_unsupported = nested_scopes + (ast.Yield, ast.YieldFrom, ast.Await, ast.Global, ast.Nonlocal, ast.NamedExpr)
+# builtins depending on frame they are called in
+_frame_functions = {"super", "locals", "vars", "eval", "exec", "dir", "__class__"}
+# expression nodes evaluating their operands conditionally or calling code
+_impure = (ast.Call, ast.BoolOp, ast.IfExp, ast.Await, ast.NamedExpr)
+
+
+class Inlinable:
+    """ snapshot of inline function taken before the tree is changed """
+    __slots__ = ("name", "owner", "positional", "keyword", "defaults", "statements", "value",
+                 "locals", "assigned", "free", "uses", "pure", "size")
+
+    def __init__(self, function: ast.FunctionDef, owner: str | None):
+        self.name = function.name
+        self.owner = owner      # class of method, None for function
+        arguments = function.args
+        self.positional = [a.arg for a in arguments.posonlyargs + arguments.args]
+        self.keyword = [a.arg for a in arguments.args + arguments.kwonlyargs]
+        defaults = arguments.posonlyargs + arguments.args
+        self.defaults = dict(zip([a.arg for a in defaults[len(defaults) - len(arguments.defaults):]],
+                                 arguments.defaults))
+        self.defaults.update((a.arg, d) for a, d in zip(arguments.kwonlyargs, arguments.kw_defaults) if d)
+
+        body = function.body[1:] if ast.get_docstring(function, clean=False) is not None else function.body
+        body = copy.deepcopy(body)
+        last = body[-1] if body else None
+        if isinstance(last, ast.Return):
+            self.statements, self.value = body[:-1], last.value
+        else:
+            self.statements, self.value = body, None
+
+        nodes = list(scope_nodes(self.statements + ([self.value] if self.value else [])))
+        self.size = len(nodes)
+        params = {a.arg for a in parameters(arguments)}
+        self.assigned = bound_names(self.statements) & params
+        self.locals = bound_names(self.statements) | params
+        loaded = [n.id for n in nodes if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)]
+        self.free = {name for name in loaded if name not in self.locals}
+        self.uses = {name: loaded.count(name) for name in params}
+        self.pure = not any(isinstance(n, _impure) for n in nodes)
+
+    def supported(self, function: ast.FunctionDef, budget: int) -> bool:
+        arguments = function.args
+        if function.decorator_list or arguments.vararg or arguments.kwarg or self.size > budget:
+            return False
+        if not all(isinstance(d, ast.Constant) for d in self.defaults.values()):
+            return False
+        for node in scope_nodes(self.statements + ([self.value] if self.value else [])):
+            if isinstance(node, (_unsupported, ast.Return)):
+                return False
+            if isinstance(node, ast.Name) and (node.id in _frame_functions or _private(node.id)):
+                return False
+        return True
+
+    def callees(self) -> set[str]:
+        """ names of functions and methods called by body """
+        found = set()
+        for node in scope_nodes(self.statements + ([self.value] if self.value else [])):
+            if isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name):
+                    found.add(node.func.id)
+                elif isinstance(node.func, ast.Attribute):
+                    found.add(node.func.attr)
+        return found
+
+
+def _private(name: str) -> bool:
+    return name.startswith("__") and not name.endswith("__")
+
+
+class Frame:
+    """ scope a call is in """
+    __slots__ = ("kind", "bound", "locals", "types")
+
+    def __init__(self, kind: str, bound: set[str], local: set[str] = frozenset(), types: dict | None = None):
+        self.kind = kind            # "function", "class" or "comprehension"
+        self.bound = bound          # names hiding globals
+        self.locals = local         # names no callee can rebind
+        self.types = types or {}    # local -> class of its values
+
+
+class Inliner(ast.NodeTransformer):
+
+    def __init__(self, unit: TranslationUnit, budget: int):
+        self.unit = unit
+        tree = unit.tree
+        self.names = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)} | \
+                     {a.arg for a in ast.walk(tree) if isinstance(a, ast.arg)}
+        self.counter = itertools.count(1)
+        self.frames: list[Frame] = []
+
+        once = bound_once(tree.body)
+        self.classes = {n.name: n for n in tree.body if isinstance(n, ast.ClassDef) and n.name in once}
+        self.functions: dict[str, Inlinable] = {}
+        self.methods: dict[tuple[str, str], Inlinable] = {}
+        candidates = []
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name in once and unit.qualified(node, "inline"):
+                candidates.append((node, None))
+            elif node.__class__ is ast.ClassDef and node.name in self.classes:
+                methods = bound_once(node.body)
+                candidates.extend((m, node.name) for m in node.body if isinstance(m, ast.FunctionDef)
+                                  and m.name in methods and unit.qualified(m, "inline"))
+        for function, owner in candidates:
+            inlinable = Inlinable(function, owner)
+            if inlinable.supported(function, budget):
+                if owner is None:
+                    self.functions[function.name] = inlinable
+                else:
+                    self.methods[owner, function.name] = inlinable
+        self._remove_recursive()
+
+    def _remove_recursive(self) -> None:
+        """ drops inline functions reaching themselves, methods are matched by name only """
+        by_name: dict[str, list[Inlinable]] = {}
+        for inlinable in itertools.chain(self.functions.values(), self.methods.values()):
+            by_name.setdefault(inlinable.name, []).append(inlinable)
+        edges = {id(i): [c for name in i.callees() for c in by_name.get(name, ())]
+                 for group in by_name.values() for i in group}
+
+        def reaches(start: Inlinable) -> bool:
+            seen, stack = set(), list(edges[id(start)])
+            while stack:
+                node = stack.pop()
+                if node is start:
+                    return True
+                if id(node) not in seen:
+                    seen.add(id(node))
+                    stack.extend(edges[id(node)])
+            return False
+
+        recursive = {id(i) for group in by_name.values() for i in group if reaches(i)}
+        self.functions = {k: v for k, v in self.functions.items() if id(v) not in recursive}
+        self.methods = {k: v for k, v in self.methods.items() if id(v) not in recursive}
+
+    # resolution of call targets
+
+    def method(self, class_name: str, name: str) -> Inlinable | None:
+        """ method of class or of its single base chain in the unit """
+        while class_name in self.classes:
+            node = self.classes[class_name]
+            inlinable = self.methods.get((class_name, name))
+            if inlinable is not None:
+                return inlinable
+            if any(isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and m.name == name for m in node.body):
+                return None
+            if len(node.bases) != 1 or not isinstance(node.bases[0], ast.Name):
+                return None
+            class_name = node.bases[0].id
+        return None
+
+    def overridden(self, class_name: str, name: str) -> bool:
+        """ a subclass of the unit defines method again """
+        for node in self.classes.values():
+            base = node
+            while len(base.bases) == 1 and isinstance(base.bases[0], ast.Name) and base.bases[0].id in self.classes:
+                base = self.classes[base.bases[0].id]
+                if base.name == class_name:
+                    if any(isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and m.name == name
+                           for m in node.body):
+                        return True
+                    break
+        return False
+
+    def hidden(self, name: str) -> bool:
+        """ name means something else than global of the unit at call site """
+        for i, frame in enumerate(self.frames):
+            if (frame.kind != "class" or i == len(self.frames) - 1) and name in frame.bound:
+                return True
+        return False
+
+    def local_type(self, name: str) -> str | None:
+        frame = self.frames[-1] if self.frames else None
+        if frame is None or frame.kind != "function":
+            return None
+        return frame.types.get(name)
+
+    def target(self, call: ast.Call) -> tuple[Inlinable, list[ast.expr]] | None:
+        """ inlined function and its positional arguments, receiver included """
+        func, args = call.func, list(call.args)
+        if any(isinstance(a, ast.Starred) for a in args) or any(k.arg is None for k in call.keywords):
+            return None
+        if isinstance(func, ast.Name):
+            inlinable = self.functions.get(func.id)
+            if inlinable is None or self.hidden(func.id):
+                return None
+        elif isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            receiver = func.value.id
+            if receiver in self.classes and not self.hidden(receiver):
+                inlinable = self.method(receiver, func.attr)
+            else:
+                class_name = self.local_type(receiver)
+                if class_name is None or self.overridden(class_name, func.attr):
+                    return None
+                inlinable = self.method(class_name, func.attr)
+                args.insert(0, func.value)
+            if inlinable is None:
+                return None
+        else:
+            return None
+        if any(self.hidden(name) for name in inlinable.free):
+            return None
+        return inlinable, args
+
+    def bind(self, inlinable: Inlinable, call: ast.Call, args: list[ast.expr]) -> dict[str, ast.expr] | None:
+        """ parameter -> argument, None if arguments don't match """
+        if len(args) > len(inlinable.positional):
+            return None
+        bound = dict(zip(inlinable.positional, args))
+        for keyword in call.keywords:
+            if keyword.arg in bound or keyword.arg not in inlinable.keyword:
+                return None
+            bound[keyword.arg] = keyword.value
+        for name, default in inlinable.defaults.items():
+            bound.setdefault(name, default)
+        if len(bound) != len(inlinable.uses):
+            return None
+        return bound
+
+    def stable(self, argument: ast.expr, rebound: set[str] = frozenset()) -> bool:
+        """
+        argument can be read at its uses instead of once before body
+        :param rebound: names arguments of the call bind, see _rebound
+        """
+        if isinstance(argument, ast.Constant):
+            return True
+        return (isinstance(argument, ast.Name) and bool(self.frames) and self.frames[-1].kind != "class"
+                and argument.id in self.frames[-1].locals and argument.id not in rebound)
+
+    # substitution
+
+    def fresh(self, inlinable: Inlinable, name: str) -> str:
+        while True:
+            candidate = f"_{inlinable.name}_{name}_{next(self.counter)}"
+            if candidate not in self.names:
+                self.names.add(candidate)
+                return candidate
+
+    def expression(self, call: ast.Call) -> ast.expr | None:
+        found = self.target(call)
+        if found is None:
+            return None
+        inlinable, args = found
+        if inlinable.statements:
+            return None
+        bound = self.bind(inlinable, call, args)
+        if bound is None:
+            return None
+        # arguments in call order, ones evaluated in place must keep it
+        rebound = _rebound(call)
+        unstable = [name for name in _call_order(call, bound) if not self.stable(bound[name], rebound)]
+        if unstable:
+            if not inlinable.pure or any(inlinable.uses[name] != 1 for name in unstable):
+                return None
+            used = [n.id for n in scope_nodes([inlinable.value]) if isinstance(n, ast.Name) and n.id in unstable]
+            if used != unstable:
+                return None
+        if inlinable.value is None:
+            return _located(ast.Constant(None), call)
+        value = Substitution(bound, {}, inlinable.owner).visit(copy.deepcopy(inlinable.value))
+        return self.visit(_located(value, call))
+
+    def statements(self, statement: ast.stmt, call: ast.Call) -> list[ast.stmt] | None:
+        if self.frames and self.frames[-1].kind == "class":
+            return None     # renamed locals would become class attributes
+        found = self.target(call)
+        if found is None:
+            return None
+        inlinable, args = found
+        bound = self.bind(inlinable, call, args)
+        if bound is None:
+            return None
+
+        hoisted = []
+        names, arguments = {}, {}
+        rebound = _rebound(call)
+        for name in _call_order(call, bound):     # hoisted arguments are evaluated as written
+            argument = bound[name]
+            if name not in inlinable.assigned and self.stable(argument, rebound):
+                arguments[name] = argument
+            elif name not in names:
+                names[name] = self.fresh(inlinable, name)
+                hoisted.append(ast.Assign([ast.Name(names[name], ast.Store())], argument))
+                if isinstance(argument, ast.Name) and self.local_type(argument.id):
+                    self.frames[-1].types[names[name]] = self.local_type(argument.id)
+        for name in inlinable.locals - set(arguments) - set(names):
+            names[name] = self.fresh(inlinable, name)
+        if self.frames and self.frames[-1].kind == "function":
+            # renamed locals are locals of caller now
+            self.frames[-1].locals = self.frames[-1].locals | set(names.values())
+
+        substitution = Substitution(arguments, names, inlinable.owner)
+        body = [substitution.visit(s) for s in copy.deepcopy(inlinable.statements)]
+        value = substitution.visit(copy.deepcopy(inlinable.value)) if inlinable.value is not None else None
+
+        if isinstance(statement, ast.Expr):
+            tail = [ast.Expr(value)] if value is not None and not isinstance(value, (ast.Constant, ast.Name)) else []
+        elif isinstance(statement, ast.Assign):
+            tail = [ast.Assign(statement.targets, value or ast.Constant(None))]
+        elif isinstance(statement, ast.AugAssign):
+            tail = [ast.AugAssign(statement.target, statement.op, value or ast.Constant(None))]
+        else:
+            tail = [ast.Return(value)]
+        result = []
+        for node in hoisted + body + tail:
+            visited = self.visit(_located(node, statement))
+            result.extend(visited if isinstance(visited, list) else [visited])
+        return result
+
+    # visitors
+
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        node = self.generic_visit(node)
+        inlined = self.expression(node)
+        return inlined if inlined is not None else node
+
+    def _statement(self, node: ast.stmt):
+        node = self.generic_visit(node)
+        call = node.value
+        if not isinstance(call, ast.Call):
+            return node
+        if isinstance(node, ast.AugAssign) and not (
+                isinstance(node.target, ast.Name) and self.stable(node.target, _rebound(call))):
+            return node
+        inlined = self.statements(node, call)
+        return inlined if inlined is not None else node
+
+    visit_Expr = visit_Assign = visit_AugAssign = _statement
+
+    def visit_Return(self, node: ast.Return):
+        if node.value is None:
+            return node
+        return self._statement(node)
+
+    def visit_FunctionDef(self, node):
+        # decorators and defaults are evaluated in enclosing scope
+        node.decorator_list = [self.visit(d) for d in node.decorator_list]
+        arguments = node.args
+        arguments.defaults = [self.visit(d) for d in arguments.defaults]
+        arguments.kw_defaults = [d and self.visit(d) for d in arguments.kw_defaults]
+        params = parameters(arguments)
+        body_bound = bound_names(node.body)
+        # names nested functions declare nonlocal may change under any call
+        declared = {name for s in node.body for n in ast.walk(s) if isinstance(n, (ast.Global, ast.Nonlocal))
+                    for name in n.names}
+        global_names = {name for n in scope_nodes(node.body) if isinstance(n, ast.Global) for name in n.names}
+        bound = (body_bound | {a.arg for a in params}) - global_names
+        local = bound - declared
+
+        types = {}
+        owner = self.frames[-1] if len(self.frames) == 1 else None
+        positional = arguments.posonlyargs + arguments.args
+        if owner is not None and "" in owner.types and positional and not node.decorator_list:
+            types[positional[0].arg] = owner.types[""]     # receiver of method
+        for a in params:
+            if isinstance(a.annotation, ast.Name) and a.annotation.id in self.classes:
+                types.setdefault(a.arg, a.annotation.id)
+        constructed = _constructed(node.body, self.classes)
+        for name in body_bound & local:
+            if name in constructed and types.get(name, constructed[name]) == constructed[name]:
+                types[name] = constructed[name]
+            else:
+                types.pop(name, None)
+        for name in set(types) - local:
+            del types[name]
+
+        self.frames.append(Frame("function", bound, local, types))
+        node.body = self._body(node.body)
+        self.frames.pop()
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        params = {a.arg for a in parameters(node.args)}
+        self.frames.append(Frame("function", params, params))
+        node.body = self.visit(node.body)
+        self.frames.pop()
+        return node
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        node.bases = [self.visit(b) for b in node.bases]
+        node.keywords = [self.visit(k) for k in node.keywords]
+        node.decorator_list = [self.visit(d) for d in node.decorator_list]
+        frame = Frame("class", bound_names(node.body))
+        if not self.frames and node.name in self.classes:
+            frame.types[""] = node.name     # class of receiver of its methods
+        self.frames.append(frame)
+        node.body = self._body(node.body)
+        self.frames.pop()
+        return node
+
+    def _comprehension(self, node):
+        targets = {n.id for g in node.generators for n in ast.walk(g.target) if isinstance(n, ast.Name)}
+        # the first iterable is evaluated in enclosing scope
+        node.generators[0].iter = self.visit(node.generators[0].iter)
+        self.frames.append(Frame("comprehension", targets, targets))
+        for i, generator in enumerate(node.generators):
+            if i:
+                generator.iter = self.visit(generator.iter)
+            generator.ifs = [self.visit(e) for e in generator.ifs]
+        for field in ("elt", "key", "value"):
+            if hasattr(node, field):
+                setattr(node, field, self.visit(getattr(node, field)))
+        self.frames.pop()
+        return node
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _comprehension
+
+    def _body(self, statements: list[ast.stmt]) -> list[ast.stmt]:
+        result = []
+        for statement in statements:
+            visited = self.visit(statement)
+            result.extend(visited if isinstance(visited, list) else [visited])
+        return result
+
+
+class Substitution(ast.NodeTransformer):
+    """ puts arguments and renamed locals into copy of body """
+
+    def __init__(self, arguments: dict[str, ast.expr], names: dict[str, str], owner: str | None):
+        self.arguments = arguments
+        self.names = names
+        self.owner = owner
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        if node.id in self.names:
+            return ast.copy_location(ast.Name(self.names[node.id], node.ctx), node)
+        if node.id in self.arguments and isinstance(node.ctx, ast.Load):
+            return copy.deepcopy(self.arguments[node.id])
+        return node
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.expr:
+        node = self.generic_visit(node)
+        if self.owner is not None and _private(node.attr):
+            node.attr = f"_{self.owner.lstrip('_')}{node.attr}"     # mangled as in its class
+        return node
+
+
+def _position(call: ast.Call, argument: ast.expr) -> int:
+    """ index of argument in call, -1 for receiver evaluated before arguments """
+    arguments = call.args + [k.value for k in call.keywords]
+    return next((i for i, a in enumerate(arguments) if a is argument), -1)
+
+
+def _call_order(call: ast.Call, bound: dict[str, ast.expr]) -> list[str]:
+    """ parameters by position of their arguments in call, defaults are constants """
+    return sorted(bound, key=lambda name: _position(call, bound[name]))
+
+
+def _rebound(call: ast.Call) -> set[str]:
+    """ names bound by assignment expressions of arguments, receiver included """
+    return {n.target.id for a in [call.func] + call.args + [k.value for k in call.keywords]
+            for n in ast.walk(a) if isinstance(n, ast.NamedExpr)}
+
+
+def _constructed(statements: list[ast.stmt], classes: dict) -> dict[str, str]:
+    """ locals whose every binding is 'x = C(...)' or 'x: C', mapped to C """
+    found: dict[str, str | None] = {}
+    typed = set()   # ids of Name nodes bound by such statements
+    for node in scope_nodes(statements):
+        class_name = None
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            target, value = node.targets[0], node.value
+            if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id in classes:
+                class_name = value.func.id
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            target, annotation = node.target, node.annotation
+            if isinstance(annotation, ast.Name) and annotation.id in classes:
+                class_name = annotation.id
+        else:
+            continue
+        typed.add(id(target))
+        found[target.id] = class_name if found.get(target.id, class_name) == class_name else None
+    # other bindings (loops, augmented assignments, imports, ...) make the type unknown
+    for node in scope_nodes(statements):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load) and id(node) not in typed:
+            found[node.id] = None
+    for name in bound_names(statements) - typed_names(statements):
+        found[name] = None
+    return {name: class_name for name, class_name in found.items() if class_name is not None}
+
+
+def typed_names(statements: list[ast.stmt]) -> set[str]:
+    """ names bound as Name targets, other bindings are definitions and imports """
+    return {n.id for n in scope_nodes(statements) if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load)}
+
+
+def _located(node: ast.AST, origin: ast.AST) -> ast.AST:
+    """ places every node of new subtree at origin, tracebacks point at the inlined call """
+    for child in ast.walk(node):
+        if "lineno" in child._attributes:
+            ast.copy_location(child, origin)
+    return node
+
+
+def inline(unit: TranslationUnit) -> None:
+    if not any(unit.qualified(node, "inline") for node in unit.qualifiers):
+        return
+    budget = getattr(unit.config, "inline_budget", None)
+    inliner = Inliner(unit, default_budget if budget is None else budget)
+    if inliner.functions or inliner.methods:
+        inliner.visit(unit.tree)
+        unit.changed = True
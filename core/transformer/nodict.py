@@ -0,0 +1,208 @@
+"""
+In this file, the nodict pass is defined.
+
+    nodict class Vector:                class Vector:
+        x: float                            __slots__ = ('x', 'y')
+                                    ->      x: float
+        def __init__(self, y):              def __init__(self, y):
+            self.y = y                          self.y = y
+
+Fields of a nodict class are its annotated class-level names (ClassVar
+ones aside) and attributes assigned to the instance in __init__, they
+become __slots__ and instances get no __dict__. Bases are resolved by
+name among classes of the unit defined before:
+
+    - fields of a slotted base are inherited and aren't declared again;
+    - a base of the unit without __slots__ gives instances __dict__
+      anyway, it is an error;
+    - several bases with fields can't be combined by Python, it is an
+      error too;
+    - other bases (imported ones, expressions) aren't checked.
+
+Assigning an attribute which isn't a field raises AttributeError at run
+time, so methods assigning one are reported at compile time, as well
+as class-level defaults of fields which __slots__ doesn't allow.
+"""
+import ast
+
+from errors import TransformError
+from core.transformer.unit import TranslationUnit
+
+
+def mangle(name: str, class_name: str) -> str:
+    """ name of private attribute as stored, __slots__ are mangled the same way """
+    if name.startswith("__") and not name.endswith("__") and class_name.strip("_"):
+        return f"_{class_name.lstrip('_')}{name}"
+    return name
+
+
+def is_class_var(annotation: ast.expr) -> bool:
+    if isinstance(annotation, ast.Constant) and isinstance(annotation.value, str):  # forward reference
+        try:
+            annotation = ast.parse(annotation.value, mode="eval").body
+        except SyntaxError:
+            return False
+    if isinstance(annotation, ast.Subscript):
+        annotation = annotation.value
+    if isinstance(annotation, ast.Attribute):
+        return annotation.attr == "ClassVar"
+    return isinstance(annotation, ast.Name) and annotation.id == "ClassVar"
+
+
+def receiver(function: ast.FunctionDef | ast.AsyncFunctionDef) -> str | None:
+    """ name of instance parameter of method, None for static and class methods """
+    for decorator in function.decorator_list:
+        if isinstance(decorator, ast.Name) and decorator.id in ("staticmethod", "classmethod"):
+            return None
+    parameters = function.args.posonlyargs + function.args.args
+    return parameters[0].arg if parameters else None
+
+
+def assigned_attributes(function: ast.FunctionDef | ast.AsyncFunctionDef) -> list[tuple[str, ast.Attribute]]:
+    """ attributes of instance assigned in method body in source order, nested scopes aren't searched """
+    name = receiver(function)
+    if name is None:
+        return []
+    found = []
+    stack = list(reversed(function.body))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if (isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store)
+                and isinstance(node.value, ast.Name) and node.value.id == name):
+            found.append((node.attr, node))
+        stack.extend(reversed(list(ast.iter_child_nodes(node))))
+    return found
+
+
+class Layouts(ast.NodeVisitor):
+    """ visits classes in source order, keeps fields of slotted ones by name """
+
+    def __init__(self, unit: TranslationUnit):
+        self.unit = unit
+        self.fields: dict[str, frozenset[str]] = {"object": frozenset()}   # mangled fields
+        self.dict_classes: set[str] = set()     # classes of unit whose instances have __dict__
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.fields.pop(node.name, None)
+        self.dict_classes.discard(node.name)
+        if self.unit.qualified(node, "nodict"):
+            self.nodict(node)
+        else:
+            slots = declared_slots(node)
+            if slots is None:
+                self.dict_classes.add(node.name)
+            else:
+                inherited, _ = self.bases(node)
+                self.fields[node.name] = inherited | {mangle(s, node.name) for s in slots}
+        self.generic_visit(node)
+
+    def bases(self, node: ast.ClassDef) -> tuple[frozenset[str], bool]:
+        """ :return: fields inherited from bases of unit, whether all bases are known """
+        inherited, known = frozenset(), True
+        with_fields = []
+        for base in node.bases:
+            name = base.id if isinstance(base, ast.Name) else None
+            if name in self.fields:
+                if self.fields[name]:
+                    with_fields.append(name)
+                inherited |= self.fields[name]
+            elif name in self.dict_classes and self.unit.qualified(node, "nodict"):
+                raise TransformError(f"nodict class '{node.name}' derives from '{name}' whose instances "
+                                     f"have __dict__, declare '{name}' nodict", node.lineno - 1)
+            else:
+                known = False
+        if len(with_fields) > 1 and self.unit.qualified(node, "nodict"):
+            raise TransformError(f"nodict class '{node.name}' can't derive from several classes with fields: "
+                                 f"{', '.join(with_fields)}", node.lineno - 1)
+        return inherited, known
+
+    def nodict(self, node: ast.ClassDef) -> None:
+        inherited, known = self.bases(node)
+        own: list[str] = []
+        values: set[str] = set()        # class-level attributes, can't be fields
+        descriptors: set[str] = set()   # methods and properties, assigned through
+        methods = []
+
+        for statement in node.body:
+            if isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name):
+                name = statement.target.id
+                if is_class_var(statement.annotation):
+                    values.add(name)
+                elif statement.value is not None:
+                    raise TransformError(f"field '{name}' of nodict class '{node.name}' can't have a class-level "
+                                         f"default, assign it in __init__ or annotate it ClassVar",
+                                         statement.lineno - 1)
+                elif name not in own:
+                    own.append(name)
+            elif isinstance(statement, ast.Assign):
+                for target in statement.targets:
+                    for name in ast.walk(target):
+                        if isinstance(name, ast.Name):
+                            values.add(name.id)
+            elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                descriptors.add(statement.name)
+                methods.append(statement)
+            elif isinstance(statement, ast.ClassDef):
+                values.add(statement.name)
+
+        if "__slots__" in values:
+            raise TransformError(f"nodict class '{node.name}' declares __slots__ itself", node.lineno - 1)
+
+        for method in methods:
+            if method.name == "__init__":
+                for name, attribute in assigned_attributes(method):
+                    if name in values:
+                        raise TransformError(f"field '{name}' of nodict class '{node.name}' conflicts with "
+                                             f"class attribute '{name}'", attribute.lineno - 1)
+                    if name not in own and name not in descriptors:
+                        own.append(name)
+
+        fields = inherited | {mangle(name, node.name) for name in own}
+        if known:
+            # other methods may assign only fields, attributes of unknown bases can't be checked
+            for method in methods:
+                for name, attribute in assigned_attributes(method):
+                    if mangle(name, node.name) not in fields and name not in descriptors:
+                        raise TransformError(f"'{name}' is assigned in '{method.name}' but isn't a field of nodict "
+                                             f"class '{node.name}', annotate it in the class body",
+                                             attribute.lineno - 1)
+
+        slots = [name for name in own if mangle(name, node.name) not in inherited]
+        self.fields[node.name] = fields
+        insert_slots(node, slots)
+        self.unit.changed = True
+
+
+def declared_slots(node: ast.ClassDef) -> list[str] | None:
+    """ names of literal __slots__ of class, None if it has none or they can't be read """
+    for statement in node.body:
+        if (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name) and statement.targets[0].id == "__slots__"):
+            value = statement.value
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                return [value.value]
+            if isinstance(value, (ast.Tuple, ast.List)) and all(
+                    isinstance(e, ast.Constant) and isinstance(e.value, str) for e in value.elts):
+                return [e.value for e in value.elts]
+            return None
+    return None
+
+
+def insert_slots(node: ast.ClassDef, slots: list[str]) -> None:
+    """ puts '__slots__ = (...)' first in class body, after docstring """
+    position = 1 if ast.get_docstring(node, clean=False) is not None else 0
+    assign = ast.Assign(
+        targets=[ast.Name("__slots__", ast.Store())],
+        value=ast.Tuple([ast.Constant(name) for name in slots], ast.Load())
+    )
+    anchor = node.body[min(position, len(node.body) - 1)]
+    ast.copy_location(assign, anchor)
+    assign.end_lineno, assign.end_col_offset = assign.lineno, assign.col_offset
+    node.body.insert(position, ast.fix_missing_locations(assign))
+
+
+def nodict(unit: TranslationUnit) -> None:
+    if any(unit.qualified(node, "nodict") for node in unit.qualifiers):
+        Layouts(unit).visit(unit.tree)
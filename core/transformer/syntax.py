@@ -0,0 +1,104 @@
+"""
+In this file, Python+ syntax is lowered to Python.
+
+Qualifiers are words put before a statement, they are removed from
+source and kept by position of the statement they qualify, so the rest
+of the text is parsed by the ast module as it is:
+
+    nodict class Vector:        ->      class Vector:
+    inline const def norm(v):   ->      def norm(v):
+    const LIMIT = 10            ->      LIMIT = 10
+
+Line numbers don't change, columns of a qualified line are shifted by
+the removed words. A qualifier is a word of 'qualifiers' at the start
+of a statement followed by another name, such a pair is never valid
+Python, so names like 'inline' are still usable as variables.
+
+Braces of casts become brackets, the cast is a call of subscript then
+and is kept by position of its name for semantic checks (see
+core/semantic/casts.py):
+
+    comp_cast{Vector, Vector}(a + b)   ->   comp_cast[Vector, Vector](a + b)
+"""
+import ast
+import io
+import re
+import tokenize
+
+# qualifier -> statements it may qualify, their description for errors
+qualifiers: dict[str, tuple[tuple[type, ...], str]] = {
+    "nodict": ((ast.ClassDef,), "classes"),
+    "inline": ((ast.FunctionDef,), "functions"),
+    "const": ((ast.FunctionDef, ast.AsyncFunctionDef, ast.Assign, ast.AnnAssign), "functions and assignments"),
+}
+casts = ("comp_cast", "bool_cast")
+
+_candidate = re.compile(rf"^[ \t]*(?:{'|'.join(qualifiers)})[ \t]+\w|\b(?:{'|'.join(casts)})[ \t]*{{", re.M)
+_statement_start = {tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENCODING}
+
+
+class Lowered:
+    __slots__ = ("text", "qualifiers", "casts")
+
+    def __init__(self, text: str, qualified: dict[tuple[int, int], frozenset[str]], cast_names: set[tuple[int, int]]):
+        self.text = text
+        self.qualifiers = qualified     # (line, column) of qualified statement -> qualifiers
+        self.casts = cast_names         # (line, column) of names of casts
+
+
+def lower(text: str) -> Lowered:
+    """
+    positions are taken in lowered text, lines are 1-based
+    :raise SyntaxError: text can't be tokenized or brace of cast isn't closed
+    """
+    if _candidate.search(text) is None:     # tokenizer isn't run for plain Python
+        return Lowered(text, {}, set())
+
+    lines = io.StringIO(text).readlines()     # lines of tokenizer, split at '\n' only
+    qualified: dict[tuple[int, int], frozenset[str]] = {}
+    cast_names: set[tuple[int, int]] = set()
+    shifts: dict[int, int] = {}     # line -> characters removed at its start
+    opened: list[tuple[int, int] | None] = []     # braces, positions of ones of casts
+    tokens = tokenize.generate_tokens(io.StringIO(text).readline)
+    previous, name = None, None
+    run: list[tokenize.TokenInfo] = []
+    try:
+        for token in tokens:
+            if token.type in (tokenize.NL, tokenize.COMMENT):
+                continue
+            if (token.type == tokenize.NAME and token.string in qualifiers
+                    and (run or previous is None or previous.type in _statement_start)):
+                run.append(token)
+                previous = token
+                continue
+            if run:
+                (line, begin), (end_line, column) = run[0].start, token.start
+                if token.type == tokenize.NAME and end_line == line:
+                    # the statement starts where its first qualifier did
+                    qualified[line, begin] = frozenset(t.string for t in run)
+                    lines[line - 1] = lines[line - 1][:begin] + lines[line - 1][column:]
+                    shifts[line] = column - begin
+                run = []
+
+            if token.type == tokenize.OP and token.string == "{":
+                cast = name is not None and previous is name
+                if cast:
+                    line, column = name.start
+                    cast_names.add((line, column - shifts.get(line, 0)))
+                    _replace(lines, token.start, "[", shifts)
+                opened.append(token.start if cast else None)
+            elif token.type == tokenize.OP and token.string == "}" and opened:
+                if opened.pop() is not None:
+                    _replace(lines, token.start, "]", shifts)
+            name = token if token.type == tokenize.NAME and token.string in casts else None
+            previous = token
+    except tokenize.TokenError as e:
+        message, (line, column) = e.args
+        raise SyntaxError(message, ("", line, column + 1, None))
+    return Lowered(''.join(lines), qualified, cast_names)
+
+
+def _replace(lines: list[str], position: tuple[int, int], character: str, shifts: dict[int, int]) -> None:
+    line, column = position
+    column -= shifts.get(line, 0)
+    lines[line - 1] = lines[line - 1][:column] + character + lines[line - 1][column + 1:]
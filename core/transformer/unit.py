@@ -0,0 +1,64 @@
+"""
+In this file, the translation unit of transformer is defined.
+
+A unit is the module tree of lowered source with qualifiers attached
+to the statements they were written before. Passes change the tree in
+place and mark the unit changed, an unchanged unit is emitted as its
+lowered text.
+"""
+import ast
+
+from errors import TransformError
+from core.transformer.syntax import lower, qualifiers as known_qualifiers
+
+
+class TranslationUnit:
+    __slots__ = ("filename", "text", "tree", "qualifiers", "casts", "noexcept", "changed", "config",
+                 "variables")
+
+    def __init__(self, filename: str, text: str, tree: ast.Module, qualifiers: dict[ast.stmt, frozenset[str]]):
+        self.filename = filename
+        self.text = text                # lowered source
+        self.tree = tree
+        self.qualifiers = qualifiers    # qualified statement -> qualifiers
+        self.casts: set[tuple[int, int]] = set()        # positions of cast names, see core/semantic/casts.py
+        self.noexcept: dict[str, ast.FunctionDef] = {}  # noexcept functions of module, see core/semantic/noexcept.py
+        self.changed = False            # tree differs from text
+        self.config = None              # compiler arguments, options of passes are read from it
+        self.variables = None           # build variables of preprocessor, see core/build_vars.py
+
+    @classmethod
+    def parse(cls, source: str, filename: str = "<unit>") -> "TranslationUnit":
+        """ :raise TransformError: source isn't valid Python+ """
+        try:
+            lowered = lower(source)
+            tree = ast.parse(lowered.text, filename)
+        except SyntaxError as e:
+            raise TransformError(f"syntax error: {e.msg}", e.lineno - 1 if e.lineno else None)
+        positions = lowered.qualifiers
+
+        qualifiers = {}
+        if positions:
+            for node in ast.walk(tree):
+                if isinstance(node, ast.stmt):
+                    names = positions.pop((node.lineno, node.col_offset), None)
+                    if names is not None:
+                        qualifiers[node] = names
+                        _check(node, names)
+        if positions:
+            line, _ = min(positions)
+            raise TransformError("qualifier doesn't precede a statement", line - 1)
+        unit = cls(filename, lowered.text, tree, qualifiers)
+        unit.casts = lowered.casts
+        return unit
+
+    def qualified(self, node: ast.stmt, qualifier: str) -> bool:
+        names = self.qualifiers.get(node)
+        return names is not None and qualifier in names
+
+
+def _check(node: ast.stmt, names: frozenset[str]) -> None:
+    for name in sorted(names):
+        types, description = known_qualifiers[name]
+        if not isinstance(node, types):
+            raise TransformError(f"'{name}' qualifies {description} only", node.lineno - 1)
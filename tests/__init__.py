@@ -0,0 +1,13 @@
+"""
+Tests of the Python+ compiler.
+
+    python -m pytest tests
+    python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_path, 'core', 'preprocessor'))
+sys.path.insert(0, os.path.join(root_path, 'core'))
+sys.path.insert(0, root_path)
@@ -0,0 +1,61 @@
+import random
+import unittest
+
+import handlers     # block_index is imported by handlers
+from block_index import BlockIndex
+from source_buffer import SourceBuffer
+
+
+def reference_ends(lines: list[str]) -> dict[int, int]:
+    """ opener -> end, matched by a stack over the whole source """
+    ends, stack = {}, []
+    for i, line in enumerate(lines):
+        if line.startswith("@repeat"):
+            stack.append(i)
+        elif line.startswith("@end") and stack:
+            ends[stack.pop()] = i
+    return ends
+
+
+class BlockIndexTest(unittest.TestCase):
+
+    def check(self, source: SourceBuffer) -> None:
+        lines = list(source)
+        index = BlockIndex.of(source)
+        expected = reference_ends(lines)
+        for i, line in enumerate(lines):
+            if line.startswith("@repeat"):
+                self.assertEqual(index.end_of(i), expected.get(i, -1), f"opener at {i} of {lines}")
+
+    def test_nested(self):
+        source = SourceBuffer(["@repeat 2\n", "a\n", "@repeat 3\n", "b\n", "@end\n", "@end\n", "c\n"])
+        self.assertEqual(BlockIndex.of(source).end_of(0), 5)
+        self.assertEqual(BlockIndex.of(source).end_of(2), 4)
+
+    def test_splices_forward(self):
+        """ splices at a moving position, like the preprocessor makes them """
+        rng = random.Random(7)
+        blocks = ["@repeat 2\n", "x\n", "@repeat 2\n", "y\n", "@end\n", "@end\n"]
+        source = SourceBuffer(blocks * 20)
+        self.check(source)
+        position = 0
+        while position < len(source):
+            if source[position].startswith("@repeat") and rng.random() < 0.5:
+                source[position:position + 1] = ["z\n"] * rng.randint(0, 3)
+            elif rng.random() < 0.2:
+                source[position:position] = rng.choice([["w\n"], blocks])
+            position += 1
+            self.check(source)
+
+    def test_splices_anywhere(self):
+        rng = random.Random(11)
+        source = SourceBuffer((["@repeat 2\n", "x\n", "@end\n"] * 10))
+        for _ in range(50):
+            start = rng.randrange(len(source) + 1)
+            stop = min(len(source), start + rng.randint(0, 2))
+            source[start:stop] = rng.choice([[], ["v\n"], ["@repeat 1\n"], ["@end\n"], ["@repeat 1\n", "@end\n"]])
+            self.check(source)
+
+
+if __name__ == "__main__":
+    unittest.main()
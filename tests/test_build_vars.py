@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+from cli.cfgparse import parse_args
+from core.build_vars import BuildVarsTable
+from errors import RedefinitionWarning
+import processor
+
+
+class ConstRedefinitionTest(unittest.TestCase):
+
+    def test_add_warns(self):
+        table = BuildVarsTable()
+        table.set("X", 1)
+        with self.assertWarns(RedefinitionWarning):
+            table.add(2, "X", ["const"])
+        self.assertEqual(table.value("X"), 2)
+
+    def test_predefined_warns(self):
+        table = BuildVarsTable()
+        with self.assertWarns(RedefinitionWarning):
+            table.add("2", "__VERSION__", ["const"])
+        self.assertEqual(table.value("__VERSION__"), "2")
+
+    def test_setvar_const_after_setvar(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "a.ppy")
+            with open(source, "w") as f:
+                f.write("@setvar X = 1\n@setvar const X = 2\nx = 0\n")
+            args = parse_args(["-i", source, "-E", "-o", os.path.join(directory, "a")])
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                context = processor.process(args)
+            self.assertEqual(context.code, 0, context.diagnostics)
+            self.assertTrue(any(issubclass(w.category, RedefinitionWarning) for w in caught))
+            self.assertEqual(context.vars_table.value("X"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from cli.cfgparse import parse_args
+from include_cache import IncludeCache
+import processor
+
+
+class ContentHashTest(unittest.TestCase):
+    """ a cache shared by units, like the one of compile server """
+
+    def compile(self, directory: str, cache: IncludeCache, *flags: str) -> str:
+        source = os.path.join(directory, "a.ppy")
+        output = os.path.join(directory, "a")
+        context = processor.process(parse_args(["-i", source, "-E", "-o", output, *flags]), cache)
+        self.assertEqual(context.code, 0, context.diagnostics)
+        with open(output + ".i") as f:
+            return f.read()
+
+    def edit_keeping_stamp(self, path: str, text: str) -> None:
+        """ replaces file like editors do, cached lines still map the old one """
+        stat = os.stat(path)
+        with open(path + ".new", "w") as f:
+            f.write(text)
+        os.utime(path + ".new", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(path + ".new", path)
+
+    def run_edit(self, *flags: str) -> tuple[str, str]:
+        with tempfile.TemporaryDirectory() as directory:
+            header = os.path.join(directory, "h.ppy")
+            with open(header, "w") as f:
+                f.write("x = 1\n")
+            with open(os.path.join(directory, "a.ppy"), "w") as f:
+                f.write('@include "h.ppy"\n')
+            cache = IncludeCache()
+            previous = os.getcwd()
+            os.chdir(directory)     # included files are relative to working directory
+            try:
+                first = self.compile(directory, cache, *flags)
+                self.edit_keeping_stamp(header, "x = 2\n")
+                return first, self.compile(directory, cache, *flags)
+            finally:
+                os.chdir(previous)
+
+    def test_stamp_only(self):
+        self.assertEqual(self.run_edit(), ("x = 1\n", "x = 1\n"))
+
+    def test_content_hash(self):
+        self.assertEqual(self.run_edit("--include-hash"), ("x = 1\n", "x = 2\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
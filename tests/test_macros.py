@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+from cli.cfgparse import parse_args
+from macro_processor import MacrosTable
+import processor
+
+
+class StringsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.macros = MacrosTable(["FOO=7"])
+
+    def test_triple_quoted_string(self):
+        self.assertEqual(self.macros.expand('a = """He said "FOO" here"""\n'), 'a = """He said "FOO" here"""\n')
+        self.assertEqual(self.macros.expand("a = '''FOO''' + FOO\n"), "a = '''FOO''' + 7\n")
+
+    def test_open_string(self):
+        self.assertEqual(self.macros.expand('a = """FOO\n'), 'a = """FOO\n')
+        self.assertEqual(self.macros.expand('FOO\n', '"""'), 'FOO\n')
+        self.assertEqual(self.macros.expand('FOO""" + FOO\n', '"""'), 'FOO""" + 7\n')
+
+    def test_docstring(self):
+        text = 'def f():\n    """\n    FOO\n    """\n    return FOO\n'
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "a.ppy")
+            with open(source, "w") as f:
+                f.write(text)
+            for mode in ([], ["--stream"]):
+                output = os.path.join(directory, "a")
+                context = processor.process(parse_args(["-i", source, "-E", "-o", output, "-D", "FOO=7"] + mode))
+                self.assertEqual(context.code, 0, context.diagnostics)
+                with open(output + ".i") as f:
+                    self.assertEqual(f.read(), text.replace("return FOO", "return 7"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks import startup
+
+
+class StartupTest(unittest.TestCase):
+    """ time budget is checked by benchmarks/startup.py, times of test runs are too noisy """
+
+    def test_lazy_modules(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "startup.ppy")
+            with open(source, "w") as f:
+                f.write("x = 1\n")
+            _, imported = startup.measure(source, os.path.join(directory, "out"))
+        self.assertEqual([m for m in startup.lazy_modules if m in imported], [])
+
+
+if __name__ == "__main__":
+    unittest.main()